@@ -0,0 +1,89 @@
+"""Vertical alignment of consecutive frames to reduce visible jitter."""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
+
+from PIL import Image
+
+# OpenCV and NumPy are imported on first use to keep startup fast.
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class FrameAligner:
+    """Estimate and undo the vertical offset between consecutive frames.
+
+    The bottom ``strip_rows`` of the previous aligned frame are searched for
+    within the top of the current frame, within ``max_offset`` rows either
+    way. Only that grayscale strip is kept between frames, and both strip and
+    search window are shrunk to ``match_width`` columns before matching, so
+    the cost does not grow with the frame width.
+
+    The best match is only trusted when the matched rows differ from the
+    previous strip by at most ``threshold`` on average (mean absolute
+    difference, 0-255), which it does not after a scene change or when the
+    frame holds nothing to lock on to; the frame is then left as it is. The
+    residual does not depend on the size of the shift. A threshold of 0
+    trusts every match. :attr:`residual` holds the last frame's value.
+    """
+
+    def __init__(self, threshold: float = 6, max_offset: int = 10, strip_rows: int = 80, match_width: int = 160):
+        self.threshold = threshold
+        self.max_offset = max_offset
+        self.strip_rows = strip_rows
+        self.match_width = match_width
+        self.offset = 0
+        self.residual = 0.0
+        self._prev: Optional[np.ndarray] = None
+        self._size: Optional[tuple[int, int]] = None
+
+    def reset(self) -> None:
+        self._prev = None
+        self._size = None
+        self.offset = 0
+        self.residual = 0.0
+
+    def _strip(self, img: Image.Image, top: int, bottom: int) -> np.ndarray:
+        """Grayscale rows ``top:bottom`` of ``img`` shrunk to the match width.
+
+        Rows outside the image read as black, like the shifted frame.
+        """
+        import cv2
+        import numpy as np
+
+        gray = np.asarray(img.crop((0, top, img.width, bottom)).convert("L"))
+        width = min(self.match_width, img.width)
+        if width != img.width:
+            gray = cv2.resize(gray, (width, bottom - top), interpolation=cv2.INTER_AREA)
+        return gray
+
+    def align(self, img: Image.Image) -> tuple[Image.Image, int]:
+        """Return ``img`` shifted to line up with the previous frame, and the offset."""
+        import cv2
+
+        width, height = img.size
+        rows = min(self.strip_rows, height)
+        if self._prev is None or self._size != img.size:
+            self._size = img.size
+            self._prev = self._strip(img, height - rows, height)
+            self.offset = 0
+            return img, 0
+
+        offset = 0
+        search = self._strip(img, 0, min(height, rows + self.max_offset * 2))
+        if search.shape[0] >= rows:
+            res = cv2.matchTemplate(search, self._prev, cv2.TM_CCORR_NORMED)
+            _, _, _, max_loc = cv2.minMaxLoc(res)
+            y = max_loc[1]
+            self.residual = cv2.norm(search[y:y + rows], self._prev, cv2.NORM_L1) / self._prev.size
+            if not self.threshold or self.residual <= self.threshold:
+                offset = y - self.max_offset
+        self.offset = offset
+        if offset == 0:
+            self._prev = self._strip(img, height - rows, height)
+            return img, 0
+        # One cropped copy; rows shifted in from outside the frame are black.
+        aligned = img.crop((0, offset, width, height + offset))
+        aligned.info.update(img.info)
+        self._prev = self._strip(img, height - rows + offset, height + offset)
+        return aligned, offset
@@ -0,0 +1,213 @@
+from collections import deque
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+MAX_DATAGRAM = 65535
+
+
+class FramePool:
+    """Reusable frame buffers with a bounded footprint.
+
+    Buffers start at ``size`` bytes and grow on demand for larger frames.
+    Once the frames get small again, :meth:`trim` hands an oversized buffer
+    back to the allocator before it is reused, so one huge or runaway frame
+    does not pin its memory for the rest of the session. :attr:`high_water`
+    is the largest frame seen and :attr:`peak` the most memory held at once.
+    """
+
+    # Number of recent frame sizes a buffer is trimmed to fit.
+    HISTORY = 64
+
+    def __init__(self, count: int, size: int):
+        self.size = size
+        self.buffers = [bytearray(size) for _ in range(count)]
+        self.high_water = 0
+        self.peak = self.allocated
+        self.grown = 0
+        self.trimmed = 0
+        self._recent: deque[int] = deque(maxlen=self.HISTORY)
+
+    @property
+    def allocated(self) -> int:
+        return sum(len(buf) for buf in self.buffers)
+
+    def grow(self, index: int, size: int, in_place: bool) -> bytearray:
+        """Return buffer ``index`` with room for ``size`` bytes.
+
+        With ``in_place`` the existing buffer is extended, keeping its
+        contents, unless a consumer still holds a view of it; otherwise a new
+        empty buffer replaces it.
+        """
+        buf = self.buffers[index]
+        if in_place:
+            try:
+                buf.extend(bytes(size - len(buf)))
+            except BufferError:
+                in_place = False
+        if not in_place:
+            buf = self.buffers[index] = bytearray(size)
+        self.grown += 1
+        self.peak = max(self.peak, self.allocated)
+        return buf
+
+    def record(self, nbytes: int) -> None:
+        """Note the size of a completed frame."""
+        self.high_water = max(self.high_water, nbytes)
+        self._recent.append(nbytes)
+
+    def trim(self, index: int) -> None:
+        """Shrink buffer ``index`` if it is far larger than recent frames."""
+        buf = self.buffers[index]
+        if len(buf) <= self.size:
+            return
+        want = self.size
+        while want < 2 * max(self._recent, default=0):
+            want *= 2
+        if len(buf) > 2 * want:
+            # Views of the old buffer keep it alive until they are released.
+            self.buffers[index] = bytearray(want)
+            self.trimmed += 1
+
+
+class FrameAssembler:
+    """Reassemble JPEG frames from camera datagrams without rescanning.
+
+    Payloads are copied once into a ring of preallocated slots, one frame per
+    slot. Packets that start with SOI or end with EOI mark frame boundaries
+    directly; otherwise only the newly added bytes are searched, so the cost
+    per packet is proportional to the packet and not to the frame.
+
+    Completed frames are queued on :attr:`ready` as memoryviews into their
+    slot. A view stays valid until ``slots - 1`` further frames have been
+    assembled, after which its slot is reused. :attr:`dropped` counts frames
+    abandoned before completion or overwritten before they were claimed.
+
+    Memory stays bounded even when no EOI ever arrives: a frame growing past
+    ``max_frame_size`` is dropped (counted in :attr:`oversized` too) and
+    assembly resumes at the next SOI. The slots come from a
+    :class:`FramePool`, which also releases slots grown for outliers.
+    """
+
+    def __init__(
+        self,
+        header_bytes: int = 0,
+        max_frame_size: int = 8 * 1024 * 1024,
+        slots: int = 4,
+        slot_size: int = 256 * 1024,
+    ):
+        self.header_bytes = header_bytes
+        self.max_frame_size = max_frame_size
+        self.pool = FramePool(max(slots, 2), min(slot_size, max_frame_size))
+        self._slots = self.pool.buffers
+        self._index = 0
+        self._start = -1
+        self._end = 0
+        self._scan = 0
+        self.dropped = 0
+        self.oversized = 0
+        # Missing packets can only be counted from sequence numbers, see
+        # protocol.SequencedAssembler.
+        self.lost = 0
+        self.ready: deque[memoryview] = deque()
+
+    def reset(self) -> None:
+        """Forget any partial frame and pending output."""
+        self.ready.clear()
+        self._start = -1
+        self._end = 0
+        self._scan = 0
+
+    def feed(self, packet) -> None:
+        """Add one datagram, stripping the camera header first."""
+        payload = memoryview(packet)[self.header_bytes:]
+        if len(payload):
+            self._append(payload)
+
+    def _append(self, payload: memoryview) -> None:
+        n = len(payload)
+        pos = self._end
+        slot = self._slots[self._index]
+        if pos + n > len(slot):
+            slot = self._grow(pos + n)
+            pos = self._end
+        slot[pos:pos + n] = payload
+        end = self._end = pos + n
+
+        if slot.startswith(SOI, pos):
+            # A packet opening with SOI starts a new frame; anything still
+            # pending before it was an incomplete frame and is abandoned.
+            if self._start >= 0:
+                self.dropped += 1
+            self._start = pos
+            self._scan = pos + 2
+        elif self._start < 0:
+            # The SOI may straddle the packet boundary, so the byte kept from
+            # the previous packet is searched too.
+            soi = slot.find(SOI, max(pos - 1, 0), end)
+            if soi < 0:
+                # Keep a trailing 0xff in case the next packet opens with 0xd8.
+                if slot[end - 1] == 0xFF:
+                    slot[0] = 0xFF
+                    self._end = 1
+                else:
+                    self._end = 0
+                return
+            self._start = soi
+            self._scan = soi + 2
+
+        if end - 2 >= self._scan and slot.startswith(EOI, end - 2):
+            eoi = end - 2
+        else:
+            eoi = slot.find(EOI, max(self._scan - 1, self._start + 2), end)
+            if eoi < 0:
+                self._scan = end
+                return
+        self._complete(eoi + 2)
+
+    def _complete(self, stop: int) -> None:
+        slot = self._slots[self._index]
+        if len(self.ready) >= len(self._slots) - 1:
+            # The oldest unclaimed frame is about to be overwritten.
+            self.ready.popleft()
+            self.dropped += 1
+        self.ready.append(memoryview(slot)[self._start:stop])
+        self.pool.record(stop - self._start)
+        leftover = bytes(slot[stop:self._end]) if stop < self._end else b""
+        self._index = (self._index + 1) % len(self._slots)
+        self.pool.trim(self._index)
+        self._start = -1
+        self._end = 0
+        self._scan = 0
+        if leftover:
+            self._append(memoryview(leftover))
+
+    def _grow(self, needed: int) -> bytearray:
+        """Make room for ``needed`` bytes, dropping the frame if it is too big."""
+        old = self._slots[self._index]
+        incoming = needed - self._end
+        # Without an open frame only the byte kept for a split SOI is worth keeping.
+        start = self._start if self._start >= 0 else 0
+        keep = self._end - start
+        if keep + incoming > self.max_frame_size:
+            # No EOI within the cap: drop the frame and resync at the next SOI.
+            if self._start >= 0:
+                self.dropped += 1
+                self.oversized += 1
+            keep = 0
+            self._start = -1
+        required = keep + incoming
+        slot = old
+        if required > len(old):
+            size = len(old)
+            while size < required:
+                size *= 2
+            size = min(size, self.max_frame_size + MAX_DATAGRAM)
+            # Extending keeps the data in place when the frame starts at 0.
+            slot = self.pool.grow(self._index, size, in_place=not start)
+        if keep and (slot is not old or start):
+            slot[:keep] = old[start:start + keep]
+        if self._start >= 0:
+            self._scan -= self._start
+            self._start = 0
+        self._end = keep
+        return slot
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Optional
+
+from PIL import Image
+
+from config import StreamConfig
+from streamer import KEEPALIVE_AUDIO, KEEPALIVE_VIDEO, CameraStreamer, FrameProcessor
+
+# A keepalive interval of 0 makes the threaded backend send continuously; on
+# the event loop it is clamped so one camera cannot monopolise the loop.
+MIN_KEEPALIVE_INTERVAL = 0.1
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def shared_loop() -> asyncio.AbstractEventLoop:
+    """Return the event loop shared by all streamers, starting it if needed."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="camera-loop", daemon=True).start()
+        return _loop
+
+
+class _VideoProtocol(asyncio.DatagramProtocol):
+    def __init__(self, streamer: "AsyncCameraStreamer", source: Optional[str]):
+        self.streamer = streamer
+        self.source = source
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if self.source is None or addr[0] == self.source:
+            self.streamer._handle_packet(data)
+
+    def error_received(self, exc: Exception) -> None:
+        # Typically ICMP port unreachable while the camera is not up yet.
+        logging.debug("Video socket error: %s", exc)
+
+
+class AsyncCameraStreamer(CameraStreamer):
+    """Camera session driven by an asyncio event loop instead of threads.
+
+    Every instance shares one loop (see :func:`shared_loop`) unless ``loop``
+    is given, so any number of cameras run on a single thread plus their
+    decode pools. ``start``/``stop``/``frame_callback`` behave like
+    :class:`CameraStreamer`; code already running on the loop can use
+    :meth:`open`, :meth:`close` and iterate :meth:`frames` instead.
+    """
+
+    def __init__(
+        self,
+        config: StreamConfig,
+        processor: FrameProcessor,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        super().__init__(config, processor)
+        self.loop = loop
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self._keepalive_handle: Optional[asyncio.TimerHandle] = None
+        self._frames: Optional[asyncio.Queue] = None
+        self._held: deque[tuple[float, Image.Image]] = deque()
+        self._held_handle: Optional[asyncio.TimerHandle] = None
+
+    def start(self, callback: Callable[[Image.Image], None]):
+        if self.running:
+            return
+        if self.loop is None:
+            self.loop = shared_loop()
+        asyncio.run_coroutine_threadsafe(self.open(callback), self.loop).result()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+
+    async def open(self, callback: Optional[Callable[[Image.Image], None]] = None) -> None:
+        """Open the video socket on the running loop and start keepalives."""
+        if self.running:
+            return
+        logging.debug("Starting async streamer for %s", self.config.cam_ip)
+        self.loop = asyncio.get_running_loop()
+        self.frame_callback = callback
+        self.sock, source = self._open_socket()
+        await self._connect(self.sock, source)
+        self._frames = asyncio.Queue(maxsize=2)
+        self.current_packet_count = 0
+        self.last_packet_count = 0
+        self.running = True
+        self._start_decoders()
+        self._send_keepalive()
+
+    async def _connect(self, sock: socket.socket, source: Optional[str]) -> None:
+        sock.setblocking(False)
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: _VideoProtocol(self, source), sock=sock
+        )
+
+    def _schedule_pending(self) -> None:
+        # Packets are handled on the loop, so changes are applied there too.
+        self.loop.call_soon_threadsafe(self._apply_pending)
+
+    def _rebind(self) -> None:
+        old = self.sock
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+        if old is not None:
+            # The transport closes its socket only on the next loop pass;
+            # free the port now in case the new socket wants it.
+            old.close()
+        # The new socket is in place at once, so keepalives carry on.
+        self.sock, source = self._open_socket()
+        task = self.loop.create_task(self._connect(self.sock, source))
+        task.add_done_callback(self._connected)
+
+    def _connected(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            logging.info("Video socket reopened on port %d", self.transport.get_extra_info("sockname")[1])
+            return
+        logging.error("Reopening the video socket failed", exc_info=task.exception())
+        # Stop rather than sit silently without a socket.
+        self.loop.create_task(self.close())
+
+    async def close(self) -> None:
+        logging.debug("Stopping async streamer for %s", self.config.cam_ip)
+        self.running = False
+        if self._keepalive_handle:
+            self._keepalive_handle.cancel()
+            self._keepalive_handle = None
+        if self._held_handle:
+            self._held_handle.cancel()
+            self._held_handle = None
+        self._held.clear()
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+        self.sock = None
+        self._stop_decoders()
+        self.assembler.reset()
+        self.pacer.reset()
+        self.current_packet_count = 0
+        self.last_packet_count = 0
+        if self._frames:
+            # Wake up any consumer blocked in frames().
+            if self._frames.full():
+                self._frames.get_nowait()
+            self._frames.put_nowait(None)
+
+    async def frames(self) -> AsyncIterator[Image.Image]:
+        """Yield processed frames until the streamer is closed."""
+        while self._frames is not None:
+            img = await self._frames.get()
+            if img is None:
+                return
+            yield img
+
+    def _send_keepalive(self):
+        if not self.running:
+            return
+        # The transport ignores the address on a connected socket, so the
+        # keepalives go through the raw non-blocking socket instead.
+        sock = self.sock
+        try:
+            if sock is not None:
+                sock.sendto(KEEPALIVE_AUDIO, (self.config.cam_ip, self.config.cam_audio_port))
+                sock.sendto(KEEPALIVE_VIDEO, (self.config.cam_ip, self.config.cam_video_port))
+        except (BlockingIOError, ConnectionRefusedError):
+            pass
+        except Exception:
+            logging.exception("Keepalive failed")
+        interval = max(self.config.keepalive_interval, MIN_KEEPALIVE_INTERVAL)
+        self._keepalive_handle = self.loop.call_later(interval, self._send_keepalive)
+
+    def _deliver(self, img: Image.Image) -> None:
+        # Decode workers finish on their own threads; hop back onto the loop.
+        self.loop.call_soon_threadsafe(self._publish, img)
+
+    def _publish(self, img: Image.Image) -> None:
+        if not self.running:
+            return
+        if self.pacer.jitter_delay:
+            # Hold frames in order and play them out from a loop timer.
+            now = time.monotonic()
+            self._held.append((self.pacer.release_time(img.info.get("timestamp", now), now), img))
+            if self._held_handle is None:
+                self._release_held()
+            return
+        self._emit(img)
+
+    def _release_held(self) -> None:
+        self._held_handle = None
+        now = time.monotonic()
+        while self._held and self._held[0][0] <= now:
+            self._emit(self._held.popleft()[1])
+        if self._held and self.running:
+            self._held_handle = self.loop.call_later(self._held[0][0] - now, self._release_held)
+
+    def _emit(self, img: Image.Image) -> None:
+        if not self.running:
+            return
+        self.metrics.mark(img.info.get("trace"), "queued")
+        if self._frames.full():
+            self._frames.get_nowait()
+            logging.debug("Frame queue full, dropping frame")
+            if self.frame_callback is None:
+                # Otherwise the frame still reached the callback.
+                self.metrics.drop("queue_full")
+        self._frames.put_nowait(img)
+        if self.frame_callback:
+            try:
+                self.frame_callback(img)
+            except Exception:
+                logging.exception("Frame callback failed")
+
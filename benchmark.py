@@ -0,0 +1,275 @@
+"""Reproducible benchmarks for the receive, decode and display pipeline.
+
+Frames come from a capture (``--pcap``) or a synthetic test pattern and are
+replayed through :mod:`replay`, so the numbers can be compared between
+changes on any Linux box without a camera::
+
+    python benchmark.py --frames 300 --size 1280x720
+    python benchmark.py --pcap capture.pcap --speed 1 --json results.jsonl
+    python benchmark.py --only startup --startup-budget 150
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+import numpy as np
+
+from alignment import FrameAligner
+from config import StreamConfig
+from replay import MemorySocket, Replayer, add_source_arguments, load_packets
+from streamer import CameraStreamer, FrameProcessor
+
+BENCHMARKS = ("startup", "extract", "decode", "process", "align", "pipeline")
+# Entry points timed by the startup benchmark, and the heavy modules that
+# must not be imported until a feature needs them.
+STARTUP_MODULES = ("gui", "headless")
+DEFERRED_MODULES = ("cv2", "numpy", "asyncio", "multiprocessing", "config_dialog")
+
+
+def measure(name: str, func: Callable[[], object], calls: int) -> dict:
+    """Time ``calls`` invocations of ``func``, then count its allocations."""
+    durations = np.empty(calls)
+    cpu = time.process_time()
+    for i in range(calls):
+        start = time.perf_counter()
+        func()
+        durations[i] = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    # Tracing slows every allocation down, so it gets a separate pass.
+    sample = min(calls, 20)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(sample):
+        func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "name": name,
+        "calls": calls,
+        "per_s": calls / durations.sum() if durations.sum() else 0.0,
+        "mean_ms": durations.mean() * 1000,
+        "p50_ms": np.percentile(durations, 50) * 1000,
+        "p99_ms": np.percentile(durations, 99) * 1000,
+        "cpu_ms": cpu / calls * 1000,
+        "retained_kib": (current - before) / sample / 1024,
+        "peak_kib": (peak - before) / 1024,
+    }
+
+
+def bench_startup(module: str, budget_ms: float, runs: int = 5) -> dict:
+    """Import time of an entry point from ``python -X importtime``, best of ``runs``."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    check = "import sys; print(','.join(m for m in %r if m in sys.modules))" % (DEFERRED_MODULES,)
+    best, slowest, eager = None, [], ""
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}; {check}"],
+            cwd=here,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        modules = []
+        total = 0.0
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules.append((int(self_us) / 1000, name.strip()))
+            if name.strip() == module:
+                total = int(cumulative_us) / 1000
+        if best is None or total < best:
+            best, eager = total, proc.stdout.strip()
+            slowest = sorted(modules, reverse=True)[:5]
+    return {
+        "name": f"startup:{module}",
+        "import_ms": best,
+        "budget_ms": budget_ms,
+        "over_budget": bool(budget_ms and best > budget_ms),
+        "eager": eager,
+        "slowest": {name: round(ms, 1) for ms, name in slowest},
+    }
+
+
+def bench_extract(config: StreamConfig, packets: list) -> dict:
+    """Reassembly and frame extraction per datagram, without decoding."""
+    streamer = CameraStreamer(config, FrameProcessor())
+    streamer._submit = lambda *args: None
+    payloads = [data for _, data in packets]
+    index = 0
+
+    def step() -> None:
+        nonlocal index
+        streamer._handle_packet(payloads[index % len(payloads)])
+        index += 1
+
+    result = measure("extract", step, len(payloads))
+    result["frames"] = streamer.metrics.frames
+    return result
+
+
+def _jpegs(packets: list, header_bytes: int) -> list[bytes]:
+    streamer = CameraStreamer(StreamConfig(header_bytes=header_bytes), FrameProcessor())
+    frames = []
+    for _, data in packets:
+        streamer.assembler.feed(data)
+        while streamer.assembler.ready:
+            frames.append(bytes(streamer.assembler.ready.popleft()))
+    return frames
+
+
+def bench_decode(processor: FrameProcessor, jpegs: list[bytes]) -> dict:
+    index = 0
+
+    def step() -> None:
+        nonlocal index
+        processor.decode(jpegs[index % len(jpegs)]).load()
+        index += 1
+
+    return measure("decode", step, len(jpegs))
+
+
+def bench_process(processor: FrameProcessor, jpegs: list[bytes]) -> dict:
+    images = []
+    for data in jpegs[:50]:
+        img = processor.decode(data)
+        img.load()
+        images.append(img)
+    index = 0
+
+    def step() -> None:
+        nonlocal index
+        processor.process(images[index % len(images)])
+        index += 1
+
+    return measure("process", step, len(jpegs))
+
+
+def bench_align(config: StreamConfig, processor: FrameProcessor, jpegs: list[bytes]) -> dict:
+    frames = [processor.process(processor.decode(data)) for data in jpegs[:50]]
+    aligner = FrameAligner(config.alignment_threshold)
+    index = 0
+
+    def step() -> None:
+        nonlocal index
+        aligner.align(frames[index % len(frames)])
+        index += 1
+
+    return measure("align", step, len(jpegs))
+
+
+def bench_pipeline(config: StreamConfig, processor: FrameProcessor, packets: list, speed: float) -> dict:
+    """Replay through a running streamer and report its own metrics."""
+    mem = MemorySocket()
+    streamer = CameraStreamer(config, processor)
+    streamer.socket_factory = mem.factory
+    delivered = 0
+
+    def on_frame(_img) -> None:
+        nonlocal delivered
+        delivered += 1
+
+    streamer.start(on_frame)
+    replayer = Replayer(packets, speed)
+    wall, cpu = time.monotonic(), time.process_time()
+    replayer.play(mem.inject)
+    # Let the decoders finish the tail of the stream.
+    deadline = time.monotonic() + 2.0
+    while streamer.metrics.packets < replayer.sent and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    wall, cpu = time.monotonic() - wall, time.process_time() - cpu
+    streamer.stop()
+    mem.close()
+    snap = streamer.metrics.snapshot()
+    stages = snap["stages"]
+    return {
+        "name": "pipeline",
+        "seconds": wall,
+        "packets_per_s": snap["packets"] / wall,
+        "frames_per_s": snap["frames"] / wall,
+        "delivered_per_s": delivered / wall,
+        "cpu_percent": cpu / wall * 100,
+        "decode_p50_ms": stages.get("decoded", {}).get("stage_ms", {}).get("p50"),
+        "process_p50_ms": stages.get("processed", {}).get("stage_ms", {}).get("p50"),
+        "latency_p99_ms": stages.get("queued", {}).get("total_ms", {}).get("p99"),
+        "dropped": snap["dropped"],
+    }
+
+
+def _format(result: dict) -> str:
+    parts = [f"{result['name']:<9}"]
+    for key, value in result.items():
+        if key == "name":
+            continue
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        elif isinstance(value, dict):
+            value = ",".join(f"{k}={v}" for k, v in value.items() if v)
+        parts.append(f"{key}={value}")
+    return " ".join(parts)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the camera pipeline")
+    add_source_arguments(parser)
+    parser.add_argument("--config", help="config file for processing and decode settings")
+    parser.add_argument("--speed", type=float, default=0.0, help="pipeline replay speed, 0 = as fast as possible")
+    parser.add_argument("--only", help="comma separated subset of " + ",".join(BENCHMARKS))
+    parser.add_argument("--json", metavar="PATH", help="append the results as one JSON line")
+    parser.add_argument("--startup-budget", type=float, default=0.0, help="fail if an entry point imports slower (ms)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+
+    config = StreamConfig.load(args.config) if args.config else StreamConfig()
+    if not args.pcap:
+        config.header_bytes = args.header_bytes
+    config.keepalive_interval = max(config.keepalive_interval, 1.0)
+    processor = FrameProcessor()
+    processor.apply_config(config)
+    packets = load_packets(args)
+    jpegs = _jpegs(packets, config.header_bytes)
+    if not jpegs:
+        logging.error("No JPEG frames found; check --header-bytes and --camera-port")
+        return 1
+    selected = args.only.split(",") if args.only else BENCHMARKS
+
+    results = []
+    failed = False
+    for name in selected:
+        if name == "startup":
+            for module in STARTUP_MODULES:
+                result = bench_startup(module, args.startup_budget)
+                failed |= result["over_budget"] or bool(result["eager"])
+                print(_format(result))
+                results.append(result)
+            continue
+        if name == "extract":
+            result = bench_extract(config, packets)
+        elif name == "decode":
+            result = bench_decode(processor, jpegs)
+        elif name == "process":
+            result = bench_process(processor, jpegs)
+        elif name == "align":
+            result = bench_align(config, processor, jpegs)
+        elif name == "pipeline":
+            result = bench_pipeline(config, processor, packets, args.speed)
+        else:
+            parser.error(f"unknown benchmark {name!r}")
+        if result:
+            print(_format(result))
+            results.append(result)
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps({"time": time.time(), "frames": len(jpegs), "results": results}) + "\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
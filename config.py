@@ -16,10 +16,85 @@ class StreamConfig:
     # and keepalive is disabled initially.
     frame_buffer_size: int = 8 * 1024 * 1024
     header_bytes: int = 24
+    # Longest a decoded frame is held back (ms) to even out arrival jitter.
     jitter_delay: int = 0
     packets_per_frame: int = 1
+    # Byte offsets of the packet sequence number and frame id in the camera
+    # header (-1 = unknown). The layout is not documented; find them in a
+    # capture with protocol.py. With a sequence number, packets are put in
+    # order, incomplete frames are discarded before decoding and Packets per
+    # Frame is not needed.
+    seq_offset: int = -1
+    seq_bytes: int = 2
+    frame_id_offset: int = -1
+    frame_id_bytes: int = 2
+    header_byteorder: str = "little"
+    # Frames beyond this rate are dropped before decoding (0 = no limit).
+    target_fps: float = 0.0
     keepalive_interval: float = 0.0
-    alignment_threshold: int = 20
+    # JPEG decoding runs on a pool of workers so the receive thread only has
+    # to drain the socket. Use 0 to decode inline, "process" for a process pool.
+    decode_workers: int = 2
+    decode_backend: str = "thread"
+    # Kernel receive buffer for the video socket, independent of the frame
+    # size. Datagrams are read in batches ("auto", "recvmmsg", "drain" or
+    # "single") from a socket connected to the camera so the kernel filters
+    # out other senders.
+    recv_buffer_size: int = 4 * 1024 * 1024
+    recv_mode: str = "auto"
+    recv_batch: int = 32
+    # Size of each datagram buffer. The default fits any UDP datagram; a
+    # smaller value saves memory (it is multiplied by recv_batch) but the
+    # first datagram larger than it is lost before the buffers grow to fit.
+    datagram_size: int = 65535
+    connect_camera: bool = True
+    # "thread" runs one receiver per camera on its own threads, "asyncio"
+    # shares a single event loop between all cameras in the process.
+    backend: str = "thread"
+    # "encode" records the processed preview frames with XVID; "passthrough"
+    # muxes the camera's JPEG frames into MKV with no decode or encode.
+    record_mode: str = "encode"
+    # Encode recordings at the camera resolution instead of the display size.
+    # Costs a second orientation and colour pass over the full frame on every
+    # decoded frame while recording; the preview keeps its own smaller pass.
+    record_full_resolution: bool = False
+    # Start a new recording file after this many seconds (0 = single file).
+    record_segment_seconds: float = 0.0
+    # Record into this directory as a store of indexed segments of
+    # store_segment_seconds each instead of single files (empty = off),
+    # deleting segments older than the retention or beyond the total size
+    # (0 = keep everything); see store.py.
+    store_dir: str = ""
+    store_segment_seconds: float = 60.0
+    store_retention_hours: float = 0.0
+    store_max_gb: float = 0.0
+    # Keep the raw camera frames of the last this many seconds in memory, at
+    # most history_bytes of them (0 = off). Recordings start with them, and
+    # recent frames can be saved as a clip or snapshot.
+    history_seconds: float = 10.0
+    history_bytes: int = 32 * 1024 * 1024
+    # Overlay frame rate, stage latencies and drops on the preview, and
+    # append a metrics snapshot per second to this JSON lines file if set.
+    show_metrics: bool = False
+    metrics_path: str = ""
+    # Publish frames to a shared-memory bus of this name for other processes
+    # (empty = off); see framebus.py.
+    frame_bus: str = ""
+    # Serve the camera's JPEG frames as MJPEG over HTTP on this port to any
+    # number of local viewers (0 = off); see relay.py.
+    relay_port: int = 0
+    relay_host: str = "127.0.0.1"
+    # Largest mean difference (0-255) between the previous frame's bottom rows
+    # and their best match in the new frame for the alignment shift to be
+    # applied. A true match stays around 1-2 after JPEG compression, a false
+    # one on a changed or featureless scene is well above 10 (0 = always apply).
+    alignment_threshold: int = 6
+    # Record and take snapshots only while at least this percentage of a
+    # downscaled frame changes (0 = record everything), keeping pre- and
+    # post-roll seconds around each motion event.
+    motion_threshold: float = 0.0
+    motion_pre_roll: float = 2.0
+    motion_post_roll: float = 5.0
     display_width: int = 640
     display_height: int = 480
     brightness: float = 1.0
@@ -4,10 +4,25 @@ from typing import Callable, Dict, Any
 
 from config import StreamConfig
 
+# Colour settings shown as sliders, with their range, previewed while dragged.
+SLIDERS = {
+    "brightness": (0.0, 3.0),
+    "contrast": (0.0, 3.0),
+    "saturation": (0.0, 3.0),
+    "hue": (-0.5, 0.5),
+    "gamma": (0.1, 3.0),
+}
+
 class ConfigDialog(tk.Toplevel):
     """Dialog window for editing StreamConfig."""
 
-    def __init__(self, master: tk.Misc, config: StreamConfig, on_save: Callable[[], None] | None = None) -> None:
+    def __init__(
+        self,
+        master: tk.Misc,
+        config: StreamConfig,
+        on_save: Callable[[], None] | None = None,
+        on_preview: Callable[[str, float], None] | None = None,
+    ) -> None:
         super().__init__(master)
         self.title("Settings")
         self.resizable(False, False)
@@ -16,31 +31,72 @@ class ConfigDialog(tk.Toplevel):
 
         self._config = config
         self._on_save = on_save
+        # Called with a colour setting and its slider value while it changes.
+        self._on_preview = on_preview
         self._vars: Dict[str, Any] = {}
         self._build()
+        self.protocol("WM_DELETE_WINDOW", self._cancel)
 
     def _build(self) -> None:
-        """Construct the configuration notebook with stream and video tabs."""
+        """Construct the configuration notebook, one tab per group of settings."""
         nb = ttk.Notebook(self)
         nb.pack(padx=10, pady=10, fill="both", expand=True)
 
-        stream_frame = ttk.Frame(nb)
-        video_frame = ttk.Frame(nb)
-        nb.add(stream_frame, text="Stream")
-        nb.add(video_frame, text="Video")
-
         stream_fields = [
             ("Camera IP", "cam_ip"),
             ("Cam Video Port", "cam_video_port"),
             ("Cam Audio Port", "cam_audio_port"),
             ("Client Video Port", "client_video_port"),
             ("Client Audio Port", "client_audio_port"),
+            ("Keepalive Interval", "keepalive_interval"),
+            ("Backend", "backend"),
+            ("Jitter Delay", "jitter_delay"),
+            ("Target FPS", "target_fps"),
+            ("Decode Workers", "decode_workers"),
+            ("Decode Backend", "decode_backend"),
+            ("Alignment Threshold", "alignment_threshold"),
+        ]
+
+        network_fields = [
             ("Frame Buffer", "frame_buffer_size"),
             ("Header Bytes", "header_bytes"),
-            ("Jitter Delay", "jitter_delay"),
             ("Packets per Frame", "packets_per_frame"),
-            ("Keepalive Interval", "keepalive_interval"),
-            ("Alignment Threshold", "alignment_threshold"),
+            ("Sequence Offset", "seq_offset"),
+            ("Sequence Bytes", "seq_bytes"),
+            ("Frame ID Offset", "frame_id_offset"),
+            ("Frame ID Bytes", "frame_id_bytes"),
+            ("Header Byte Order", "header_byteorder"),
+            ("Receive Buffer", "recv_buffer_size"),
+            ("Receive Mode", "recv_mode"),
+            ("Receive Batch", "recv_batch"),
+            ("Datagram Size", "datagram_size"),
+            ("Connect to Camera", "connect_camera"),
+        ]
+
+        recording_fields = [
+            ("Record Mode", "record_mode"),
+            ("Record Full Resolution", "record_full_resolution"),
+            ("Record Segment (s)", "record_segment_seconds"),
+            ("Store Directory", "store_dir"),
+            ("Store Segment (s)", "store_segment_seconds"),
+            ("Store Retention (h)", "store_retention_hours"),
+            ("Store Max Size (GB)", "store_max_gb"),
+            ("History (s)", "history_seconds"),
+            ("History Bytes", "history_bytes"),
+        ]
+
+        motion_fields = [
+            ("Motion Threshold (%)", "motion_threshold"),
+            ("Motion Pre-roll (s)", "motion_pre_roll"),
+            ("Motion Post-roll (s)", "motion_post_roll"),
+        ]
+
+        output_fields = [
+            ("Show Metrics", "show_metrics"),
+            ("Metrics Log", "metrics_path"),
+            ("Frame Bus", "frame_bus"),
+            ("Relay Port", "relay_port"),
+            ("Relay Host", "relay_host"),
         ]
 
         video_fields = [
@@ -83,21 +139,48 @@ class ConfigDialog(tk.Toplevel):
                     ttk.Label(frame, textvariable=label_var).grid(row=i, column=2, sticky="w")
                     self._vars[field + "_label"] = label_var
                     self._vars[field + "_scale"] = scale
+                elif field in SLIDERS:
+                    var = tk.DoubleVar(value=value)
+                    self._vars[field] = var
+                    low, high = SLIDERS[field]
+                    tk.Scale(
+                        frame,
+                        from_=low,
+                        to=high,
+                        resolution=0.01,
+                        orient="horizontal",
+                        variable=var,
+                    ).grid(row=i, column=1, padx=5, pady=2)
+                    var.trace_add("write", lambda *_, f=field, v=var: self._preview(f, v.get()))
                 else:
-                    var_cls = tk.DoubleVar if isinstance(value, float) else tk.IntVar
+                    if isinstance(value, str):
+                        var_cls = tk.StringVar
+                    elif isinstance(value, float):
+                        var_cls = tk.DoubleVar
+                    else:
+                        var_cls = tk.IntVar
                     var = var_cls(value=value)
                     self._vars[field] = var
                     ttk.Entry(frame, textvariable=var, width=15).grid(row=i, column=1, padx=5, pady=2)
 
-        add_fields(stream_frame, stream_fields)
-        add_fields(video_frame, video_fields)
+        for text, fields in (
+            ("Stream", stream_fields),
+            ("Network", network_fields),
+            ("Video", video_fields),
+            ("Recording", recording_fields),
+            ("Motion", motion_fields),
+            ("Outputs", output_fields),
+        ):
+            frame = ttk.Frame(nb)
+            nb.add(frame, text=text)
+            add_fields(frame, fields)
 
         btn_frame = ttk.Frame(self)
         btn_frame.pack(pady=5)
 
         ttk.Button(btn_frame, text="Save", command=self._save).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Restore Defaults", command=self._restore_defaults).pack(side="left", padx=5)
-        ttk.Button(btn_frame, text="Cancel", command=self.destroy).pack(side="right", padx=5)
+        ttk.Button(btn_frame, text="Cancel", command=self._cancel).pack(side="right", padx=5)
 
     def _save(self) -> None:
         for field, var in self._vars.items():
@@ -111,6 +194,16 @@ class ConfigDialog(tk.Toplevel):
             self._on_save()
         self.destroy()
 
+    def _preview(self, field: str, value: float) -> None:
+        if self._on_preview:
+            self._on_preview(field, value)
+
+    def _cancel(self) -> None:
+        """Close without saving and take back any previewed colour changes."""
+        for field in SLIDERS:
+            self._preview(field, getattr(self._config, field))
+        self.destroy()
+
     def _restore_defaults(self) -> None:
         defaults = StreamConfig()
         for field, var in self._vars.items():
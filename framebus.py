@@ -0,0 +1,306 @@
+"""Fan decoded frames out to several consumers through shared memory.
+
+The streamer publishes every frame once into a ring of preallocated slots in
+a :class:`multiprocessing.shared_memory.SharedMemory` block. Any number of
+:class:`Subscriber` objects, in this process or in others, read the slots as
+NumPy views with their own cursor and drop policy, without pickling or
+per-consumer copies::
+
+    bus = FrameBus.attach("camera")
+    sub = bus.subscribe("latest")
+    while True:
+        frame = sub.wait(1.0)
+        if frame is not None:
+            analyse(frame.array)
+
+Each slot carries a sequence counter used as a seqlock: it is odd while the
+slot is being written and ``2 * (n + 1)`` once frame ``n`` is complete.
+Readers check it before handing out a view and :meth:`BusFrame.valid` tells
+whether the slot has been reused since.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time
+from typing import TYPE_CHECKING, Optional
+
+from PIL import Image
+
+# NumPy and multiprocessing are only imported once a bus is used.
+if TYPE_CHECKING:
+    from multiprocessing import shared_memory
+
+    import numpy as np
+
+MAGIC = 0x4655424D41524631  # "1FRAMBUF"
+_HEADER_SIZE = 64
+_META_SIZE = 32
+_ALIGN = 64
+
+
+def _dtypes():
+    import numpy as np
+
+    header = np.dtype([("magic", "<u8"), ("slots", "<u8"), ("slot_bytes", "<u8"), ("write_seq", "<u8")])
+    meta = np.dtype([
+        ("seq", "<u8"),
+        ("width", "<u4"),
+        ("height", "<u4"),
+        ("channels", "<u4"),
+        ("nbytes", "<u4"),
+        ("timestamp", "<f8"),
+    ])
+    return header, meta
+
+
+class BusFrame:
+    """A frame read from the bus; :attr:`array` is a view into shared memory."""
+
+    __slots__ = ("seq", "timestamp", "array", "_meta", "_expected")
+
+    def __init__(self, seq: int, timestamp: float, array: np.ndarray, meta, expected: int):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.array = array
+        self._meta = meta
+        self._expected = expected
+
+    def valid(self) -> bool:
+        """Whether the slot still holds this frame, i.e. the view was not overwritten."""
+        return int(self._meta["seq"]) == self._expected
+
+    def image(self) -> Image.Image:
+        """Copy the frame into a PIL image."""
+        return Image.fromarray(self.array)
+
+
+class FrameBus:
+    """Ring of ``slots`` frame buffers of ``slot_bytes`` each in shared memory.
+
+    Use :meth:`create` in the producing process and :meth:`attach` elsewhere.
+    Only one process may publish.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        import numpy as np
+
+        header_dtype, meta_dtype = _dtypes()
+        self.shm = shm
+        self.name = shm.name
+        self.owner = owner
+        self._header = np.ndarray((), header_dtype, buffer=shm.buf)
+        if owner:
+            self._header["magic"] = MAGIC
+        elif int(self._header["magic"]) != MAGIC:
+            raise ValueError(f"{shm.name} is not a frame bus")
+        self.slots = int(self._header["slots"])
+        self.slot_bytes = int(self._header["slot_bytes"])
+        self._meta = np.ndarray((self.slots,), meta_dtype, buffer=shm.buf, offset=_HEADER_SIZE)
+        data_offset = _data_offset(self.slots)
+        self._data = np.ndarray(
+            (self.slots, self.slot_bytes), np.uint8, buffer=shm.buf, offset=data_offset
+        )
+        self.published = 0
+        self.oversized = 0
+        self._pending: Optional[int] = None
+
+    @classmethod
+    def create(cls, name: Optional[str] = None, slots: int = 8, slot_bytes: int = 1920 * 1080 * 3) -> "FrameBus":
+        """Allocate a new bus; ``slot_bytes`` must fit the largest frame."""
+        from multiprocessing import shared_memory
+
+        slots = max(slots, 2)
+        slot_bytes = -(-slot_bytes // _ALIGN) * _ALIGN
+        size = _data_offset(slots) + slots * slot_bytes
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        # Header fields are needed before __init__ can map the slots.
+        shm.buf[8:24] = slots.to_bytes(8, "little") + slot_bytes.to_bytes(8, "little")
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameBus":
+        """Open a bus created by another process."""
+        from multiprocessing import shared_memory
+
+        shm = shared_memory.SharedMemory(name=name)
+        if sys.version_info < (3, 13):
+            # Before 3.13 every attaching process registers the block with its
+            # resource tracker, which would unlink it on exit.
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def write_seq(self) -> int:
+        """Number of frames published so far."""
+        return int(self._header["write_seq"])
+
+    def acquire(self, width: int, height: int, channels: int = 3) -> Optional[np.ndarray]:
+        """Return the next slot as a writable ``(height, width, channels)`` array.
+
+        Fill it, then call :meth:`commit`. Returns ``None`` when the frame does
+        not fit in a slot.
+        """
+        nbytes = width * height * channels
+        if nbytes > self.slot_bytes:
+            self.oversized += 1
+            return None
+        n = self.write_seq
+        slot = n % self.slots
+        meta = self._meta[slot]
+        meta["seq"] = 2 * n + 1
+        meta["width"], meta["height"], meta["channels"], meta["nbytes"] = width, height, channels, nbytes
+        self._pending = n
+        return self._data[slot, :nbytes].reshape(height, width, channels)
+
+    def commit(self, timestamp: float) -> None:
+        """Mark the slot returned by :meth:`acquire` as complete."""
+        n = self._pending
+        if n is None:
+            return
+        meta = self._meta[n % self.slots]
+        meta["timestamp"] = timestamp
+        meta["seq"] = 2 * n + 2
+        self._header["write_seq"] = n + 1
+        self._pending = None
+        self.published += 1
+
+    def publish(self, img: Image.Image, timestamp: float) -> bool:
+        """Copy a PIL frame into the next slot; ``False`` if it was too large."""
+        import numpy as np
+
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        channels = 3 if img.mode == "RGB" else 1
+        slot = self.acquire(img.width, img.height, channels)
+        if slot is None:
+            return False
+        np.copyto(slot, np.asarray(img).reshape(slot.shape))
+        self.commit(timestamp)
+        return True
+
+    def subscribe(self, policy: str = "latest") -> "Subscriber":
+        return Subscriber(self, policy)
+
+    def close(self) -> None:
+        """Detach; the creating process also frees the shared memory."""
+        # The views must go before the mapping can be closed.
+        self._header = self._meta = self._data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            logging.debug("Frame bus %s still has frames in use", self.name)
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _data_offset(slots: int) -> int:
+    return -(-(_HEADER_SIZE + slots * _META_SIZE) // _ALIGN) * _ALIGN
+
+
+class Subscriber:
+    """Independent reader of a :class:`FrameBus`.
+
+    ``policy`` decides what happens when the reader falls behind:
+
+    * ``"latest"`` always jumps to the newest frame, skipping older ones.
+    * ``"all"`` reads every frame in order while the ring still holds it and
+      skips ahead to the oldest available one once the writer laps it.
+
+    Skipped frames are counted in :attr:`dropped`.
+    """
+
+    def __init__(self, bus: FrameBus, policy: str = "latest"):
+        if policy not in ("latest", "all"):
+            raise ValueError(f"unknown drop policy {policy!r}")
+        self.bus = bus
+        self.policy = policy
+        self.cursor = bus.write_seq
+        self.read = 0
+        self.dropped = 0
+
+    def poll(self) -> Optional[BusFrame]:
+        """Return the next frame under the drop policy, or ``None`` if there is none yet."""
+        bus = self.bus
+        while True:
+            written = bus.write_seq
+            if self.cursor >= written:
+                return None
+            if self.policy == "latest":
+                n = written - 1
+            else:
+                # The slot after the newest one may already be rewritten.
+                n = max(self.cursor, written - bus.slots + 1)
+            self.dropped += n - self.cursor
+            self.cursor = n + 1
+            meta = bus._meta[n % bus.slots]
+            expected = 2 * n + 2
+            if int(meta["seq"]) != expected:
+                self.dropped += 1
+                continue
+            height, width, channels = int(meta["height"]), int(meta["width"]), int(meta["channels"])
+            array = bus._data[n % bus.slots, :int(meta["nbytes"])].reshape(height, width, channels)
+            if channels == 1:
+                array = array[:, :, 0]
+            array.flags.writeable = False
+            timestamp = float(meta["timestamp"])
+            if int(meta["seq"]) != expected:
+                # Rewritten while the header was read.
+                self.dropped += 1
+                continue
+            self.read += 1
+            return BusFrame(n, timestamp, array, meta, expected)
+
+    def wait(self, timeout: Optional[float] = None, interval: float = 0.002) -> Optional[BusFrame]:
+        """Poll until a frame is available or ``timeout`` seconds have passed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frame = self.poll()
+            if frame is not None:
+                return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Attach to a running bus and report what a subscriber receives."""
+    parser = argparse.ArgumentParser(description="Monitor a frame bus")
+    parser.add_argument("name", help="shared memory name given to --bus")
+    parser.add_argument("--policy", default="latest", choices=("latest", "all"))
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between reports")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    bus = FrameBus.attach(args.name)
+    sub = bus.subscribe(args.policy)
+    last, last_read = time.monotonic(), 0
+    try:
+        while True:
+            frame = sub.wait(args.interval)
+            now = time.monotonic()
+            if now - last >= args.interval:
+                size = f"{frame.array.shape[1]}x{frame.array.shape[0]}" if frame else "-"
+                logging.info(
+                    "%.1f fps, %s, %d dropped, latency %s",
+                    (sub.read - last_read) / (now - last),
+                    size,
+                    sub.dropped,
+                    f"{(now - frame.timestamp) * 1000:.0f} ms" if frame else "-",
+                )
+                last, last_read = now, sub.read
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bus.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
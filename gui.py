@@ -1,15 +1,17 @@
 import os
+import threading
 import time
-import subprocess
-import shutil
 import tkinter as tk
 from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
-import cv2
-import numpy as np
 from config import StreamConfig
-from config_dialog import ConfigDialog
-from streamer import FrameProcessor, CameraStreamer
+from recorder import Recorder
+from store import RecordingStore
+from streamer import FrameProcessor, create_streamer, decode_frame, output
+from alignment import FrameAligner
+from framebus import FrameBus
+from relay import MjpegRelay
+from motion import MotionDetector, MotionRecorder, event_path
 
 OUTPUT_DIR = "recordings"
 
@@ -19,60 +21,63 @@ def ensure_output_dir():
         os.makedirs(OUTPUT_DIR)
 
 
-def convert_to_mpg(path: str) -> str:
-    """Convert an AVI recording to MPG using ffmpeg."""
-    if shutil.which("ffmpeg") is None:
-        return path
-    base = os.path.splitext(path)[0]
-    mpg_path = f"{base}.mpg"
-    cmd = ["ffmpeg", "-y", "-i", path, mpg_path]
-    try:
-        subprocess.run(
-            cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-        )
-        os.remove(path)
-        return mpg_path
-    except Exception:
-        return path
-
-
 class CameraApp:
     def __init__(self, root: tk.Tk):
         self.root = root
         self.root.title("AP Camera Receiver")
         self.config = StreamConfig.load()
+        self.frame_bus: FrameBus | None = None
+        self.relay: MjpegRelay | None = None
         self.processor = FrameProcessor()
-        self.processor.target_size = (self.config.display_width, self.config.display_height)
-        self.processor.brightness = self.config.brightness
-        self.processor.contrast = self.config.contrast
-        self.processor.saturation = self.config.saturation
-        self.processor.hue = self.config.hue
-        self.processor.gamma = self.config.gamma
-        self.streamer = CameraStreamer(self.config, self.processor)
+        self.processor.apply_config(self.config)
+        self.streamer = self._create_streamer()
 
         self.mic_on = False
         self.recording = False
         self.current_frame = None
+        # One PhotoImage is reused and pasted into while the display size
+        # stays the same; the layout is cached until the canvas is resized.
         self.tk_image = None
-        self.video_writer = None
+        self._layout: tuple | None = None
+        self._canvas_size: tuple[int, int] | None = None
+        # Newest frame from the dispatcher, rendered once per Tk tick.
+        self._pending_frame = None
+        self._pending_lock = threading.Lock()
+        self._render_scheduled = False
+        self.recorder: Recorder | MotionRecorder | None = None
         self.record_indicator_state = False
         self.blink_job = None
         self.volume = tk.DoubleVar(value=50)
-        self.prev_frame = None
 
         self._build_ui()
         self._show_off_message()
-        self.root.after(10, self._poll_frames)
+        self.root.after(1000, self._update_metrics)
 
     # ----------------- UI SETUP -----------------
     def _build_ui(self):
         menu_bar = tk.Menu(self.root)
         self.root.config(menu=menu_bar)
         menu_bar.add_command(label="Settings", command=self.open_config_dialog)
+        replay_menu = tk.Menu(menu_bar, tearoff=False)
+        replay_menu.add_command(label="Save Last Seconds", command=self.save_replay)
+        for seconds in (1, 3, 5):
+            replay_menu.add_command(
+                label=f"Snapshot {seconds} s Ago", command=lambda s=seconds: self.take_snapshot(s)
+            )
+        menu_bar.add_cascade(label="Replay", menu=replay_menu)
 
         self.canvas = tk.Canvas(self.root, bg="black")
         self.canvas.pack(fill="both", expand=True)
-        self.canvas.bind("<Configure>", lambda e: self._display_current_frame())
+        self.canvas.bind("<Configure>", self._on_canvas_resize)
+        # Canvas items are created once and then only moved or updated.
+        self.image_item = self.canvas.create_image(0, 0, anchor=tk.NW, state="hidden")
+        self.off_item = self.canvas.create_text(
+            0, 0, text="Stream is off", fill="white", font=("Arial", 20)
+        )
+        self.record_item = self.canvas.create_oval(10, 10, 30, 30, fill="red", state="hidden")
+        self.metrics_item = self.canvas.create_text(
+            0, 10, anchor=tk.NE, fill="yellow", state="hidden"
+        )
 
         controls = ttk.Frame(self.root)
         controls.pack(fill="x", pady=5)
@@ -145,74 +150,89 @@ class CameraApp:
             self._show_off_message()
 
     # ----------------- FRAME HANDLING -----------------
+    def _on_frame_threadsafe(self, img):
+        """Streamer callback: record every frame, display only the newest."""
+        recorder = self.recorder
+        # Motion-gated recorders also need the decoded frames in passthrough mode.
+        if self.recording and recorder and (recorder.mode == "encode" or isinstance(recorder, MotionRecorder)):
+            recorder.write_frame(output(img, "record"), img.info.get("timestamp", time.monotonic()))
+        with self._pending_lock:
+            self._pending_frame = img
+            if self._render_scheduled:
+                return
+            self._render_scheduled = True
+        self.root.after_idle(self._render_pending)
+
+    def _render_pending(self):
+        with self._pending_lock:
+            img, self._pending_frame = self._pending_frame, None
+            self._render_scheduled = False
+        if img is None or not self.streamer.running:
+            return
+        self._on_frame(img)
+
     def _on_frame(self, img):
         self.packets_label.config(text=f"Pkts: {self.streamer.packets_in_frame()}")
-        aligned, offset = self._align_frame(self.prev_frame, img)
-        self.prev_frame = aligned.copy()
-        self.current_frame = aligned
-        self.offset_label.config(text=f"Offset: {offset}")
-        if self.recording and self.video_writer:
-            frame = cv2.cvtColor(np.array(aligned), cv2.COLOR_RGB2BGR)
-            self.video_writer.write(frame)
+        # Frames arrive already aligned by the streamer.
+        self.current_frame = img
+        self.offset_label.config(text=f"Offset: {img.info.get('offset', 0)}")
+        self._display_current_frame()
+        self.streamer.metrics.mark(img.info.get("trace"), "displayed")
+
+    def _on_canvas_resize(self, event):
+        self._layout = None
+        self._canvas_size = (event.width, event.height)
+        self.canvas.coords(self.off_item, event.width // 2, event.height // 2)
+        self.canvas.coords(self.metrics_item, event.width - 10, 10)
         self._display_current_frame()
 
     def _display_current_frame(self):
-        self.canvas.delete("all")
         if self.current_frame is None:
             self._show_off_message()
             return
         try:
-            canvas_w = self.canvas.winfo_width()
-            canvas_h = self.canvas.winfo_height()
-            img_w, img_h = self.current_frame.size
-            scale = min(canvas_w / img_w, canvas_h / img_h)
-            new_w = int(img_w * scale)
-            new_h = int(img_h * scale)
-            img = self.current_frame.resize((new_w, new_h), Image.NEAREST)
-            x = (canvas_w - new_w) // 2
-            y = (canvas_h - new_h) // 2
-            self.tk_image = ImageTk.PhotoImage(img)
-            self.canvas.create_image(x, y, anchor=tk.NW, image=self.tk_image)
-            if self.recording and self.record_indicator_state:
-                self.canvas.create_oval(10, 10, 30, 30, fill="red", tags="record_indicator")
+            img = self.current_frame
+            canvas_w, canvas_h = self._canvas_size or (
+                self.canvas.winfo_width(),
+                self.canvas.winfo_height(),
+            )
+            layout = self._layout
+            if layout is None or layout[0] != (canvas_w, canvas_h, img.size):
+                img_w, img_h = img.size
+                scale = min(canvas_w / img_w, canvas_h / img_h)
+                size = (max(int(img_w * scale), 1), max(int(img_h * scale), 1))
+                layout = self._layout = ((canvas_w, canvas_h, img.size), size)
+                # Have the processor make the preview at the canvas size.
+                if size != img.size:
+                    self.processor.add_output("preview", size)
+                else:
+                    self.processor.remove_output("preview")
+                self.canvas.coords(
+                    self.image_item, (canvas_w - size[0]) // 2, (canvas_h - size[1]) // 2
+                )
+            size = layout[1]
+            preview = output(img, "preview")
+            if preview.size == size:
+                img = preview
+            elif img.size != size:
+                # Until frames with a preview of this size come through.
+                img = img.resize(size, Image.NEAREST)
+            if self.tk_image is None or (self.tk_image.width(), self.tk_image.height()) != size:
+                self.tk_image = ImageTk.PhotoImage(img)
+                self.canvas.itemconfigure(self.image_item, image=self.tk_image)
+            else:
+                self.tk_image.paste(img)
+            self.canvas.itemconfigure(self.image_item, state="normal")
+            self.canvas.itemconfigure(self.off_item, state="hidden")
         except Exception as exc:
             print(f"Display error: {exc}")
 
-    def _align_frame(self, prev: Image.Image | None, curr: Image.Image, max_offset: int = 10) -> tuple[Image.Image, int]:
-        if prev is None:
-            return curr, 0
-        prev_g = np.array(prev.convert("L"))
-        curr_g = np.array(curr.convert("L"))
-        h = min(prev_g.shape[0], curr_g.shape[0])
-        w = min(prev_g.shape[1], curr_g.shape[1])
-        template_h = min(80, h)
-        template = prev_g[h - template_h : h, :w]
-        search_top = min(curr_g.shape[0], template_h + max_offset * 2)
-        search = curr_g[:search_top, :w]
-        res = cv2.matchTemplate(search, template, cv2.TM_CCORR_NORMED)
-        _, _, _, max_loc = cv2.minMaxLoc(res)
-        offset = max_loc[1] - max_offset
-        if offset == 0:
-            return curr, 0
-        curr_np = np.array(curr)
-        aligned = np.zeros_like(curr_np)
-        if offset > 0:
-            aligned[:-offset] = curr_np[offset:]
-        else:
-            aligned[-offset:] = curr_np[: curr_np.shape[0] + offset]
-        return Image.fromarray(aligned), offset
-
     def _show_off_message(self):
-        self.canvas.delete("all")
-        canvas_w = self.canvas.winfo_width()
-        canvas_h = self.canvas.winfo_height()
-        self.canvas.create_text(
-            canvas_w // 2,
-            canvas_h // 2,
-            text="Stream is off",
-            fill="white",
-            font=("Arial", 20),
+        self.canvas.itemconfigure(self.image_item, state="hidden")
+        self.canvas.coords(
+            self.off_item, self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2
         )
+        self.canvas.itemconfigure(self.off_item, state="normal")
 
     # ----------------- BUTTON CALLBACKS -----------------
     def toggle_mic(self):
@@ -241,18 +261,40 @@ class CameraApp:
         ensure_output_dir()
         timestamp = time.strftime("%Y%m%d_%H%M%S")
         path = os.path.join(OUTPUT_DIR, f"record_{timestamp}.avi")
-        fourcc = cv2.VideoWriter_fourcc(*"XVID")
-        if self.current_frame is not None:
-            w, h = self.current_frame.size
+        mode = self.config.record_mode
+        options = dict(
+            mode=mode,
+            segment_seconds=self.config.record_segment_seconds,
+            convert=mode == "encode",
+            metrics=self.streamer.metrics,
+        )
+        if self.config.store_dir:
+            # Indexed segments in the store instead of one file per recording.
+            options.update(store=RecordingStore.from_config(self.config), convert=False)
+            path = self.config.store_dir
+        if self.streamer.motion:
+            # One file per motion event, named after its start time.
+            self.recorder = MotionRecorder(
+                lambda event: Recorder(event_path(os.path.join(OUTPUT_DIR, "record.avi"), event), **options),
+                mode,
+                self.config.motion_pre_roll,
+                self.config.motion_post_roll,
+                snapshot=self._save_motion_snapshot,
+                on_complete=self._on_record_complete_threadsafe,
+            )
         else:
-            w = int(self.canvas.winfo_width()) or 640
-            h = int(self.canvas.winfo_height()) or 480
-        self.video_writer = cv2.VideoWriter(path, fourcc, 20.0, (w, h))
-        if not self.video_writer.isOpened():
-            messagebox.showerror("Recording", "Failed to open video writer")
-            self.video_writer = None
-            return
-        self.record_file = path
+            self.recorder = Recorder(path, on_complete=self._on_record_complete_threadsafe, **options)
+        if mode == "encode" and self.config.record_full_resolution:
+            self.processor.add_output("record", None)
+        replay = None
+        if isinstance(self.recorder, Recorder):
+            # Start with the buffered frames from before Record was pressed.
+            replay = self.recorder.write_history
+        if mode == "passthrough":
+            # Raw camera JPEGs are muxed as they arrive, without decoding.
+            self.streamer.add_jpeg_callback(self.recorder.write_jpeg, replay)
+        elif replay and self.streamer.history is not None:
+            replay(self.streamer.history.frames(), self._decode_for_record)
         self.recording = True
         self.record_btn.config(text="Stop Recording")
         self._blink_record_indicator()
@@ -263,60 +305,180 @@ class CameraApp:
         if self.blink_job:
             self.root.after_cancel(self.blink_job)
             self.blink_job = None
-        self.canvas.delete("record_indicator")
-        if self.video_writer:
-            self.video_writer.release()
-            self.video_writer = None
-            final_path = convert_to_mpg(self.record_file)
-            messagebox.showinfo("Recording", f"Saved to {final_path}")
+        self.canvas.itemconfigure(self.record_item, state="hidden")
+        self.processor.remove_output("record")
+        if self.recorder:
+            self.streamer.remove_jpeg_callback(self.recorder.write_jpeg)
+            # Finishing and converting happen on the recorder thread.
+            self.recorder.stop()
+            self.recorder = None
+
+    def _decode_for_record(self, data: bytes):
+        return output(decode_frame(self.processor, data), "record")
+
+    def _save_motion_snapshot(self, img, timestamp: float) -> None:
+        img.save(event_path(os.path.join(OUTPUT_DIR, "motion.jpg"), timestamp))
+
+    def _on_record_complete_threadsafe(self, recorder) -> None:
+        self.root.after_idle(self._on_record_complete, recorder)
+
+    def _on_record_complete(self, recorder) -> None:
+        if not recorder.files:
+            if isinstance(recorder, MotionRecorder):
+                messagebox.showinfo("Recording", "No motion was detected")
+            else:
+                messagebox.showerror("Recording", "No frames were recorded")
+            return
+        if self.config.store_dir:
+            message = f"Saved {len(recorder.files)} segments to {self.config.store_dir}"
+        else:
+            message = "Saved to " + ", ".join(recorder.files)
+        if recorder.dropped:
+            message += f"\n{recorder.dropped} frames were dropped"
+        messagebox.showinfo("Recording", message)
 
     def _blink_record_indicator(self):
         if not self.recording:
-            self.canvas.delete("record_indicator")
+            self.canvas.itemconfigure(self.record_item, state="hidden")
             return
         self.record_indicator_state = not self.record_indicator_state
-        self._display_current_frame()
+        self.canvas.itemconfigure(
+            self.record_item, state="normal" if self.record_indicator_state else "hidden"
+        )
         self.blink_job = self.root.after(500, self._blink_record_indicator)
 
-    def take_snapshot(self):
-        if self.current_frame is None:
+    def take_snapshot(self, seconds_ago: float = 0.0):
+        img = self.current_frame
+        if seconds_ago:
+            # Only the one frame picked from the history is decoded.
+            try:
+                img = self.streamer.recent_frame(seconds_ago)
+            except OSError:
+                img = None
+            if img is None:
+                messagebox.showinfo("Snapshot", "No buffered frame from that long ago")
+                return
+        if img is None:
             return
         ensure_output_dir()
         timestamp = time.strftime("%Y%m%d_%H%M%S")
         path = os.path.join(OUTPUT_DIR, f"snapshot_{timestamp}.jpg")
-        self.current_frame.save(path)
+        img.save(path)
         messagebox.showinfo("Snapshot", f"Saved to {path}")
 
+    def save_replay(self):
+        """Write the buffered last seconds of raw frames to an MKV clip."""
+        history = self.streamer.history
+        if history is None or not len(history):
+            messagebox.showinfo("Replay", "No frames are buffered; check History (s) in the settings")
+            return
+        ensure_output_dir()
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(OUTPUT_DIR, f"replay_{timestamp}.mkv")
+
+        def export() -> None:
+            try:
+                count = history.export(path)
+            except OSError as exc:
+                self.root.after_idle(messagebox.showerror, "Replay", f"Saving {path} failed: {exc}")
+                return
+            self.root.after_idle(messagebox.showinfo, "Replay", f"Saved {count} frames to {path}")
+
+        threading.Thread(target=export, name="replay-export", daemon=True).start()
+
     def on_volume_change(self, _=None):
         # Placeholder for real volume control
         pass
 
-    def on_align_change(self, _=None):
-        self.config.alignment_threshold = int(float(self.align_threshold.get()))
-
     def open_config_dialog(self) -> None:
-        ConfigDialog(self.root, self.config, on_save=self._on_config_saved)
+        from config_dialog import ConfigDialog
+
+        ConfigDialog(
+            self.root,
+            self.config,
+            on_save=self._on_config_saved,
+            on_preview=lambda field, value: self.processor.update(**{field: value}),
+        )
 
     def _on_config_saved(self) -> None:
+        if self.streamer.reconfigure(self.config):
+            # Applied in place; the stream keeps running on the same socket.
+            self._attach(self.streamer)
+            return
         was_running = self.streamer.running
         if was_running:
             self.streamer.stop()
-        self.processor.target_size = (self.config.display_width, self.config.display_height)
-        self.processor.brightness = self.config.brightness
-        self.processor.contrast = self.config.contrast
-        self.processor.saturation = self.config.saturation
-        self.processor.hue = self.config.hue
-        self.processor.gamma = self.config.gamma
-        self.streamer = CameraStreamer(self.config, self.processor)
+        self.processor.apply_config(self.config)
+        history = self.streamer.history
+        self.streamer = self._create_streamer()
+        if history is not None and self.streamer.history is not None:
+            # Keep the frames buffered so far.
+            history.seconds = self.streamer.history.seconds
+            history.max_bytes = self.streamer.history.max_bytes
+            self.streamer.history = history
+        if self.recorder and self.recorder.mode == "passthrough":
+            self.streamer.add_jpeg_callback(self.recorder.write_jpeg)
         if was_running:
             self.streamer.start(self._on_frame_threadsafe)
-        self.align_threshold.set(self.config.alignment_threshold)
-
-    def _on_frame_threadsafe(self, img):
-        self.root.after_idle(self._on_frame, img)
 
-    def _poll_frames(self):
-        while self.streamer and not self.streamer.frame_queue.empty():
-            img = self.streamer.frame_queue.get()
-            self._on_frame_threadsafe(img)
-        self.root.after(10, self._poll_frames)
+    def _create_streamer(self):
+        streamer = create_streamer(self.config, self.processor)
+        self._attach(streamer)
+        return streamer
+
+    def _attach(self, streamer) -> None:
+        """Give ``streamer`` the aligner, motion detector, bus and relay of the config.
+
+        Safe to call again on a running streamer after a config change.
+        """
+        if streamer.aligner is None:
+            streamer.aligner = FrameAligner(self.config.alignment_threshold)
+        if not self.config.motion_threshold:
+            streamer.set_motion(None)
+        elif streamer.motion is None:
+            streamer.set_motion(MotionDetector(self.config.motion_threshold))
+        name = self.config.frame_bus
+        width, height = self.processor.target_size or (1920, 1080)
+        slot_bytes = width * height * 3
+        bus = self.frame_bus
+        if bus and (bus.name.lstrip("/") != name or bus.slot_bytes < slot_bytes):
+            streamer.frame_bus = None
+            bus.close()
+            self.frame_bus = None
+        if name and self.frame_bus is None:
+            try:
+                self.frame_bus = FrameBus.create(name, slot_bytes=slot_bytes)
+            except OSError as exc:
+                messagebox.showerror("Frame Bus", f"Cannot create frame bus {name}: {exc}")
+        streamer.frame_bus = self.frame_bus
+        relay = self.relay
+        address = (self.config.relay_host, self.config.relay_port)
+        if relay and (not self.config.relay_port or (relay.host, relay.port) != address):
+            streamer.remove_jpeg_callback(relay.publish)
+            relay.stop()
+            self.relay = None
+        if self.config.relay_port and self.relay is None:
+            relay = MjpegRelay(*address)
+            try:
+                relay.start()
+                self.relay = relay
+            except OSError as exc:
+                messagebox.showerror("Relay", f"Cannot serve on {address[0]}:{address[1]}: {exc}")
+        if self.relay and self.relay.publish not in streamer.jpeg_callbacks:
+            streamer.add_jpeg_callback(self.relay.publish)
+
+    def _update_metrics(self):
+        """Refresh the stats overlay and log a snapshot once per second."""
+        running = self.streamer.running
+        self.canvas.itemconfigure(
+            self.metrics_item, state="normal" if running and self.config.show_metrics else "hidden"
+        )
+        if running:
+            metrics = self.streamer.metrics
+            self.canvas.itemconfigure(self.metrics_item, text=metrics.summary().replace(", ", "\n"))
+            if self.config.metrics_path:
+                try:
+                    metrics.export(self.config.metrics_path)
+                except OSError as exc:
+                    print(f"Metrics export error: {exc}")
+        self.root.after(1000, self._update_metrics)
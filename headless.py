@@ -0,0 +1,310 @@
+"""Receive a camera stream without any GUI.
+
+Only the streaming and processing modules are imported here, never tkinter,
+so this entry point starts quickly on servers that only record or relay.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+from PIL import Image
+
+from alignment import FrameAligner
+from config import CONFIG_PATH, StreamConfig
+from framebus import FrameBus
+from history import FrameHistory
+from motion import MotionDetector, MotionRecorder, event_path
+from recorder import Recorder
+from relay import MjpegRelay
+from store import RecordingStore
+from streamer import FrameProcessor, create_streamer
+
+
+class ImageSequenceSink:
+    """Write every frame as a numbered JPEG file."""
+
+    def __init__(self, directory: str, quality: int = 90):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.quality = quality
+        self.count = 0
+
+    def write(self, img: Image.Image) -> None:
+        path = os.path.join(self.directory, f"frame_{self.count:06d}.jpg")
+        img.save(path, quality=self.quality)
+        self.count += 1
+
+    def close(self) -> None:
+        pass
+
+
+class StdoutSink:
+    """Write frames to stdout as a raw MJPEG stream, e.g. to pipe into ffmpeg."""
+
+    def __init__(self, quality: int = 90):
+        self.out = sys.stdout.buffer
+        self.quality = quality
+
+    def write(self, img: Image.Image) -> None:
+        img.save(self.out, format="JPEG", quality=self.quality)
+        self.out.flush()
+
+    def close(self) -> None:
+        self.out.flush()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="AP Camera Receiver (headless)")
+    parser.add_argument("--config", default=CONFIG_PATH, help="path to the config file")
+    parser.add_argument("--record", metavar="PATH", help="encode frames into a video file")
+    parser.add_argument("--fps", type=float, help="frame rate for --record (measured by default)")
+    parser.add_argument("--segment", type=float, default=0.0, help="start a new file every N seconds")
+    parser.add_argument("--record-raw", metavar="PATH", help="mux the camera JPEGs into an MKV file as-is")
+    parser.add_argument("--store", metavar="DIR", help="mux the camera JPEGs into an indexed segment store")
+    parser.add_argument("--retention", type=float, metavar="HOURS", help="delete store segments older than this")
+    parser.add_argument("--max-gb", type=float, help="delete the oldest store segments beyond this total size")
+    parser.add_argument("--images", metavar="DIR", help="save frames as a JPEG sequence")
+    parser.add_argument("--motion", type=float, metavar="PERCENT", help="record only while this much of the frame changes")
+    parser.add_argument("--motion-snapshots", metavar="DIR", help="save a snapshot when motion starts")
+    parser.add_argument("--stdout", action="store_true", help="write an MJPEG stream to stdout")
+    parser.add_argument("--full-size", action="store_true", help="keep the camera resolution")
+    parser.add_argument("--align", action="store_true", help="align frames to reduce vertical jitter")
+    parser.add_argument("--bus", metavar="NAME", help="publish frames to a shared-memory frame bus")
+    parser.add_argument("--bus-slots", type=int, default=8, help="frames held by the frame bus")
+    parser.add_argument("--relay", type=int, metavar="PORT", help="serve the camera JPEGs as MJPEG over HTTP")
+    parser.add_argument("--relay-host", help="address the relay listens on (default from config)")
+    parser.add_argument(
+        "--replay-dir", metavar="DIR", help="on SIGUSR1 save the buffered last seconds (History in the config) here"
+    )
+    parser.add_argument("--duration", type=float, default=0.0, help="stop after this many seconds")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="seconds between stats lines")
+    parser.add_argument("--metrics", metavar="PATH", help="append a JSON metrics snapshot every stats interval")
+    parser.add_argument("--verbose", action="store_true", help="enable debug logging")
+    return parser
+
+
+def save_replay(history: FrameHistory, directory: str) -> None:
+    """Write the buffered frames to a timestamped MKV clip in ``directory``."""
+    path = os.path.join(directory, time.strftime("replay_%Y%m%d_%H%M%S.mkv"))
+    try:
+        count = history.export(path)
+    except OSError:
+        logging.exception("Saving replay %s failed", path)
+        return
+    logging.info("Saved %d buffered frames to %s", count, path)
+
+
+def setup_replay(args: argparse.Namespace, streamer) -> threading.Event:
+    """Keep the history only with ``--replay-dir``; the event is set on SIGUSR1."""
+    requested = threading.Event()
+    if args.replay_dir and streamer.history is not None and hasattr(signal, "SIGUSR1"):
+        os.makedirs(args.replay_dir, exist_ok=True)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: requested.set())
+        logging.info("Send SIGUSR1 to save the last %.0f s to %s", streamer.history.seconds, args.replay_dir)
+    else:
+        # Nothing would ever read the history.
+        streamer.history = None
+    return requested
+
+
+def motion_snapshot(directory: str) -> Callable[[Image.Image, float], None]:
+    """Save the frame that started a motion event into ``directory``."""
+    os.makedirs(directory, exist_ok=True)
+    return lambda img, timestamp: img.save(event_path(os.path.join(directory, "motion.jpg"), timestamp))
+
+
+def build_recorders(args: argparse.Namespace, config: StreamConfig, streamer) -> list:
+    """The recorders asked for on the command line, motion-gated when motion detection is on."""
+    snapshot = None
+    if args.motion_snapshots and streamer.motion:
+        snapshot = motion_snapshot(args.motion_snapshots)
+    recorders = []
+
+    def make_recorder(path: str, mode: str, **kwargs):
+        if not streamer.motion:
+            return Recorder(path, mode=mode, **kwargs)
+        return MotionRecorder(
+            lambda timestamp: Recorder(event_path(path, timestamp), mode=mode, **kwargs),
+            mode,
+            config.motion_pre_roll,
+            config.motion_post_roll,
+            # One snapshot per event, however many recordings it starts.
+            None if recorders else snapshot,
+        )
+
+    if args.record:
+        recorders.append(
+            make_recorder(
+                args.record,
+                "encode",
+                fps=args.fps,
+                fourcc="MJPG",
+                segment_seconds=args.segment,
+                metrics=streamer.metrics,
+            )
+        )
+    if args.record_raw:
+        recorders.append(make_recorder(args.record_raw, "passthrough", segment_seconds=args.segment))
+    if args.store:
+        store = RecordingStore.from_config(config, args.store)
+        if args.segment:
+            store.segment_seconds = args.segment
+        if args.retention is not None:
+            store.retention_seconds = args.retention * 3600
+        if args.max_gb is not None:
+            store.max_bytes = int(args.max_gb * 1e9)
+        recorders.append(make_recorder(args.store, "passthrough", store=store))
+    if snapshot and not recorders:
+        recorders.append(MotionRecorder(None, "encode", snapshot=snapshot))
+    return recorders
+
+
+def build_sinks(args: argparse.Namespace) -> list:
+    sinks = []
+    if args.images:
+        sinks.append(ImageSequenceSink(args.images))
+    if args.stdout:
+        sinks.append(StdoutSink())
+    return sinks
+
+
+def start_relay(args: argparse.Namespace, config: StreamConfig, streamer) -> Optional[MjpegRelay]:
+    """Serve the camera JPEGs over HTTP if a relay port is set."""
+    port = args.relay if args.relay is not None else config.relay_port
+    if not port:
+        return None
+    relay = MjpegRelay(args.relay_host or config.relay_host, port)
+    relay.start()
+    streamer.jpeg_callbacks.append(relay.publish)
+    return relay
+
+
+def log_recorders(recorders: list) -> None:
+    """Finish the recorders and log what each one wrote."""
+    for recorder in recorders:
+        recorder.stop()
+        recorder.join()
+        if isinstance(recorder, MotionRecorder):
+            logging.info("%d motion events", recorder.events)
+        if not recorder.files:
+            continue
+        store = getattr(recorder, "store", None)
+        logging.info(
+            "Recorded %d frames to %s, %d dropped",
+            recorder.written,
+            f"{len(recorder.files)} segments in {store.directory}" if store else ", ".join(recorder.files),
+            recorder.dropped,
+        )
+
+
+def run(args: argparse.Namespace) -> int:
+    config = StreamConfig.load(args.config)
+    processor = FrameProcessor()
+    processor.apply_config(config)
+    if args.full_size:
+        processor.target_size = None
+
+    streamer = create_streamer(config, processor)
+    replay_requested = setup_replay(args, streamer)
+    if args.align:
+        streamer.aligner = FrameAligner(config.alignment_threshold)
+    bus_name = args.bus or config.frame_bus
+    if bus_name:
+        width, height = processor.target_size or (1920, 1080)
+        streamer.frame_bus = FrameBus.create(bus_name, args.bus_slots, width * height * 3)
+        logging.info("Publishing frames to frame bus %s", bus_name)
+    motion_threshold = args.motion if args.motion is not None else config.motion_threshold
+    if motion_threshold:
+        streamer.motion = MotionDetector(motion_threshold)
+    recorders = build_recorders(args, config, streamer)
+    sinks = build_sinks(args)
+    relay = start_relay(args, config, streamer)
+    raw_only = relay or recorders
+    if raw_only and not (sinks or streamer.frame_bus or streamer.motion or any(r.mode == "encode" for r in recorders)):
+        # Nothing needs decoded frames; the relay and raw recorders take the JPEGs.
+        streamer.decode = False
+
+    frames = 0
+    lock = threading.Lock()
+
+    def on_frame(img: Image.Image) -> None:
+        nonlocal frames
+        for recorder in recorders:
+            # Motion-gated passthrough recorders take the decoded frames for the motion state.
+            if recorder.mode == "encode" or isinstance(recorder, MotionRecorder):
+                recorder.write_frame(img, img.info.get("timestamp", time.monotonic()))
+        for sink in sinks:
+            try:
+                sink.write(img)
+            except Exception:
+                logging.exception("Writing frame to %s failed", type(sink).__name__)
+        with lock:
+            frames += 1
+
+    for recorder in recorders:
+        if recorder.mode == "passthrough":
+            streamer.jpeg_callbacks.append(recorder.write_jpeg)
+    streamer.start(on_frame)
+    logging.info("Receiving from %s:%d", config.cam_ip, config.cam_video_port)
+    started = last = time.monotonic()
+    last_frames = last_packets = last_bytes = 0
+    try:
+        while not args.duration or time.monotonic() - started < args.duration:
+            time.sleep(0.5)
+            if replay_requested.is_set():
+                replay_requested.clear()
+                save_replay(streamer.history, args.replay_dir)
+            now = time.monotonic()
+            if now - last < args.stats_interval:
+                continue
+            with lock:
+                total_frames = frames
+            elapsed = now - last
+            metrics = streamer.metrics
+            logging.info(
+                "%.1f fps out, %.0f pkt/s, %.2f Mbit/s; %s",
+                (total_frames - last_frames) / elapsed,
+                (metrics.packets - last_packets) / elapsed,
+                (metrics.bytes - last_bytes) * 8 / elapsed / 1e6,
+                metrics.summary(),
+            )
+            if args.metrics:
+                metrics.export(args.metrics)
+            last, last_frames = now, total_frames
+            last_packets, last_bytes = metrics.packets, metrics.bytes
+    except KeyboardInterrupt:
+        pass
+    finally:
+        streamer.stop()
+        if relay is not None:
+            relay.stop()
+            logging.info("Relayed %d frames to %d clients", relay.published, relay.served)
+        bus, streamer.frame_bus = streamer.frame_bus, None
+        if bus is not None:
+            logging.info("Published %d frames to frame bus %s", bus.published, bus.name)
+            bus.close()
+        for sink in sinks:
+            sink.close()
+        log_recorders(recorders)
+    logging.info("Received %d frames in %.1f s", frames, time.monotonic() - started)
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # Stats go to stderr so stdout can carry the MJPEG stream.
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        stream=sys.stderr,
+    )
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
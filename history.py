@@ -0,0 +1,89 @@
+"""In-memory history of the most recent raw camera frames.
+
+The camera's frames are JPEGs of a few tens of KB, so keeping the last few
+seconds of them compressed is cheap. Nothing in the history is decoded until
+someone asks for it: a recording starts with the frames from before it was
+started, a clip of the last seconds can be saved at any time, and a
+snapshot of any recent frame decodes just that one frame.
+"""
+import bisect
+import threading
+from collections import deque
+from typing import Optional
+
+from mjpeg_writer import MjpegMkvWriter
+
+
+class FrameHistory:
+    """Ring of the raw JPEG frames of the last ``seconds``.
+
+    Frames are copied in :meth:`add` and evicted by age, and by size once
+    they take more than ``max_bytes`` together, so memory stays bounded
+    whatever the camera's bitrate.
+    """
+
+    def __init__(self, seconds: float = 10.0, max_bytes: int = 32 * 1024 * 1024):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # Frames evicted by max_bytes before they were ``seconds`` old.
+        self.evicted = 0
+        self._frames: deque[tuple[bytes, float]] = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    @property
+    def span(self) -> float:
+        """Seconds between the oldest and newest frame held."""
+        frames = self._frames
+        return frames[-1][1] - frames[0][1] if len(frames) > 1 else 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    def add(self, data, timestamp: float) -> None:
+        """Keep a copy of one frame; ``timestamp`` must not go backwards."""
+        frame = bytes(data)
+        with self._lock:
+            frames = self._frames
+            frames.append((frame, timestamp))
+            self.nbytes += len(frame)
+            while len(frames) > 1 and timestamp - frames[0][1] > self.seconds:
+                self.nbytes -= len(frames.popleft()[0])
+            while len(frames) > 1 and self.nbytes > self.max_bytes:
+                self.nbytes -= len(frames.popleft()[0])
+                self.evicted += 1
+
+    def frames(self, since: Optional[float] = None) -> list[tuple[bytes, float]]:
+        """The frames held, oldest first, optionally only those from ``since`` on."""
+        with self._lock:
+            frames = list(self._frames)
+        if since is not None:
+            frames = frames[bisect.bisect_left(frames, since, key=lambda f: f[1]):]
+        return frames
+
+    def nearest(self, timestamp: float) -> Optional[tuple[bytes, float]]:
+        """The frame that arrived closest to ``timestamp``."""
+        frames = self.frames()
+        if not frames:
+            return None
+        i = bisect.bisect_left(frames, timestamp, key=lambda f: f[1])
+        candidates = frames[max(i - 1, 0):i + 1]
+        return min(candidates, key=lambda f: abs(f[1] - timestamp))
+
+    def export(self, path: str, since: Optional[float] = None) -> int:
+        """Write the frames held to an MKV file; returns the frame count."""
+        frames = self.frames(since)
+        if not frames:
+            return 0
+        writer = MjpegMkvWriter(path)
+        try:
+            for data, timestamp in frames:
+                writer.write(data, timestamp)
+        finally:
+            writer.close()
+        return len(frames)
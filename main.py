@@ -1,11 +1,17 @@
 import argparse
 import logging
-import tkinter as tk
-from gui import CameraApp
+import sys
 
 if __name__ == "__main__":
+    if "--headless" in sys.argv[1:]:
+        # Keep tkinter out of the process entirely when there is no display.
+        from headless import main as headless_main
+
+        sys.exit(headless_main([a for a in sys.argv[1:] if a != "--headless"]))
+
     parser = argparse.ArgumentParser(description="AP Camera Receiver")
     parser.add_argument("--verbose", action="store_true", help="enable debug logging")
+    parser.add_argument("--headless", action="store_true", help="run without GUI, see headless.py --help")
     args = parser.parse_args()
 
     logging.basicConfig(
@@ -13,6 +19,9 @@ if __name__ == "__main__":
         format="%(asctime)s [%(levelname)s] %(message)s",
     )
 
+    import tkinter as tk
+    from gui import CameraApp
+
     root = tk.Tk()
     app = CameraApp(root)
     root.mainloop()
@@ -0,0 +1,150 @@
+"""Per-frame timing and throughput counters for the frame pipeline."""
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+# Pipeline stages in the order a frame passes through them.
+STAGES = ("first_packet", "complete", "decoded", "processed", "queued", "displayed", "recorded")
+DROP_REASONS = ("incomplete", "rate_limited", "decoder_busy", "corrupt", "queue_full")
+
+
+class FrameTrace:
+    """Timestamps of one frame as it moves through the pipeline."""
+
+    __slots__ = ("seq", "nbytes", "packets", "stamps")
+
+    def __init__(self, seq: int, nbytes: int, packets: int, first_packet: float, complete: float):
+        self.seq = seq
+        self.nbytes = nbytes
+        self.packets = packets
+        self.stamps = {"first_packet": first_packet, "complete": complete}
+
+
+class PipelineMetrics:
+    """Collect stage latencies and drop counters over a rolling window.
+
+    Each :meth:`mark` records how long a frame spent since the previous stage
+    it passed and since its first packet. :meth:`snapshot` turns the window
+    into percentiles; :meth:`export` appends that snapshot to a JSON lines
+    file so ``packets_per_frame`` and ``jitter_delay`` can be tuned from data.
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.started = time.monotonic()
+        self.packets = 0
+        self.bytes = 0
+        self.frames = 0
+        # Packets missing from frames, known when the header carries sequence numbers.
+        self.lost_packets = 0
+        self.dropped = dict.fromkeys(DROP_REASONS, 0)
+        # Returns buffer sizes in bytes to include in snapshots, if set.
+        self.memory_probe: Optional[Callable[[], dict]] = None
+        self._lock = threading.Lock()
+        self._stage = {stage: deque(maxlen=window) for stage in STAGES[1:]}
+        self._total = {stage: deque(maxlen=window) for stage in STAGES[1:]}
+        self._frame_bytes: deque[int] = deque(maxlen=window)
+        self._frame_packets: deque[int] = deque(maxlen=window)
+        self._arrivals: deque[float] = deque(maxlen=window)
+
+    def packet(self, nbytes: int) -> None:
+        self.packets += 1
+        self.bytes += nbytes
+
+    def drop(self, reason: str, count: int = 1) -> None:
+        with self._lock:
+            self.dropped[reason] = self.dropped.get(reason, 0) + count
+
+    def frame(self, nbytes: int, packets: int, first_packet: float, complete: float) -> FrameTrace:
+        """Start tracing a frame that has just been reassembled."""
+        with self._lock:
+            self.frames += 1
+            seq = self.frames
+        self._frame_bytes.append(nbytes)
+        self._frame_packets.append(packets)
+        self._arrivals.append(complete)
+        trace = FrameTrace(seq, nbytes, packets, first_packet, complete)
+        self._record(trace, "complete", complete, first_packet)
+        return trace
+
+    def mark(self, trace: Optional[FrameTrace], stage: str, when: Optional[float] = None) -> None:
+        """Record that ``trace`` reached ``stage`` (now, unless ``when`` is given)."""
+        if trace is None:
+            return
+        when = time.monotonic() if when is None else when
+        previous = trace.stamps["first_packet"]
+        for name in STAGES[:STAGES.index(stage)]:
+            previous = trace.stamps.get(name, previous)
+        trace.stamps[stage] = when
+        self._record(trace, stage, when, previous)
+
+    def _record(self, trace: FrameTrace, stage: str, when: float, previous: float) -> None:
+        self._stage[stage].append(when - previous)
+        self._total[stage].append(when - trace.stamps["first_packet"])
+
+    @staticmethod
+    def _percentiles(values) -> Optional[dict]:
+        if not values:
+            return None
+        import numpy as np
+
+        p50, p90, p99 = np.percentile(np.fromiter(values, dtype=float), (50, 90, 99))
+        return {"p50": p50 * 1000, "p90": p90 * 1000, "p99": p99 * 1000}
+
+    def fps(self) -> float:
+        """Frames completed per second over the window."""
+        arrivals = list(self._arrivals)
+        if len(arrivals) < 2 or arrivals[-1] <= arrivals[0]:
+            return 0.0
+        return (len(arrivals) - 1) / (arrivals[-1] - arrivals[0])
+
+    def snapshot(self) -> dict:
+        """Counters plus stage latency percentiles in milliseconds."""
+        with self._lock:
+            dropped = dict(self.dropped)
+        stages = {}
+        for stage in STAGES[1:]:
+            stage_ms = self._percentiles(list(self._stage[stage]))
+            if stage_ms:
+                stages[stage] = {"stage_ms": stage_ms, "total_ms": self._percentiles(list(self._total[stage]))}
+        frame_bytes = list(self._frame_bytes)
+        frame_packets = list(self._frame_packets)
+        return {
+            "time": time.time(),
+            "uptime": time.monotonic() - self.started,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "frames": self.frames,
+            "lost_packets": self.lost_packets,
+            "fps": self.fps(),
+            "dropped": dropped,
+            "bytes_per_frame": sum(frame_bytes) / len(frame_bytes) if frame_bytes else 0,
+            "packets_per_frame": sum(frame_packets) / len(frame_packets) if frame_packets else 0,
+            "stages": stages,
+            "memory": self.memory_probe() if self.memory_probe else {},
+        }
+
+    def summary(self) -> str:
+        """One line for logs or the GUI overlay."""
+        snap = self.snapshot()
+        parts = [f"{snap['fps']:.1f} fps", f"{snap['packets_per_frame']:.1f} pkt/frame"]
+        for stage in ("decoded", "processed", "displayed"):
+            stats = snap["stages"].get(stage)
+            if stats:
+                parts.append(f"{stage} p50 {stats['total_ms']['p50']:.0f}ms p99 {stats['total_ms']['p99']:.0f}ms")
+        drops = sum(snap["dropped"].values())
+        parts.append(f"dropped {drops}")
+        if snap["lost_packets"]:
+            parts.append(f"lost {snap['lost_packets']} pkt")
+        memory = snap["memory"]
+        if memory:
+            held = memory.get("frame_buffers", 0) + memory.get("datagram_buffers", 0)
+            parts.append(f"buffers {held // 1024} KiB")
+        return ", ".join(parts)
+
+    def export(self, path: str) -> None:
+        """Append the current snapshot to ``path`` as one JSON line."""
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(self.snapshot()) + "\n")
@@ -0,0 +1,172 @@
+"""Write camera JPEG frames into a Matroska (MKV) file without re-encoding."""
+import struct
+import threading
+from typing import Optional
+
+# Matroska element IDs used by the writer.
+EBML = b"\x1a\x45\xdf\xa3"
+SEGMENT = b"\x18\x53\x80\x67"
+INFO = b"\x15\x49\xa9\x66"
+TRACKS = b"\x16\x54\xae\x6b"
+TRACK_ENTRY = b"\xae"
+VIDEO = b"\xe0"
+CLUSTER = b"\x1f\x43\xb6\x75"
+TIMECODE = b"\xe7"
+SIMPLE_BLOCK = b"\xa3"
+DURATION = b"\x44\x89"
+
+UNKNOWN_SIZE = b"\x01\xff\xff\xff\xff\xff\xff\xff"
+# Block timecodes are signed 16-bit offsets from the cluster timecode.
+MAX_CLUSTER_MS = 30000
+
+
+def _vint(value: int) -> bytes:
+    for length in range(1, 9):
+        if value < (1 << (7 * length)) - 1:
+            return (value | (1 << (7 * length))).to_bytes(length, "big")
+    raise ValueError("EBML value too large")
+
+
+def _size8(value: int) -> bytes:
+    return (value | (1 << 56)).to_bytes(8, "big")
+
+
+def _uint(value: int) -> bytes:
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+
+
+def _element(element_id: bytes, payload: bytes) -> bytes:
+    return element_id + _vint(len(payload)) + payload
+
+
+def jpeg_size(data) -> Optional[tuple[int, int]]:
+    """Return ``(width, height)`` from a JPEG's SOF header without decoding it."""
+    data = memoryview(data)
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = (data[pos + 2] << 8) | data[pos + 3]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[pos + 5] << 8) | data[pos + 6]
+            width = (data[pos + 7] << 8) | data[pos + 8]
+            return width, height
+        pos += 2 + length
+    return None
+
+
+class MjpegMkvWriter:
+    """Mux raw JPEG frames into an MKV file with their real timestamps.
+
+    Frames are written as they arrive, with no decode or encode step. Element
+    sizes that are only known at the end start out as "unknown" and are
+    patched by :meth:`close`, so a file cut short by a crash still plays.
+    The writer is safe to use from several threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.frames = 0
+        self._fh = open(path, "wb")
+        self._lock = threading.Lock()
+        self._segment_start = 0
+        self._duration_pos = 0
+        self._cluster_pos: Optional[int] = None
+        self._cluster_ms = 0
+        self._first: Optional[float] = None
+        self._last_ms = 0
+
+    def _write_header(self, width: int, height: int) -> None:
+        fh = self._fh
+        fh.write(_element(EBML, b"".join([
+            _element(b"\x42\x86", _uint(1)),
+            _element(b"\x42\xf7", _uint(1)),
+            _element(b"\x42\xf2", _uint(4)),
+            _element(b"\x42\xf3", _uint(8)),
+            _element(b"\x42\x82", b"matroska"),
+            _element(b"\x42\x87", _uint(4)),
+            _element(b"\x42\x85", _uint(2)),
+        ])))
+        fh.write(SEGMENT + UNKNOWN_SIZE)
+        self._segment_start = fh.tell()
+        info = b"".join([
+            _element(b"\x2a\xd7\xb1", _uint(1000000)),
+            _element(b"\x4d\x80", b"noname-ap-cam-receiver"),
+            _element(b"\x57\x41", b"noname-ap-cam-receiver"),
+        ])
+        # Duration is patched in place on close.
+        duration = _element(DURATION, struct.pack(">d", 0.0))
+        fh.write(INFO + _vint(len(info) + len(duration)) + info)
+        self._duration_pos = fh.tell() + len(DURATION) + 1
+        fh.write(duration)
+        video = _element(VIDEO, _element(b"\xb0", _uint(width)) + _element(b"\xba", _uint(height)))
+        track = _element(TRACK_ENTRY, b"".join([
+            _element(b"\xd7", _uint(1)),
+            _element(b"\x73\xc5", _uint(1)),
+            _element(b"\x83", _uint(1)),
+            _element(b"\x9c", _uint(0)),
+            _element(b"\x86", b"V_MJPEG"),
+            video,
+        ]))
+        fh.write(_element(TRACKS, track))
+
+    def _close_cluster(self) -> None:
+        if self._cluster_pos is None:
+            return
+        end = self._fh.tell()
+        self._fh.seek(self._cluster_pos + len(CLUSTER))
+        self._fh.write(_size8(end - self._cluster_pos - len(CLUSTER) - 8))
+        self._fh.seek(end)
+        self._cluster_pos = None
+
+    def write(self, data, timestamp: float) -> Optional[int]:
+        """Append one JPEG frame captured at ``timestamp`` seconds.
+
+        Returns the file offset of the JPEG data, e.g. for an index, or
+        ``None`` if the frame was not written.
+        """
+        with self._lock:
+            if self._fh.closed:
+                return None
+            if self._first is None:
+                size = jpeg_size(data)
+                if size is None:
+                    return None
+                self._write_header(*size)
+                self._first = timestamp
+            ms = max(int(round((timestamp - self._first) * 1000)), self._last_ms)
+            if self._cluster_pos is None or ms - self._cluster_ms > MAX_CLUSTER_MS:
+                self._close_cluster()
+                self._cluster_pos = self._fh.tell()
+                self._cluster_ms = ms
+                self._fh.write(CLUSTER + UNKNOWN_SIZE + _element(TIMECODE, _uint(ms)))
+            header = b"\x81" + struct.pack(">hB", ms - self._cluster_ms, 0x80)
+            self._fh.write(SIMPLE_BLOCK + _vint(len(header) + len(data)) + header)
+            offset = self._fh.tell()
+            self._fh.write(data)
+            self._last_ms = ms
+            self.frames += 1
+            return offset
+
+    def flush(self) -> None:
+        """Push written frames to the OS so other readers can see them."""
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh.closed:
+                return
+            if self._first is not None:
+                self._close_cluster()
+                end = self._fh.tell()
+                self._fh.seek(self._segment_start - 8)
+                self._fh.write(_size8(end - self._segment_start))
+                self._fh.seek(self._duration_pos)
+                self._fh.write(struct.pack(">d", float(self._last_ms)))
+            self._fh.close()
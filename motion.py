@@ -0,0 +1,209 @@
+"""Motion detection and motion-gated recording."""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Optional
+
+from PIL import Image
+
+from recorder import Recorder
+
+# OpenCV and NumPy are imported on first use to keep startup fast.
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class MotionDetector:
+    """Cheap frame-difference motion detection.
+
+    Each frame is box-reduced to about ``width`` columns, converted to
+    grayscale and lightly blurred; the score is the percentage of pixels that
+    changed by more than ``pixel_threshold`` (0-255) since the previous frame.
+    A frame shows motion when its score reaches ``threshold``. A frame
+    carrying a ``"motion"`` output from the processor (see
+    :meth:`output_size`) is used as it is instead of being reduced again.
+    """
+
+    def __init__(self, threshold: float = 1.0, pixel_threshold: int = 25, width: int = 160):
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self.score = 0.0
+        self._prev: Optional[np.ndarray] = None
+
+    def reset(self) -> None:
+        self._prev = None
+        self.score = 0.0
+
+    def output_size(self, size: tuple[int, int]) -> tuple[int, int]:
+        """Size of the processor output to score, for frames of ``size``."""
+        width, height = size
+        return self.width, max(round(self.width * height / width), 1)
+
+    def _thumbnail(self, img: Image.Image) -> np.ndarray:
+        import cv2
+        import numpy as np
+
+        small = img.info.get("outputs", {}).get("motion")
+        if small is None:
+            factor = max(img.width // self.width, 1)
+            small = img.reduce(factor) if factor > 1 else img
+        gray = np.asarray(small.convert("L"))
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def detect(self, img: Image.Image) -> bool:
+        """Score ``img`` against the previous frame; return whether it moved."""
+        import cv2
+        import numpy as np
+
+        gray = self._thumbnail(img)
+        prev, self._prev = self._prev, gray
+        if prev is None or prev.shape != gray.shape:
+            self.score = 0.0
+            return False
+        diff = cv2.absdiff(gray, prev)
+        self.score = float(np.count_nonzero(diff > self.pixel_threshold)) * 100.0 / diff.size
+        return self.score >= self.threshold
+
+
+def event_path(path: str, timestamp: float) -> str:
+    """``path`` with the local wall-clock time of an event added to the name."""
+    base, ext = os.path.splitext(path)
+    return f"{base}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(timestamp))}{ext}"
+
+
+class MotionRecorder:
+    """Record only around motion, with pre- and post-roll.
+
+    Stands in for a :class:`Recorder`: frames go to :meth:`write_frame`
+    (encode mode) or :meth:`write_jpeg` (passthrough). Decoded frames must
+    carry ``img.info["motion"]`` from a :class:`MotionDetector` running in the
+    streamer. While the scene is still, the last ``pre_roll`` seconds of
+    frames are kept in memory; when motion starts, ``make_recorder`` is
+    called with the event's wall-clock time, the pre-roll is written first
+    and ``snapshot`` gets the triggering frame and the same time. Without ``make_recorder``
+    only snapshots are taken. The recording is stopped once
+    nothing has moved for ``post_roll`` seconds, so every event ends up in
+    its own file.
+
+    In passthrough mode the raw frames are kept and written, and the decoded
+    frames only drive the motion state, so :meth:`write_frame` must be
+    called with them too.
+    """
+
+    def __init__(
+        self,
+        make_recorder: Optional[Callable[[float], Recorder]],
+        mode: str = "encode",
+        pre_roll: float = 2.0,
+        post_roll: float = 5.0,
+        snapshot: Optional[Callable[[Image.Image, float], None]] = None,
+        on_complete: Optional[Callable[["MotionRecorder"], None]] = None,
+    ):
+        self.make_recorder = make_recorder
+        self.mode = mode
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.snapshot = snapshot
+        self.on_complete = on_complete
+        self.events = 0
+        self.active = False
+        self.recorder: Optional[Recorder] = None
+        self._recorders: list[Recorder] = []
+        self._pre: deque = deque()
+        self._last_motion: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    @property
+    def files(self) -> list[str]:
+        return [path for recorder in self._recorders for path in recorder.files]
+
+    @property
+    def written(self) -> int:
+        return sum(recorder.written for recorder in self._recorders)
+
+    @property
+    def dropped(self) -> int:
+        return sum(recorder.dropped for recorder in self._recorders)
+
+    def write_frame(self, img: Image.Image, timestamp: float) -> None:
+        with self._lock:
+            if self._stopped:
+                return
+            if img.info.get("motion"):
+                if not self.active:
+                    # Arrival times are monotonic; events are named after the wall clock.
+                    wall = time.time() - (time.monotonic() - timestamp)
+                    self._start(wall)
+                    if self.snapshot:
+                        try:
+                            self.snapshot(img, wall)
+                        except Exception:
+                            logging.exception("Saving motion snapshot failed")
+                self._last_motion = timestamp
+            if self.mode == "encode":
+                self._add((img, timestamp))
+            self._expire(timestamp)
+
+    def write_jpeg(self, data, timestamp: float) -> None:
+        with self._lock:
+            if not self._stopped:
+                self._add((bytes(data), timestamp))
+                self._expire(timestamp)
+
+    def _add(self, item: tuple) -> None:
+        if self.recorder is not None:
+            if self.mode == "encode":
+                self.recorder.write_frame(*item)
+            else:
+                self.recorder.write_jpeg(*item)
+        elif not self.active and self.make_recorder:
+            self._pre.append(item)
+            while self._pre and item[1] - self._pre[0][1] > self.pre_roll:
+                self._pre.popleft()
+
+    def _start(self, wall: float) -> None:
+        self.active = True
+        self.events += 1
+        if self.make_recorder is None:
+            logging.info("Motion detected")
+            return
+        self.recorder = self.make_recorder(wall)
+        self._recorders.append(self.recorder)
+        logging.info("Motion detected, recording %s", self.recorder.path)
+        pre, self._pre = self._pre, deque()
+        for item in pre:
+            self._add(item)
+
+    def _expire(self, timestamp: float) -> None:
+        if self.active and timestamp - self._last_motion > self.post_roll:
+            logging.info("Motion ended, %d events so far", self.events)
+            self.active = False
+            if self.recorder is not None:
+                self.recorder.stop()
+                self.recorder = None
+
+    def stop(self) -> None:
+        """Finish the current event; ``on_complete`` runs once all files are written."""
+        with self._lock:
+            self._stopped = True
+            self.active = False
+            self._pre.clear()
+            if self.recorder is not None:
+                self.recorder.stop()
+                self.recorder = None
+        if self.on_complete:
+            threading.Thread(target=self._complete, name="motion-recorder", daemon=True).start()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        for recorder in list(self._recorders):
+            recorder.join(timeout)
+
+    def _complete(self) -> None:
+        self.join()
+        self.on_complete(self)
@@ -0,0 +1,68 @@
+"""Frame-rate limiting and jitter smoothing for the receive pipeline."""
+
+
+class FramePacer:
+    """Decide which frames get decoded and when decoded frames are released.
+
+    :meth:`admit` runs on the receive path for every complete frame. With a
+    ``target_fps`` it lets frames through in proportion to the measured
+    arrival rate, e.g. two out of three from a 30 fps camera at a 20 fps
+    target, so surplus frames are dropped before any decoding work is done.
+    ``target_fps`` 0 admits everything.
+
+    :meth:`release_time` drives the jitter buffer: decoded frames are spaced
+    by the smoothed arrival interval, but never held more than
+    ``jitter_delay`` seconds past their arrival. The caller waits on its own
+    timer, so the receive thread never sleeps.
+    """
+
+    # Weight of the newest sample in the smoothed arrival interval.
+    SMOOTHING = 0.1
+
+    def __init__(self, target_fps: float = 0.0, jitter_delay: float = 0.0):
+        self.target_fps = target_fps
+        self.jitter_delay = jitter_delay
+        self.interval = 0.0
+        self._credit = 1.0
+        self._last_arrival = None
+        self._last_release = None
+
+    def reset(self) -> None:
+        self.interval = 0.0
+        self._credit = 1.0
+        self._last_arrival = None
+        self._last_release = None
+
+    def admit(self, now: float) -> bool:
+        """Record a frame arrival at ``now``; return whether to decode it."""
+        if self._last_arrival is not None:
+            elapsed = now - self._last_arrival
+            if self.interval:
+                self.interval += (elapsed - self.interval) * self.SMOOTHING
+            else:
+                self.interval = elapsed
+            if self.target_fps > 0:
+                self._credit += elapsed * self.target_fps
+        self._last_arrival = now
+        if self.target_fps <= 0:
+            return True
+        if self._credit < 1.0 - 1e-3:
+            return False
+        # Bank at most one frame of leftover credit so a burst after a gap
+        # is not let through in full.
+        self._credit = min(self._credit - 1.0, 1.0)
+        return True
+
+    def release_time(self, timestamp: float, now: float) -> float:
+        """When to hand on a frame that arrived at ``timestamp``."""
+        if self.jitter_delay <= 0 or self._last_release is None:
+            release = now
+        else:
+            spacing = self.interval
+            if self.target_fps > 0:
+                spacing = max(spacing, 1.0 / self.target_fps)
+            release = self._last_release + spacing
+            release = min(max(release, timestamp), timestamp + self.jitter_delay)
+            release = max(release, now)
+        self._last_release = release
+        return release
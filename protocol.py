@@ -0,0 +1,326 @@
+"""Camera packet header fields and sequence-based frame reassembly.
+
+Every datagram starts with ``header_bytes`` of camera header. Its layout is
+not documented, so the positions of the packet sequence number and the frame
+id are configured (``seq_offset`` and ``frame_id_offset`` in the config) rather
+than assumed. ``python protocol.py --pcap capture.pcap`` lists the header
+fields that behave like either, to fill those in from a real capture.
+
+With a sequence field, :class:`SequencedAssembler` replaces the marker-based
+:class:`assembler.FrameAssembler`: packets are put in order by sequence
+number, gaps are detected, and a frame is only handed on once every packet
+from its SOI to its EOI is present. Frames with a missing packet are
+discarded without ever being decoded.
+"""
+import argparse
+import bisect
+import logging
+import sys
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Optional
+
+from assembler import EOI, SOI, FramePool
+
+
+@dataclass(frozen=True)
+class HeaderLayout:
+    """Where the sequence number and frame id sit in the camera header."""
+
+    seq_offset: int = -1
+    seq_bytes: int = 2
+    frame_id_offset: int = -1
+    frame_id_bytes: int = 2
+    byteorder: str = "little"
+
+    @classmethod
+    def from_config(cls, config) -> "HeaderLayout":
+        return cls(
+            config.seq_offset,
+            config.seq_bytes,
+            config.frame_id_offset,
+            config.frame_id_bytes,
+            config.header_byteorder,
+        )
+
+    @property
+    def sequenced(self) -> bool:
+        return self.seq_offset >= 0
+
+    def seq(self, header) -> int:
+        return int.from_bytes(header[self.seq_offset:self.seq_offset + self.seq_bytes], self.byteorder)
+
+    def frame_id(self, header) -> Optional[int]:
+        if self.frame_id_offset < 0:
+            return None
+        start = self.frame_id_offset
+        return int.from_bytes(header[start:start + self.frame_id_bytes], self.byteorder)
+
+    def pack(self, header_bytes: int, seq: int, frame_id: int) -> bytes:
+        """Build a header carrying ``seq`` and ``frame_id``, e.g. for replay."""
+        header = bytearray(header_bytes)
+        if self.seq_offset >= 0:
+            field = (seq % (1 << 8 * self.seq_bytes)).to_bytes(self.seq_bytes, self.byteorder)
+            header[self.seq_offset:self.seq_offset + self.seq_bytes] = field
+        if self.frame_id_offset >= 0:
+            field = (frame_id % (1 << 8 * self.frame_id_bytes)).to_bytes(self.frame_id_bytes, self.byteorder)
+            header[self.frame_id_offset:self.frame_id_offset + self.frame_id_bytes] = field
+        return bytes(header)
+
+
+def _ends_frame(payload: bytes) -> int:
+    """Length up to and including a trailing EOI, or -1 if there is none.
+
+    Only zero padding may follow the EOI, so an EOI inside an embedded
+    thumbnail does not end the frame.
+    """
+    eoi = payload.rfind(EOI)
+    if eoi < 0 or payload[eoi + 2:].strip(b"\0"):
+        return -1
+    return eoi + 2
+
+
+class SequencedAssembler:
+    """Reassemble frames from packets ordered by their header sequence number.
+
+    Drop-in for :class:`assembler.FrameAssembler`: feed datagrams, take
+    completed frames from :attr:`ready` as memoryviews that stay valid until
+    ``slots - 1`` further frames are assembled.
+
+    Packets are held by sequence number until a run from an SOI packet to an
+    EOI packet is complete. Once a later frame completes, anything older that
+    is still incomplete is discarded: those frames count in :attr:`dropped`
+    and their missing packets in :attr:`lost`. At most ``max_frames`` frames
+    and ``window`` packets are held, so a lost EOI cannot pile up memory.
+    Packets older than the last completed frame count in :attr:`late`.
+    Until the first frame completes, packets may still arrive out of order by
+    up to ``window`` before the first one received.
+    """
+
+    def __init__(
+        self,
+        layout: HeaderLayout,
+        header_bytes: int,
+        max_frame_size: int = 8 * 1024 * 1024,
+        slots: int = 4,
+        slot_size: int = 256 * 1024,
+        max_frames: int = 3,
+        window: int = 2048,
+    ):
+        self.layout = layout
+        self.header_bytes = header_bytes
+        self.max_frame_size = max_frame_size
+        self.max_frames = max_frames
+        self.window = window
+        self.pool = FramePool(max(slots, 2), min(slot_size, max_frame_size))
+        self._index = 0
+        self._modulus = 1 << 8 * layout.seq_bytes
+        self.dropped = 0
+        self.oversized = 0
+        self.lost = 0
+        self.late = 0
+        self.duplicates = 0
+        self.ready: deque[memoryview] = deque()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget pending packets and output; the next packet starts afresh."""
+        self.ready.clear()
+        self._packets: dict[int, tuple[bytes, Optional[int]]] = {}
+        self._starts: list[int] = []
+        self._ends: list[int] = []
+        self._last: Optional[int] = None
+        self._floor = 0
+        # The floor is only a guess until a frame completes or packets are
+        # discarded; an earlier packet lowers it instead of counting as late.
+        self._provisional = True
+
+    def _unwrap(self, raw: int) -> int:
+        """Map a wrapping header sequence number onto an ever-growing count."""
+        if self._last is None:
+            self._last = self._floor = raw
+            return raw
+        delta = (raw - self._last) % self._modulus
+        if delta >= self._modulus // 2:
+            delta -= self._modulus
+        n = self._last + delta
+        self._last = max(self._last, n)
+        return n
+
+    def feed(self, packet) -> None:
+        """Add one datagram."""
+        view = memoryview(packet)
+        if len(view) <= self.header_bytes:
+            return
+        header = view[:self.header_bytes]
+        n = self._unwrap(self.layout.seq(header))
+        if n < self._floor:
+            if not self._provisional or self._last - n > self.window:
+                self.late += 1
+                return
+            self._floor = n
+        if n in self._packets:
+            self.duplicates += 1
+            return
+        payload = bytes(view[self.header_bytes:])
+        end = _ends_frame(payload)
+        if end >= 0:
+            payload = payload[:end]
+            bisect.insort(self._ends, n)
+        if payload.startswith(SOI):
+            bisect.insort(self._starts, n)
+        self._packets[n] = (payload, self.layout.frame_id(header))
+        if self._ends and n <= self._ends[-1]:
+            # Only an EOI packet or one filling a gap before it completes a frame.
+            self._complete()
+        if len(self._starts) > self.max_frames:
+            # Too many frames open: the oldest ones will never complete.
+            self._discard(self._starts[-self.max_frames])
+        elif self._last - self._floor > self.window:
+            self._discard(self._last - self.window)
+
+    def _complete(self) -> None:
+        """Hand on the newest frame whose packets are all present."""
+        for end in reversed(self._ends):
+            i = bisect.bisect_right(self._starts, end) - 1
+            if i < 0:
+                continue
+            start = self._starts[i]
+            if all(n in self._packets for n in range(start, end + 1)):
+                break
+        else:
+            return
+        self._discard(start)
+        packets = [self._packets.pop(n) for n in range(start, end + 1)]
+        del self._starts[:bisect.bisect_right(self._starts, end)]
+        del self._ends[:bisect.bisect_right(self._ends, end)]
+        self._floor = end + 1
+        self._provisional = False
+        if len({frame_id for _, frame_id in packets}) > 1:
+            # The SOI and EOI belong to different frames of the camera.
+            self.dropped += 1
+        else:
+            self._emit([payload for payload, _ in packets])
+
+    def _discard(self, floor: int) -> None:
+        """Drop everything below sequence number ``floor``."""
+        if floor <= self._floor:
+            return
+        starts = bisect.bisect_left(self._starts, floor)
+        ends = bisect.bisect_left(self._ends, floor)
+        self.dropped += max(starts, ends)
+        del self._starts[:starts]
+        del self._ends[:ends]
+        present = 0
+        if floor - self._floor > len(self._packets):
+            # A big jump, e.g. after the camera restarted its counter.
+            for n in [n for n in self._packets if n < floor]:
+                del self._packets[n]
+                present += 1
+        else:
+            for n in range(self._floor, floor):
+                if self._packets.pop(n, None) is not None:
+                    present += 1
+        self.lost += floor - self._floor - present
+        self._floor = floor
+        self._provisional = False
+
+    def _emit(self, payloads: list[bytes]) -> None:
+        size = sum(len(payload) for payload in payloads)
+        if size > self.max_frame_size:
+            self.dropped += 1
+            self.oversized += 1
+            return
+        slot = self.pool.buffers[self._index]
+        if len(slot) < size:
+            slot = self.pool.grow(self._index, 1 << (size - 1).bit_length(), in_place=False)
+        pos = 0
+        for payload in payloads:
+            slot[pos:pos + len(payload)] = payload
+            pos += len(payload)
+        if len(self.ready) >= len(self.pool.buffers) - 1:
+            self.ready.popleft()
+            self.dropped += 1
+        self.ready.append(memoryview(slot)[:size])
+        self.pool.record(size)
+        self._index = (self._index + 1) % len(self.pool.buffers)
+        self.pool.trim(self._index)
+
+
+def detect(payloads: list[bytes], header_bytes: int, widths: tuple[int, ...] = (1, 2, 4)) -> list[dict]:
+    """Find header fields that behave like a sequence number or a frame id.
+
+    A sequence field goes up by one from packet to packet; a frame id stays
+    the same within a frame (split at packets starting with SOI) and goes up
+    by one from frame to frame. Returns candidates with the share of packets
+    that fit, best first. Bytes that never change in the capture are left
+    out of the fields, so a counter's high bytes may be missing from a short
+    capture.
+    """
+    packets = [p for p in payloads if len(p) > header_bytes]
+    if len(packets) < 2:
+        return []
+    starts = [p[header_bytes:header_bytes + 2] == SOI for p in packets]
+    varying = [len({p[i] for p in packets}) > 1 for i in range(header_bytes)]
+    candidates = []
+    for width in widths:
+        modulus = 1 << 8 * width
+        for offset in range(0, header_bytes - width + 1):
+            if not all(varying[offset:offset + width]):
+                continue
+            for byteorder in ("little", "big") if width > 1 else ("little",):
+                values = [int.from_bytes(p[offset:offset + width], byteorder) for p in packets]
+                if len(set(values)) < 2:
+                    continue
+                steps = Counter((b - a) % modulus for a, b in zip(values, values[1:]))
+                seq_score = steps[1] / (len(values) - 1)
+                same = next_frame = boundaries = 0
+                for i in range(1, len(values)):
+                    step = (values[i] - values[i - 1]) % modulus
+                    if starts[i]:
+                        boundaries += 1
+                        next_frame += step == 1
+                    else:
+                        same += step == 0
+                frame_score = 0.0
+                if boundaries:
+                    frame_score = (same + next_frame) / (len(values) - 1)
+                for field, score in (("seq", seq_score), ("frame_id", frame_score)):
+                    if score >= 0.5:
+                        candidates.append({
+                            "field": field,
+                            "offset": offset,
+                            "bytes": width,
+                            "byteorder": byteorder,
+                            "score": score,
+                        })
+    candidates.sort(key=lambda c: (-c["score"], -c["bytes"]))
+    return candidates
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Print the header fields of a capture that look like sequence numbers."""
+    from replay import add_source_arguments, load_packets
+
+    parser = argparse.ArgumentParser(description="Find the sequence fields of the camera header")
+    add_source_arguments(parser)
+    parser.add_argument("--limit", type=int, default=5, help="candidates to show per field")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+
+    payloads = [data for _, data in load_packets(args)]
+    candidates = detect(payloads, args.header_bytes)
+    if not candidates:
+        print("No sequence-like fields found; check --header-bytes and --camera-port")
+        return 1
+    for field in ("seq", "frame_id"):
+        for c in [c for c in candidates if c["field"] == field][:args.limit]:
+            print(
+                f"{field:<8} offset {c['offset']:>2}  {c['bytes']} bytes  {c['byteorder']:<6}  "
+                f"{c['score'] * 100:.1f}% of packets fit"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
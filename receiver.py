@@ -0,0 +1,227 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+from typing import Optional
+
+MAX_DATAGRAM = 65535
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+# Makes Linux report the full length of a datagram that did not fit.
+MSG_TRUNC = getattr(socket, "MSG_TRUNC", 0)
+_SOCKADDR_SIZE = 28
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_recvmmsg():
+    if not hasattr(socket, "AF_INET") or os.name != "posix":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        func = libc.recvmmsg
+    except (OSError, AttributeError, TypeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    func.restype = ctypes.c_int
+    return func
+
+
+_recvmmsg = _load_recvmmsg()
+
+
+class DatagramReceiver:
+    """Receive UDP datagrams in batches.
+
+    ``mode`` selects how the socket is drained:
+
+    * ``"recvmmsg"`` pulls up to ``batch`` datagrams per syscall (Linux only).
+    * ``"drain"`` reads non-blocking until the socket is empty.
+    * ``"single"`` reads one datagram per call.
+    * ``"auto"`` uses ``recvmmsg`` when libc provides it and ``drain`` otherwise.
+
+    With ``source`` set, datagrams from any other IP address are discarded;
+    leave it unset when the socket is connected and the kernel already filters.
+    The returned memoryviews are only valid until the next :meth:`recv` call.
+    Anything sent to the other end of the ``wakeup`` socket, e.g. one of a
+    :func:`socket.socketpair`, makes a waiting :meth:`recv` return early.
+
+    Each of the ``batch`` buffers starts at ``max_size`` bytes. A datagram
+    that does not fit is dropped, counted in :attr:`truncated`, and the
+    buffers grow to hold it, up to :data:`MAX_DATAGRAM`; they never shrink,
+    so their size settles at the camera's largest datagram.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        mode: str = "auto",
+        batch: int = 32,
+        max_size: int = MAX_DATAGRAM,
+        source: Optional[str] = None,
+        wakeup: Optional[socket.socket] = None,
+    ):
+        if mode == "auto":
+            mode = "recvmmsg" if _recvmmsg else "drain"
+        elif mode == "recvmmsg" and not _recvmmsg:
+            raise OSError(errno.ENOSYS, "recvmmsg is not available on this platform")
+        self.sock = sock
+        self.mode = mode
+        self.batch = 1 if mode == "single" else max(batch, 1)
+        self.source = source
+        self.wakeup = wakeup
+        self.truncated = 0
+        self._allocate(min(max(max_size, 1), MAX_DATAGRAM))
+
+    @property
+    def buffer_bytes(self) -> int:
+        return len(self._buffer)
+
+    def _allocate(self, max_size: int) -> None:
+        # Views returned earlier keep the old buffer alive until released.
+        self.max_size = max_size
+        self._buffer = bytearray(self.batch * max_size)
+        self._view = memoryview(self._buffer)
+        self._slots = [self._view[i * max_size:(i + 1) * max_size] for i in range(self.batch)]
+        if self.mode == "recvmmsg":
+            self._setup_mmsg()
+
+    def _fits(self, nbytes: int) -> bool:
+        """Whether a datagram of ``nbytes`` was received whole; grow if not."""
+        if nbytes <= self.max_size:
+            return True
+        self.truncated += 1
+        self._grow(nbytes)
+        return False
+
+    def _grow(self, nbytes: int) -> None:
+        if self.max_size < MAX_DATAGRAM:
+            size = 1 << (min(nbytes, MAX_DATAGRAM) - 1).bit_length()
+            self._allocate(min(size, MAX_DATAGRAM))
+
+    def _setup_mmsg(self) -> None:
+        base = ctypes.addressof(ctypes.c_char.from_buffer(self._buffer))
+        self._iovecs = (_IoVec * self.batch)()
+        self._names = ctypes.create_string_buffer(_SOCKADDR_SIZE * self.batch)
+        names = ctypes.addressof(self._names)
+        self._msgs = (_MMsgHdr * self.batch)()
+        for i in range(self.batch):
+            self._iovecs[i].iov_base = base + i * self.max_size
+            self._iovecs[i].iov_len = self.max_size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = names + i * _SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+
+    def recv(self, timeout: float = 0.5) -> list[memoryview]:
+        """Return the datagrams available now, waiting up to ``timeout`` for the first."""
+        if self.mode == "single":
+            return self._recv_single(timeout)
+        packets = self._recv_mmsg() if self.mode == "recvmmsg" else self._recv_drain()
+        if packets is None:
+            if not self._wait(timeout):
+                return []
+            packets = self._recv_mmsg() if self.mode == "recvmmsg" else self._recv_drain()
+        return packets or []
+
+    def _wait(self, timeout: float) -> bool:
+        """Whether the socket became readable; ``False`` on timeout or wakeup."""
+        sockets = [self.sock] if self.wakeup is None else [self.sock, self.wakeup]
+        try:
+            readable, _, _ = select.select(sockets, [], [], timeout)
+        except ValueError:
+            # The socket was closed from another thread.
+            raise OSError(errno.EBADF, "socket closed")
+        if self.wakeup is not None and self.wakeup in readable:
+            try:
+                while self.wakeup.recv(64):
+                    pass
+            except BlockingIOError:
+                pass
+            return False
+        return bool(readable)
+
+    def _accept(self, addr) -> bool:
+        return self.source is None or addr[0] == self.source
+
+    def _recvfrom(self, slot: memoryview):
+        try:
+            return self.sock.recvfrom_into(slot, self.max_size, MSG_DONTWAIT | MSG_TRUNC)
+        except OSError as exc:
+            # Windows reports a datagram larger than the buffer as an error.
+            if getattr(exc, "winerror", None) != 10040:
+                raise
+            return MAX_DATAGRAM, None
+
+    def _recv_single(self, timeout: float) -> list[memoryview]:
+        if not self._wait(timeout):
+            return []
+        try:
+            nbytes, addr = self._recvfrom(self._slots[0])
+        except BlockingIOError:
+            return []
+        if not self._fits(nbytes):
+            return []
+        return [self._slots[0][:nbytes]] if self._accept(addr) else []
+
+    def _recv_drain(self) -> Optional[list[memoryview]]:
+        packets = []
+        for slot in self._slots:
+            try:
+                nbytes, addr = self._recvfrom(slot)
+            except BlockingIOError:
+                break
+            if not self._fits(nbytes):
+                # The buffers were replaced; the packets so far stay valid.
+                break
+            if self._accept(addr):
+                packets.append(slot[:nbytes])
+        return packets if packets else None
+
+    def _recv_mmsg(self) -> Optional[list[memoryview]]:
+        for i in range(self.batch):
+            self._msgs[i].msg_hdr.msg_namelen = _SOCKADDR_SIZE
+        count = _recvmmsg(self.sock.fileno(), self._msgs, self.batch, MSG_DONTWAIT | MSG_TRUNC, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return None
+            raise OSError(err, os.strerror(err))
+        packets = []
+        names = ctypes.addressof(self._names)
+        oversized = 0
+        for i in range(count):
+            nbytes = self._msgs[i].msg_len
+            if nbytes > self.max_size:
+                self.truncated += 1
+                oversized = max(oversized, nbytes)
+                continue
+            if self.source is not None:
+                # sockaddr_in: family, port, then the IPv4 address at offset 4.
+                addr = socket.inet_ntoa(ctypes.string_at(names + i * _SOCKADDR_SIZE + 4, 4))
+                if addr != self.source:
+                    continue
+            packets.append(self._slots[i][:nbytes])
+        if oversized:
+            # Grow only after the batch was read out of the old buffers.
+            self._grow(oversized)
+        return packets
@@ -0,0 +1,313 @@
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from PIL import Image
+
+from metrics import PipelineMetrics
+from mjpeg_writer import MjpegMkvWriter
+from store import IndexWriter, RecordingStore
+
+# Frames buffered to measure the stream rate before the encoder is opened.
+FPS_PROBE_FRAMES = 10
+DEFAULT_FPS = 20.0
+# Quality of decoded frames compressed for a RecordingStore.
+JPEG_QUALITY = 90
+
+
+def convert_to_mpg(path: str) -> str:
+    """Convert an AVI recording to MPG using ffmpeg."""
+    import shutil
+    import subprocess
+
+    if shutil.which("ffmpeg") is None:
+        return path
+    base = os.path.splitext(path)[0]
+    mpg_path = f"{base}.mpg"
+    cmd = ["ffmpeg", "-y", "-i", path, mpg_path]
+    try:
+        subprocess.run(
+            cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        os.remove(path)
+        return mpg_path
+    except Exception:
+        return path
+
+
+class Recorder:
+    """Write frames to disk on a background thread.
+
+    ``mode`` is ``"encode"`` to encode decoded frames with OpenCV, or
+    ``"passthrough"`` to mux raw camera JPEGs into MKV. The write methods
+    never block: when the bounded queue is full the frame is dropped and
+    counted in :attr:`dropped`. In encode mode the frame rate is measured from
+    the first frames' timestamps unless ``fps`` is given.
+
+    With ``segment_seconds`` set, output rotates to a new numbered file after
+    that much stream time. ``on_complete`` is called from the worker thread
+    with the recorder once :meth:`stop` has drained the queue and any MPG
+    conversion has finished; :attr:`files` then lists the output.
+
+    With ``metrics`` given, encoded frames carrying ``img.info["trace"]`` are
+    marked as recorded once they are written.
+
+    With a ``store``, every frame goes into its indexed segments as a JPEG
+    instead (decoded frames are compressed first), segments last
+    ``store.segment_seconds`` and old ones are pruned after each segment.
+
+    Live frames that are not newer than the last frame passed to
+    :meth:`write_history` are skipped, so frames in both are recorded once.
+
+    If the video file cannot be opened, :attr:`failed` is set and the
+    remaining frames are dropped.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = "encode",
+        fps: Optional[float] = None,
+        fourcc: str = "XVID",
+        segment_seconds: float = 0.0,
+        convert: bool = False,
+        queue_size: int = 64,
+        on_complete: Optional[Callable[["Recorder"], None]] = None,
+        metrics: Optional[PipelineMetrics] = None,
+        store: Optional[RecordingStore] = None,
+    ):
+        self.path = path
+        self.mode = mode
+        self.fps = fps
+        self.fourcc = fourcc
+        self.segment_seconds = store.segment_seconds if store else segment_seconds
+        self.store = store
+        self.convert = convert
+        self.on_complete = on_complete
+        self.metrics = metrics
+        self.files: list[str] = []
+        self.written = 0
+        self.dropped = 0
+        self.failed = False
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._index: Optional[IndexWriter] = None
+        self._size: Optional[tuple[int, int]] = None
+        self._resize_logged = False
+        # Turns monotonic frame timestamps into wall-clock time for the store.
+        self._clock = time.time() - time.monotonic()
+        self._segment = 0
+        self._segment_path = ""
+        self._segment_start: Optional[float] = None
+        self._history_end: Optional[float] = None
+        self._probe: list[tuple[Image.Image, float]] = []
+        self._converters: list[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def write_frame(self, img: Image.Image, timestamp: float) -> None:
+        """Queue a decoded frame (encode mode)."""
+        self._put((img, timestamp))
+
+    def write_jpeg(self, data, timestamp: float) -> None:
+        """Queue a raw JPEG frame (passthrough mode); ``data`` is copied."""
+        self._put((bytes(data), timestamp))
+
+    def write_history(
+        self,
+        frames: list[tuple[bytes, float]],
+        decode: Optional[Callable[[bytes], Image.Image]] = None,
+    ) -> None:
+        """Queue raw frames from before the recording started, oldest first.
+
+        Call before any live frame. The frames go in as one item, so the
+        queue bound does not drop them; in encode mode each is decoded with
+        ``decode`` on the worker thread.
+        """
+        if frames and (self.mode == "passthrough" or decode is not None):
+            self._queue.put((frames, decode))
+
+    def _put(self, item) -> None:
+        if self._stopping.is_set():
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self) -> None:
+        """Finish in the background; ``on_complete`` reports the result."""
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            # The worker stops once it has emptied the queue.
+            pass
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, timestamp = item
+            if isinstance(frame, list):
+                # A batch from write_history; the second field is the decoder.
+                for data, history_timestamp in frame:
+                    self._record(data, history_timestamp, timestamp)
+                self._history_end = frame[-1][1]
+            elif self._history_end is None or timestamp > self._history_end:
+                self._record(frame, timestamp)
+            if self._stopping.is_set() and self._queue.empty():
+                break
+        try:
+            if self._probe:
+                self._open_encoder(self._probe[0][0].size, self._measured_fps())
+            self._finish_segment()
+        except Exception:
+            logging.exception("Finishing recording failed")
+        for thread in self._converters:
+            thread.join()
+        if self.on_complete:
+            self.on_complete(self)
+
+    def _record(self, frame, timestamp: float, decode: Optional[Callable] = None) -> None:
+        try:
+            if decode is not None and self.mode == "encode":
+                frame = decode(frame)
+            self._write(frame, timestamp)
+        except Exception:
+            logging.exception("Recording frame failed")
+            self.dropped += 1
+
+    def _next_path(self) -> str:
+        base, ext = os.path.splitext(self.path)
+        if self.mode == "passthrough":
+            ext = ".mkv"
+        if self.segment_seconds:
+            return f"{base}_{self._segment:03d}{ext}"
+        return base + ext
+
+    def _write(self, frame, timestamp: float) -> None:
+        if self.failed:
+            self.dropped += 1
+            return
+        if self._segment_start is None:
+            self._segment_start = timestamp
+        elif self.segment_seconds and timestamp - self._segment_start >= self.segment_seconds:
+            if self._probe:
+                self._open_encoder(self._probe[0][0].size, self._measured_fps())
+            self._finish_segment()
+            self._segment += 1
+            self._segment_start = timestamp
+        if self.store is not None:
+            self._store(frame, timestamp)
+        elif self.mode == "passthrough":
+            if self._writer is None:
+                self._segment_path = self._next_path()
+                self._writer = MjpegMkvWriter(self._segment_path)
+            self._writer.write(frame, timestamp)
+        elif self._writer is None:
+            self._probe.append((frame, timestamp))
+            span = timestamp - self._probe[0][1]
+            if self.fps or len(self._probe) >= FPS_PROBE_FRAMES or span >= 1.0:
+                self._open_encoder(frame.size, self.fps or self._measured_fps())
+            return
+        else:
+            self._encode(frame)
+        self.written += 1
+
+    def _store(self, frame, timestamp: float) -> None:
+        wall = timestamp + self._clock
+        if self._writer is None:
+            self._segment_path, self._index = self.store.open_segment(wall)
+            self._writer = MjpegMkvWriter(self._segment_path)
+        if isinstance(frame, Image.Image):
+            img = frame
+            buf = io.BytesIO()
+            img.save(buf, "JPEG", quality=JPEG_QUALITY)
+            frame = buf.getvalue()
+            if self.metrics is not None:
+                self.metrics.mark(img.info.get("trace"), "recorded")
+        offset = self._writer.write(frame, timestamp)
+        if offset is not None:
+            # The frame must be readable before its index record is.
+            self._writer.flush()
+            self._index.append(wall, offset, len(frame))
+
+    def _measured_fps(self) -> float:
+        if len(self._probe) < 2:
+            return self.fps or DEFAULT_FPS
+        span = self._probe[-1][1] - self._probe[0][1]
+        if span <= 0:
+            return DEFAULT_FPS
+        return min(max((len(self._probe) - 1) / span, 1.0), 120.0)
+
+    def _open_encoder(self, size: tuple[int, int], fps: float) -> None:
+        import cv2
+
+        self._segment_path = self._next_path()
+        code = cv2.VideoWriter_fourcc(*self.fourcc)
+        writer = cv2.VideoWriter(self._segment_path, code, fps, size)
+        if not writer.isOpened():
+            # Without a file nothing can be recorded; the probe frames are dropped too.
+            logging.error("Failed to open video writer for %s", self._segment_path)
+            self.failed = True
+            self.dropped += len(self._probe)
+            self._probe = []
+            return
+        logging.debug("Recording %s at %.1f fps", self._segment_path, fps)
+        self._writer = writer
+        self._size = size
+        probe, self._probe = self._probe, []
+        for img, _ in probe:
+            self._encode(img)
+            self.written += 1
+
+    def _encode(self, img: Image.Image) -> None:
+        import cv2
+        import numpy as np
+
+        if img.size != self._size:
+            # The video size is fixed once the file is open.
+            if not self._resize_logged:
+                logging.warning("Recording %s frames into a %s video; resizing them", img.size, self._size)
+                self._resize_logged = True
+            img = img.resize(self._size, Image.BILINEAR)
+        self._writer.write(cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR))
+        if self.metrics is not None:
+            self.metrics.mark(img.info.get("trace"), "recorded")
+
+    def _finish_segment(self) -> None:
+        if self._writer is None:
+            return
+        if isinstance(self._writer, MjpegMkvWriter):
+            self._writer.close()
+        else:
+            self._writer.release()
+        self._writer = None
+        path = self._segment_path
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+            self.files.append(path)
+            self.store.prune()
+        elif self.convert and self.mode != "passthrough":
+            index = len(self.files)
+            self.files.append(path)
+
+            def convert() -> None:
+                self.files[index] = convert_to_mpg(path)
+
+            thread = threading.Thread(target=convert, name="recorder-convert", daemon=True)
+            thread.start()
+            self._converters.append(thread)
+        else:
+            self.files.append(path)
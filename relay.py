@@ -0,0 +1,331 @@
+"""Serve the camera's JPEG frames to many local viewers over HTTP.
+
+The camera tolerates few clients, so one receiver keeps the upstream session
+and :class:`MjpegRelay` hands its raw JPEG frames, without decoding or
+re-encoding, to any number of browsers or tools:
+
+* ``/`` or ``/stream.mjpg`` -- ``multipart/x-mixed-replace`` MJPEG stream
+* ``/snapshot.jpg`` -- the latest frame
+* ``/stats`` -- JSON counters per client
+"""
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+BOUNDARY = b"frame"
+# Slow clients are disconnected once they have not taken a frame for this long.
+CLIENT_TIMEOUT = 30.0
+MAX_REQUEST = 8192
+
+
+class _Client:
+    __slots__ = (
+        "sock", "addr", "request", "out", "pending", "streaming", "close_after", "writing",
+        "connected", "last_frame", "frames", "dropped", "bytes",
+    )
+
+    def __init__(self, sock: socket.socket, addr):
+        self.sock = sock
+        self.addr = addr
+        self.request = bytearray()
+        # Chunks still to send; the first one may be partly sent already.
+        self.out: deque[memoryview] = deque()
+        # Newest frame waiting until the one being sent has gone out.
+        self.pending: Optional[tuple[bytes, float]] = None
+        self.streaming = False
+        self.close_after = False
+        self.writing = False
+        self.connected = time.monotonic()
+        self.last_frame = self.connected
+        self.frames = 0
+        self.dropped = 0
+        self.bytes = 0
+
+
+class MjpegRelay:
+    """Non-blocking HTTP server fanning raw JPEG frames out to clients.
+
+    :meth:`publish` is meant to be a streamer ``jpeg_callbacks`` entry: it
+    copies the frame once and wakes the server thread, which shares that copy
+    between all clients. A client that is still sending the previous frame
+    only keeps the newest one waiting, so slow clients skip frames (counted in
+    their ``dropped`` stat) instead of holding back the others or growing a
+    backlog.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081):
+        self.host = host
+        self.port = port
+        self.published = 0
+        self.served = 0
+        self.started = time.monotonic()
+        self._latest: Optional[tuple[bytes, float]] = None
+        self._latest_seq = 0
+        self._sent_seq = 0
+        self._lock = threading.Lock()
+        self._clients: dict[int, _Client] = {}
+        self._listener: Optional[socket.socket] = None
+        self._wake_r: Optional[socket.socket] = None
+        self._wake_w: Optional[socket.socket] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self) -> None:
+        """Bind the listening socket and serve from a background thread."""
+        if self._running:
+            return
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(16)
+        listener.setblocking(False)
+        self.port = listener.getsockname()[1]
+        self._listener = listener
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(listener, selectors.EVENT_READ, "accept")
+        self._selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="mjpeg-relay", daemon=True)
+        self._thread.start()
+        logging.info("MJPEG relay on http://%s:%d/", self.host, self.port)
+
+    def stop(self) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self._wake()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def publish(self, data, timestamp: float) -> None:
+        """Offer a raw JPEG frame to all clients; ``data`` is copied."""
+        frame = bytes(data)
+        with self._lock:
+            self._latest = (frame, timestamp)
+            self._latest_seq += 1
+            self.published += 1
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            if self._wake_w:
+                self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            # Already signalled, or shutting down.
+            pass
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "uptime": now - self.started,
+            "published": self.published,
+            "served": self.served,
+            "clients": [
+                {
+                    "address": f"{c.addr[0]}:{c.addr[1]}",
+                    "seconds": now - c.connected,
+                    "frames": c.frames,
+                    "dropped": c.dropped,
+                    "bytes": c.bytes,
+                }
+                for c in list(self._clients.values())
+                if c.streaming
+            ],
+        }
+
+    # ----------------- server thread -----------------
+    def _serve(self) -> None:
+        selector = self._selector
+        try:
+            while self._running:
+                for key, events in selector.select(timeout=1.0):
+                    if key.data == "accept":
+                        self._accept()
+                    elif key.data == "wake":
+                        self._drain_wake()
+                    else:
+                        client = key.data
+                        if events & selectors.EVENT_READ:
+                            self._read(client)
+                        if events & selectors.EVENT_WRITE and client.sock.fileno() >= 0:
+                            self._flush(client)
+                self._broadcast()
+                self._expire()
+        except Exception:
+            logging.exception("MJPEG relay failed")
+        finally:
+            for client in list(self._clients.values()):
+                self._close(client)
+            selector.close()
+            for sock in (self._listener, self._wake_r, self._wake_w):
+                if sock:
+                    sock.close()
+            self._listener = self._wake_r = self._wake_w = None
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                sock, addr = self._listener.accept()
+            except BlockingIOError:
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(sock, addr)
+            self._clients[sock.fileno()] = client
+            self._selector.register(sock, selectors.EVENT_READ, client)
+
+    def _drain_wake(self) -> None:
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _read(self, client: _Client) -> None:
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(client)
+            return
+        if client.streaming or client.close_after:
+            # Viewers do not send anything else; ignore it.
+            return
+        client.request += data
+        if b"\r\n\r\n" not in client.request:
+            if len(client.request) > MAX_REQUEST:
+                self._respond(client, "431 Request Header Fields Too Large", "text/plain", b"")
+            return
+        self._route(client)
+
+    def _route(self, client: _Client) -> None:
+        line = bytes(client.request).split(b"\r\n", 1)[0].decode("latin-1")
+        parts = line.split()
+        if len(parts) < 2 or parts[0] not in ("GET", "HEAD"):
+            self._respond(client, "405 Method Not Allowed", "text/plain", b"")
+            return
+        path = parts[1].split("?", 1)[0]
+        if path in ("/", "/stream", "/stream.mjpg"):
+            head = (
+                "HTTP/1.1 200 OK\r\n"
+                f"Content-Type: multipart/x-mixed-replace; boundary={BOUNDARY.decode()}\r\n"
+                "Cache-Control: no-cache, no-store\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            client.streaming = True
+            client.last_frame = time.monotonic()
+            self.served += 1
+            self._queue(client, [head])
+        elif path == "/snapshot.jpg":
+            latest = self._latest
+            if latest is None:
+                self._respond(client, "503 Service Unavailable", "text/plain", b"no frame yet")
+            else:
+                self._respond(client, "200 OK", "image/jpeg", latest[0])
+        elif path == "/stats":
+            body = json.dumps(self.stats()).encode()
+            self._respond(client, "200 OK", "application/json", body)
+        else:
+            self._respond(client, "404 Not Found", "text/plain", b"not found")
+
+    def _respond(self, client: _Client, status: str, content_type: str, body: bytes) -> None:
+        head = (
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode()
+        client.close_after = True
+        self._queue(client, [head, body])
+
+    def _broadcast(self) -> None:
+        with self._lock:
+            if self._latest_seq == self._sent_seq or self._latest is None:
+                return
+            self._sent_seq = self._latest_seq
+            latest = self._latest
+        for client in list(self._clients.values()):
+            if not client.streaming:
+                continue
+            if client.out:
+                # Still busy with an earlier frame: keep only the newest.
+                if client.pending is not None:
+                    client.dropped += 1
+                client.pending = latest
+            else:
+                self._queue(client, self._part(client, latest))
+
+    def _part(self, client: _Client, frame: tuple[bytes, float]) -> list[bytes]:
+        data, timestamp = frame
+        head = (
+            b"--" + BOUNDARY + b"\r\n"
+            b"Content-Type: image/jpeg\r\n"
+            b"Content-Length: " + str(len(data)).encode() + b"\r\n"
+            b"X-Timestamp: " + f"{timestamp:.6f}".encode() + b"\r\n\r\n"
+        )
+        client.frames += 1
+        client.last_frame = time.monotonic()
+        return [head, data, b"\r\n"]
+
+    def _queue(self, client: _Client, chunks: list[bytes]) -> None:
+        client.out.extend(memoryview(chunk) for chunk in chunks if chunk)
+        self._flush(client)
+
+    def _flush(self, client: _Client) -> None:
+        """Send as much as the socket takes without blocking."""
+        while client.out:
+            chunk = client.out[0]
+            try:
+                sent = client.sock.send(chunk)
+            except BlockingIOError:
+                break
+            except OSError:
+                self._close(client)
+                return
+            client.bytes += sent
+            if sent < len(chunk):
+                client.out[0] = chunk[sent:]
+                break
+            client.out.popleft()
+            if not client.out and client.pending is not None:
+                frame, client.pending = client.pending, None
+                client.out.extend(memoryview(chunk) for chunk in self._part(client, frame))
+        if not client.out and client.close_after:
+            self._close(client)
+            return
+        writing = bool(client.out)
+        if writing != client.writing:
+            client.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self._selector.modify(client.sock, events, client)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for client in list(self._clients.values()):
+            if client.streaming and client.out and now - client.last_frame > CLIENT_TIMEOUT:
+                logging.info("Dropping stalled relay client %s:%d", *client.addr[:2])
+                self._close(client)
+
+    def _close(self, client: _Client) -> None:
+        fd = client.sock.fileno()
+        if fd < 0:
+            return
+        self._clients.pop(fd, None)
+        try:
+            self._selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
@@ -0,0 +1,386 @@
+"""Replay captured or synthetic camera traffic to the receiver.
+
+Everything runs in userspace: packets are either sent over loopback UDP from
+the camera's port, or pushed through a :class:`MemorySocket` that a
+:class:`~streamer.CameraStreamer` reads instead of its UDP socket. Captures
+are read from classic pcap or pcapng files, e.g. a PCAPdroid export.
+"""
+import argparse
+import io
+import logging
+import random
+import socket
+import struct
+import sys
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+from PIL import Image
+
+from protocol import HeaderLayout
+
+Packet = tuple[float, bytes]
+
+# Link-layer header types found in phone and desktop captures.
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+_PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+
+
+def _ip_payload(linktype: int, frame: bytes) -> Optional[bytes]:
+    """Strip the link-layer header and return the IP packet."""
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        return frame
+    if linktype == LINKTYPE_NULL:
+        return frame[4:]
+    if linktype == LINKTYPE_ETHERNET:
+        offset, ethertype = 14, frame[12:14]
+        while ethertype in (b"\x81\x00", b"\x88\xa8"):
+            ethertype = frame[offset + 2:offset + 4]
+            offset += 4
+        return frame[offset:] if ethertype in (b"\x08\x00", b"\x86\xdd") else None
+    if linktype == LINKTYPE_LINUX_SLL:
+        return frame[16:]
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return frame[20:]
+    return None
+
+
+class _Defragmenter:
+    """Reassemble fragmented IPv4 datagrams; large camera frames get split."""
+
+    def __init__(self):
+        self._pending: dict[tuple, dict[int, bytes]] = {}
+        self._last: dict[tuple, int] = {}
+
+    def add(self, key: tuple, offset: int, more: bool, data: bytes) -> Optional[bytes]:
+        parts = self._pending.setdefault(key, {})
+        parts[offset] = data
+        if not more:
+            self._last[key] = offset + len(data)
+        total = self._last.get(key)
+        if total is None or sum(len(p) for p in parts.values()) < total:
+            return None
+        del self._pending[key], self._last[key]
+        return b"".join(parts[o] for o in sorted(parts))
+
+
+def _udp(packet: bytes, defrag: _Defragmenter) -> Optional[tuple[str, int, bytes]]:
+    """Return ``(source ip, source port, payload)`` for a UDP packet."""
+    if not packet:
+        return None
+    version = packet[0] >> 4
+    if version == 4:
+        ihl = (packet[0] & 0x0F) * 4
+        total = struct.unpack_from(">H", packet, 2)[0]
+        if packet[9] != socket.IPPROTO_UDP:
+            return None
+        src = socket.inet_ntoa(packet[12:16])
+        flags_offset = struct.unpack_from(">H", packet, 6)[0]
+        body = packet[ihl:total or len(packet)]
+        if flags_offset & 0x3FFF:
+            key = (packet[12:20], packet[4:6])
+            body = defrag.add(key, (flags_offset & 0x1FFF) * 8, bool(flags_offset & 0x2000), body)
+            if body is None:
+                return None
+    elif version == 6:
+        if packet[6] != socket.IPPROTO_UDP:
+            return None
+        src = socket.inet_ntop(socket.AF_INET6, packet[8:24])
+        body = packet[40:]
+    else:
+        return None
+    if len(body) < 8:
+        return None
+    port, _, length = struct.unpack_from(">HHH", body)
+    return src, port, body[8:length] if length >= 8 else body[8:]
+
+
+def _pcap_frames(fh) -> Iterator[tuple[int, float, bytes]]:
+    """Yield ``(linktype, timestamp, frame)`` from a pcap or pcapng file."""
+    magic = fh.read(4)
+    if magic == _PCAPNG_MAGIC:
+        yield from _pcapng_frames(fh, magic)
+        return
+    if magic not in _PCAP_MAGIC:
+        raise ValueError("not a pcap or pcapng file")
+    endian, resolution = _PCAP_MAGIC[magic]
+    linktype = struct.unpack(endian + "HHiIII", fh.read(20))[5] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    while True:
+        header = fh.read(record.size)
+        if len(header) < record.size:
+            return
+        seconds, fraction, captured, _ = record.unpack(header)
+        yield linktype, seconds + fraction * resolution, fh.read(captured)
+
+
+def _pcapng_frames(fh, magic: bytes) -> Iterator[tuple[int, float, bytes]]:
+    endian = "<"
+    interfaces: list[tuple[int, float]] = []
+    block_type = magic
+    while True:
+        if len(block_type) < 4:
+            return
+        length_raw = fh.read(4)
+        if len(length_raw) < 4:
+            return
+        if block_type == _PCAPNG_MAGIC:
+            endian = "<" if fh.read(4) == b"\x4d\x3c\x2b\x1a" else ">"
+            length = struct.unpack(endian + "I", length_raw)[0]
+            body = fh.read(length - 12)
+            interfaces = []
+        else:
+            length = struct.unpack(endian + "I", length_raw)[0]
+            body = fh.read(length - 8)
+        kind = struct.unpack(endian + "I", block_type)[0]
+        if kind == 1:
+            interfaces.append((struct.unpack_from(endian + "H", body)[0], _if_resolution(body, endian)))
+        elif kind == 6:
+            iface, high, low, captured = struct.unpack_from(endian + "IIII", body)
+            linktype, resolution = interfaces[iface]
+            yield linktype, ((high << 32) | low) * resolution, body[20:20 + captured]
+        block_type = fh.read(4)
+
+
+def _if_resolution(body: bytes, endian: str) -> float:
+    """Read ``if_tsresol`` from an interface description block (default µs)."""
+    pos = 8
+    while pos + 4 <= len(body) - 4:
+        code, length = struct.unpack_from(endian + "HH", body, pos)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = body[pos + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        pos += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+def load_pcap(path: str, source_port: Optional[int] = None, source_ip: Optional[str] = None) -> list[Packet]:
+    """Return ``(timestamp, payload)`` for the UDP datagrams in a capture.
+
+    Only datagrams sent from ``source_ip``/``source_port`` are kept when those
+    are given, e.g. the camera address and its video port.
+    """
+    packets = []
+    defrag = _Defragmenter()
+    with open(path, "rb") as fh:
+        for linktype, timestamp, frame in _pcap_frames(fh):
+            ip = _ip_payload(linktype, frame)
+            udp = _udp(ip, defrag) if ip else None
+            if udp is None:
+                continue
+            src, port, payload = udp
+            if source_port is not None and port != source_port:
+                continue
+            if source_ip is not None and src != source_ip:
+                continue
+            packets.append((timestamp, payload))
+    return packets
+
+
+def synthetic_frames(count: int, size: tuple[int, int] = (1280, 720), quality: int = 80) -> list[bytes]:
+    """Encode ``count`` JPEG frames of a moving test pattern."""
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frames = []
+    for i in range(count):
+        arr = np.empty((height, width, 3), np.uint8)
+        arr[..., 0] = (x + i * 4) % 256
+        arr[..., 1] = (y + i * 2) % 256
+        arr[..., 2] = ((x[None, :] + y) / 2 + i) % 256
+        # A few sharp bars give the aligner something to lock on to.
+        arr[(np.arange(height) + i) % 64 < 4] = 255
+        buf = io.BytesIO()
+        Image.fromarray(arr).save(buf, "JPEG", quality=quality)
+        frames.append(buf.getvalue())
+    return frames
+
+
+def packetize(
+    frames: Iterable[bytes],
+    fps: float = 20.0,
+    packet_size: int = 1400,
+    header_bytes: int = 24,
+    layout: Optional[HeaderLayout] = None,
+) -> list[Packet]:
+    """Split JPEG frames into timestamped datagrams like the camera sends them.
+
+    The camera header layout is not documented, so it is filled with zeros
+    apart from the sequence number and frame id fields of ``layout``.
+    """
+    layout = layout or HeaderLayout()
+    packets = []
+    for i, frame in enumerate(frames):
+        timestamp = i / fps
+        for offset in range(0, len(frame), packet_size):
+            header = layout.pack(header_bytes, len(packets), i)
+            packets.append((timestamp, header + frame[offset:offset + packet_size]))
+    return packets
+
+
+def lose(packets: list[Packet], loss: float, seed: int = 0) -> list[Packet]:
+    """Drop a ``loss`` fraction of ``packets`` at random, reproducibly."""
+    rng = random.Random(seed)
+    return [packet for packet in packets if rng.random() >= loss]
+
+
+class MemorySocket:
+    """In-memory stand-in for the camera video socket.
+
+    Backed by a Unix datagram socket pair, so ``select`` and ``recvmmsg`` work
+    unchanged. :meth:`inject` blocks while the receiver is behind, which makes
+    a max-speed replay lossless. Keepalives sent by the streamer are counted
+    in :attr:`keepalives` and discarded. Install it with
+    ``streamer.socket_factory = mem.factory`` (threaded backend only).
+    """
+
+    def __init__(self, buffer_size: int = 4 * 1024 * 1024):
+        self._sock, self._peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._peer.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+        self.keepalives = 0
+
+    def factory(self) -> tuple["MemorySocket", None]:
+        return self, None
+
+    def inject(self, data: bytes) -> None:
+        self._peer.send(data)
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def recvfrom_into(self, buffer, nbytes: int = 0, flags: int = 0):
+        return self._sock.recvfrom_into(buffer, nbytes, flags)
+
+    def sendto(self, data: bytes, address) -> int:
+        self.keepalives += 1
+        return len(data)
+
+    def setsockopt(self, *args) -> None:
+        self._sock.setsockopt(*args)
+
+    def setblocking(self, flag: bool) -> None:
+        self._sock.setblocking(flag)
+
+    def close(self) -> None:
+        self._sock.close()
+        self._peer.close()
+
+
+class Replayer:
+    """Send packets with their original spacing divided by ``speed``.
+
+    ``speed`` 1.0 replays in real time, 2.0 twice as fast and 0 as fast as
+    the sink accepts packets.
+    """
+
+    def __init__(self, packets: list[Packet], speed: float = 1.0):
+        if not packets:
+            raise ValueError("nothing to replay")
+        self.packets = packets
+        self.speed = speed
+        self.sent = 0
+
+    def play(self, send: Callable[[bytes], None], loops: int = 1, stop: Optional[Callable[[], bool]] = None) -> int:
+        """Send every packet ``loops`` times (0 = forever); returns the count sent."""
+        first = self.packets[0][0]
+        span = self.packets[-1][0] - first
+        start = time.monotonic()
+        loop = 0
+        while not loops or loop < loops:
+            base = loop * (span + (span / max(len(self.packets) - 1, 1)))
+            for timestamp, data in self.packets:
+                if stop is not None and stop():
+                    return self.sent
+                if self.speed > 0:
+                    delay = start + (base + timestamp - first) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                send(data)
+                self.sent += 1
+            loop += 1
+        return self.sent
+
+
+def udp_sender(target: tuple[str, int], source_port: int = 0, source_host: str = "127.0.0.1") -> Callable[[bytes], None]:
+    """Return a send function for loopback UDP, sent from the camera's port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((source_host, source_port))
+
+    def send(data: bytes) -> None:
+        try:
+            sock.sendto(data, target)
+        except ConnectionRefusedError:
+            # Nothing listening yet; keep the original timing regardless.
+            pass
+
+    return send
+
+
+def load_packets(args: argparse.Namespace) -> list[Packet]:
+    """Packets from ``--pcap`` or a synthetic stream, as selected on the command line."""
+    if args.pcap:
+        packets = load_pcap(args.pcap, args.camera_port, args.camera_ip)
+        logging.info("Loaded %d datagrams from %s", len(packets), args.pcap)
+    else:
+        width, height = (int(v) for v in args.size.split("x"))
+        frames = synthetic_frames(args.frames, (width, height))
+        layout = HeaderLayout(seq_offset=args.seq_offset, frame_id_offset=args.frame_id_offset)
+        packets = packetize(frames, args.fps, args.packet_size, args.header_bytes, layout)
+    if args.loss:
+        packets = lose(packets, args.loss)
+    return packets
+
+
+def add_source_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--pcap", help="capture to replay (pcap or pcapng)")
+    parser.add_argument("--camera-ip", help="only replay datagrams from this address")
+    parser.add_argument("--camera-port", type=int, default=8080, help="only replay datagrams from this port")
+    parser.add_argument("--frames", type=int, default=200, help="synthetic frames when no capture is given")
+    parser.add_argument("--size", default="1280x720", help="synthetic frame size")
+    parser.add_argument("--fps", type=float, default=20.0, help="synthetic frame rate")
+    parser.add_argument("--packet-size", type=int, default=1400, help="synthetic payload bytes per datagram")
+    parser.add_argument("--header-bytes", type=int, default=24, help="synthetic camera header length")
+    parser.add_argument("--seq-offset", type=int, default=-1, help="write a 2-byte packet sequence number here")
+    parser.add_argument("--frame-id-offset", type=int, default=-1, help="write a 2-byte frame id here")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of datagrams to drop at random")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay camera traffic over loopback UDP")
+    add_source_arguments(parser)
+    parser.add_argument("--target", default="127.0.0.1:53310", help="receiver HOST:PORT")
+    parser.add_argument("--source-port", type=int, default=8080, help="port to send from (the camera video port)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor, 0 = as fast as possible")
+    parser.add_argument("--loop", type=int, default=1, help="number of passes, 0 = forever")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    host, port = args.target.rsplit(":", 1)
+    replayer = Replayer(load_packets(args), args.speed)
+    started = time.monotonic()
+    try:
+        replayer.play(udp_sender((host, int(port)), args.source_port), args.loop)
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.monotonic() - started
+    logging.info("Sent %d datagrams in %.1f s", replayer.sent, elapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
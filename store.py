@@ -0,0 +1,296 @@
+"""Segmented, time-indexed recording store.
+
+A :class:`RecordingStore` is a directory of MKV segments of a fixed length,
+each with an append-only ``.idx`` sidecar holding one record per frame: its
+wall-clock time and the offset and size of its JPEG data in the segment::
+
+    store/seg_1760664478123.mkv   the frames, playable as they are
+    store/seg_1760664478123.idx   20 bytes per frame
+
+Segment names carry their start time in milliseconds, so finding a point in
+time is a bisect over the file names and then over one index; the video is
+only read for the frame returned. Old segments are pruned by age and by
+total size. ``python store.py DIR`` lists a store and extracts frames.
+"""
+import argparse
+import bisect
+import logging
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+from typing import Iterator, Optional
+
+INDEX_MAGIC = b"CAMIDX1\n"
+# Wall-clock time (s), offset of the JPEG data in the segment and its size.
+RECORD = struct.Struct("<dQI")
+PREFIX = "seg_"
+
+
+class SegmentIndex:
+    """The frame records of one segment as a sequence of ``(time, offset, size)``."""
+
+    def __init__(self, data: bytes):
+        if data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError("not a segment index")
+        self._data = data
+        # A record cut short by a crash is ignored.
+        self._count = (len(data) - len(INDEX_MAGIC)) // RECORD.size
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentIndex":
+        with open(path, "rb") as fh:
+            return cls(fh.read())
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> tuple[float, int, int]:
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return RECORD.unpack_from(self._data, len(INDEX_MAGIC) + i * RECORD.size)
+
+    def nearest(self, timestamp: float) -> Optional[int]:
+        """Position of the record closest to ``timestamp``."""
+        if not self._count:
+            return None
+        i = bisect.bisect_left(self, timestamp, key=lambda record: record[0])
+        if i == self._count or (i > 0 and timestamp - self[i - 1][0] <= self[i][0] - timestamp):
+            i -= 1
+        return i
+
+
+class IndexWriter:
+    """Append records to a segment index, visible to readers right away."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = open(path, "ab")
+        if self._fh.tell() == 0:
+            self._fh.write(INDEX_MAGIC)
+
+    def append(self, timestamp: float, offset: int, size: int) -> None:
+        self._fh.write(RECORD.pack(timestamp, offset, size))
+        self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class RecordingStore:
+    """Directory of indexed MKV segments.
+
+    A :class:`recorder.Recorder` created with ``store=`` writes into it,
+    starting a new segment every ``segment_seconds`` and calling
+    :meth:`prune` after each one. With ``retention_seconds`` or
+    ``max_bytes`` set, the oldest segments are deleted beyond that age or
+    total size; 0 keeps everything.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_seconds: float = 60.0,
+        retention_seconds: float = 0.0,
+        max_bytes: int = 0,
+    ):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.retention_seconds = retention_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, directory: Optional[str] = None) -> "RecordingStore":
+        return cls(
+            directory or config.store_dir,
+            config.store_segment_seconds,
+            config.store_retention_hours * 3600,
+            int(config.store_max_gb * 1e9),
+        )
+
+    def segments(self) -> list[tuple[float, str]]:
+        """Start time and path without extension of every segment, oldest first."""
+        found = []
+        for name in os.listdir(self.directory):
+            stem, ext = os.path.splitext(name)
+            if ext == ".idx" and stem.startswith(PREFIX) and stem[len(PREFIX):].isdigit():
+                found.append((int(stem[len(PREFIX):]) / 1000.0, os.path.join(self.directory, stem)))
+        found.sort()
+        return found
+
+    def open_segment(self, timestamp: float) -> tuple[str, IndexWriter]:
+        """Create the files of a segment starting at wall-clock ``timestamp``.
+
+        Returns the MKV path to write and the writer for its index.
+        """
+        base = os.path.join(self.directory, f"{PREFIX}{round(timestamp * 1000):013d}")
+        return base + ".mkv", IndexWriter(base + ".idx")
+
+    def frame_at(self, timestamp: float, tolerance: float = 1.0) -> Optional[tuple[bytes, float]]:
+        """The JPEG frame closest to wall-clock ``timestamp`` and its time.
+
+        ``None`` when nothing was recorded within ``tolerance`` seconds.
+        """
+        segments = self.segments()
+        i = bisect.bisect_right(segments, timestamp, key=lambda segment: segment[0])
+        best = None
+        # The closest frame may also be the last of the segment before, when
+        # this one's first frame is late, or the first of the next.
+        for _, base in segments[max(i - 2, 0):i + 1]:
+            try:
+                index = SegmentIndex.load(base + ".idx")
+            except (OSError, ValueError):
+                continue
+            n = index.nearest(timestamp)
+            if n is None:
+                continue
+            record = index[n]
+            if best is None or abs(record[0] - timestamp) < abs(best[1][0] - timestamp):
+                best = (base, record)
+        if best is None or abs(best[1][0] - timestamp) > tolerance:
+            return None
+        base, (frame_time, offset, size) = best
+        return _read(base + ".mkv", offset, size), frame_time
+
+    def frames(self, start: float, end: float) -> Iterator[tuple[bytes, float]]:
+        """Every recorded frame from ``start`` up to ``end``, in order."""
+        segments = self.segments()
+        first = max(bisect.bisect_right(segments, start, key=lambda segment: segment[0]) - 1, 0)
+        for segment_start, base in segments[first:]:
+            if segment_start > end:
+                break
+            try:
+                index = SegmentIndex.load(base + ".idx")
+                fh = open(base + ".mkv", "rb")
+            except (OSError, ValueError):
+                continue
+            with fh:
+                for i in range(bisect.bisect_left(index, start, key=lambda record: record[0]), len(index)):
+                    frame_time, offset, size = index[i]
+                    if frame_time > end:
+                        return
+                    fh.seek(offset)
+                    yield fh.read(size), frame_time
+
+    def prune(self, now: Optional[float] = None, keep: tuple[str, ...] = ()) -> list[str]:
+        """Delete segments beyond the retention limits; returns the removed paths.
+
+        Segments whose MKV path is in ``keep``, such as the one being
+        written, are never removed.
+        """
+        if not self.retention_seconds and not self.max_bytes:
+            return []
+        now = time.time() if now is None else now
+        segments = self.segments()
+        sizes = [_size(base + ".mkv") + _size(base + ".idx") for _, base in segments]
+        total = sum(sizes)
+        removed = []
+        for i, (start, base) in enumerate(segments):
+            end = _last_time(base + ".idx", start)
+            expired = self.retention_seconds and now - end > self.retention_seconds
+            if not expired and not (self.max_bytes and total > self.max_bytes):
+                break
+            if base + ".mkv" in keep:
+                continue
+            for ext in (".mkv", ".idx"):
+                try:
+                    os.remove(base + ext)
+                except FileNotFoundError:
+                    pass
+            total -= sizes[i]
+            removed.append(base + ".mkv")
+        if removed:
+            logging.info("Pruned %d recording segments", len(removed))
+        return removed
+
+
+def _read(path: str, offset: int, size: int) -> bytes:
+    with open(path, "rb") as fh:
+        fh.seek(offset)
+        return fh.read(size)
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _last_time(path: str, default: float) -> float:
+    """Time of the last record of an index, read without loading it all."""
+    try:
+        with open(path, "rb") as fh:
+            count = (fh.seek(0, os.SEEK_END) - len(INDEX_MAGIC)) // RECORD.size
+            if count <= 0:
+                return default
+            fh.seek(len(INDEX_MAGIC) + (count - 1) * RECORD.size)
+            return RECORD.unpack(fh.read(RECORD.size))[0]
+    except OSError:
+        return default
+
+
+def parse_time(value: str) -> float:
+    """Seconds since the epoch, or a local ISO date and time such as ``2024-05-01 12:30:00.5``."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _format(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat(" ", "milliseconds")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """List a store, extract the frame at a time, or prune it."""
+    parser = argparse.ArgumentParser(description="Inspect a recording store")
+    parser.add_argument("directory")
+    parser.add_argument("--at", metavar="TIME", help="save the frame closest to TIME (ISO local time or epoch)")
+    parser.add_argument("--output", "-o", default="frame.jpg", help="file for --at")
+    parser.add_argument("--retention", type=float, metavar="HOURS", help="delete segments older than this")
+    parser.add_argument("--max-gb", type=float, help="delete the oldest segments beyond this total size")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+
+    store = RecordingStore(
+        args.directory,
+        retention_seconds=(args.retention or 0.0) * 3600,
+        max_bytes=int((args.max_gb or 0.0) * 1e9),
+    )
+    if args.retention or args.max_gb:
+        for path in store.prune():
+            print(f"removed {path}")
+        return 0
+    if args.at:
+        started = time.perf_counter()
+        frame = store.frame_at(parse_time(args.at))
+        if frame is None:
+            print("Nothing was recorded at that time")
+            return 1
+        data, frame_time = frame
+        with open(args.output, "wb") as fh:
+            fh.write(data)
+        print(f"{_format(frame_time)} -> {args.output} ({(time.perf_counter() - started) * 1000:.1f} ms)")
+        return 0
+    segments = store.segments()
+    total = 0
+    for start, base in segments:
+        try:
+            frames = len(SegmentIndex.load(base + ".idx"))
+        except (OSError, ValueError):
+            frames = 0
+        size = _size(base + ".mkv")
+        total += size
+        end = _last_time(base + ".idx", start)
+        print(f"{_format(start)}  {end - start:7.1f} s  {frames:6d} frames  {size / 1e6:8.1f} MB  {base}.mkv")
+    print(f"{len(segments)} segments, {total / 1e9:.2f} GB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,144 @@
+from __future__ import annotations
+
+import importlib
+import math
 import socket
+import sys
 import threading
 import time
 import io
 import queue
 import logging
-from typing import Callable, Optional
-from PIL import Image, ImageOps, UnidentifiedImageError, ImageFile, ImageEnhance
+from dataclasses import asdict, dataclass, replace
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Callable, Optional
+from PIL import Image, UnidentifiedImageError, ImageFile
 
 # Allow loading frames even if the JPEG data is slightly truncated.
 ImageFile.LOAD_TRUNCATED_IMAGES = True
-import numpy as np
-import cv2
+# NumPy and OpenCV are imported where they are first used; together they
+# take longer to import than the rest of the application.
+if TYPE_CHECKING:
+    import numpy as np
 from config import StreamConfig
+from assembler import FrameAssembler
+from receiver import DatagramReceiver
+from metrics import FrameTrace, PipelineMetrics
+from alignment import FrameAligner
+from pacing import FramePacer
+from protocol import HeaderLayout, SequencedAssembler
+from framebus import FrameBus
+from motion import MotionDetector
+from history import FrameHistory
+
+KEEPALIVE_AUDIO = b"0f"
+KEEPALIVE_VIDEO = b"Bv"
+
+# Config fields by what a change takes while streaming (see
+# CameraStreamer.reconfigure); the rest apply from the next frame or packet.
+NETWORK_FIELDS = frozenset({
+    "cam_ip", "cam_video_port", "client_video_port", "connect_camera", "recv_buffer_size",
+})
+# Only need new receive buffers on the same socket.
+RECEIVER_FIELDS = frozenset({"recv_mode", "recv_batch", "datagram_size"})
+ASSEMBLY_FIELDS = frozenset({
+    "header_bytes", "frame_buffer_size", "seq_offset", "seq_bytes",
+    "frame_id_offset", "frame_id_bytes", "header_byteorder",
+})
+DECODE_FIELDS = frozenset({"decode_workers", "decode_backend"})
+PROCESSING_FIELDS = frozenset({
+    "display_width", "display_height", "brightness", "contrast", "saturation", "hue", "gamma",
+})
+
+
+def preload() -> None:
+    """Import the processing libraries ahead of the first frame."""
+    for name in ("numpy", "cv2"):
+        importlib.import_module(name)
+
+
+@lru_cache(maxsize=16)
+def colour_matrix(saturation: float) -> np.ndarray:
+    """RGB to RGB matrix applying ``saturation`` like ``ImageEnhance.Color``.
+
+    Each pixel is blended with its luma, so the change is a single 3x3
+    transform per pixel. Cached per setting.
+    """
+    import numpy as np
+
+    luma = np.array([0.299, 0.587, 0.114])
+    matrix = saturation * np.eye(3) + (1.0 - saturation) * np.outer(np.ones(3), luma)
+    matrix = matrix.astype(np.float32)
+    matrix.flags.writeable = False
+    return matrix
+
+
+def hue_lut(hue: float) -> np.ndarray:
+    """Per-channel HSV table turning the hue by ``hue`` (1.0 = a full turn).
+
+    The hue channel runs over 0-255 as in ``Image.convert("HSV")``;
+    saturation and value are left alone.
+    """
+    import numpy as np
+
+    levels = np.arange(256)
+    table = np.stack([(levels + int(hue * 255)) % 256, levels, levels], axis=-1)
+    return table.astype(np.uint8).reshape(256, 1, 3)
+
+
+@dataclass(frozen=True, eq=False)
+class ProcessingPlan:
+    """One consistent version of a processor's settings and the tables built from them.
+
+    A frame is processed with a single plan from start to end, so a setting
+    changed meanwhile only takes effect from the next frame.
+    """
+
+    version: int
+    flip_h: bool
+    flip_v: bool
+    rotate_90: bool
+    grayscale: bool
+    brightness: float
+    contrast: float
+    saturation: float
+    hue: float
+    gamma: float
+    target_size: tuple[int, int] | None
+    outputs: dict[str, tuple[int, int] | None]
+    brightness_lut: np.ndarray
+    gamma_lut: np.ndarray | None
+    colour_matrix: np.ndarray | None
+    hue_lut: np.ndarray | None
+
+    @property
+    def neutral_colour(self) -> bool:
+        return (
+            not self.grayscale
+            and (self.brightness, self.contrast, self.saturation, self.hue, self.gamma) == (1.0, 1.0, 1.0, 0.0, 1.0)
+        )
+
 
 class FrameProcessor:
+    """Apply orientation, colour and size settings to decoded frames.
+
+    The settings are plain attributes so callers can toggle them at any time;
+    :meth:`update` and :meth:`apply_config` change several at once. Whenever
+    they change, the next frame compiles them into a new
+    :class:`ProcessingPlan` of lookup tables and a single orientation
+    transform, then runs through a handful of vectorized passes over reused
+    NumPy buffers. The plan's version is attached as
+    ``img.info["settings_version"]``.
+
+    Besides the main output at ``target_size``, named outputs of other sizes
+    can be added with :meth:`add_output`, e.g. a small preview or a
+    full-resolution stream for recording. They come from the same decode and
+    the same orientation and colour passes, which run once at the smallest
+    size covering all outputs, and are attached as ``img.info["outputs"]``.
+    An output costs nothing once it is removed again.
+    """
+
     def __init__(self):
         self.flip_h = False
         self.flip_v = False
@@ -25,51 +150,599 @@ class FrameProcessor:
         self.hue = 0.0
         self.gamma = 1.0
         self.target_size: tuple[int, int] | None = None
+        # Extra output sizes by name, None for the camera resolution. Replaced
+        # rather than changed in place so frames being processed see one set.
+        self.outputs: dict[str, tuple[int, int] | None] = {}
+        self._plan: ProcessingPlan | None = None
+        self._plan_key: tuple | None = None
+        # Held while settings change together and while a plan is built.
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_output(self, name: str, size: tuple[int, int] | None) -> None:
+        """Also produce ``name`` at ``size`` from now on (``None`` = camera resolution)."""
+        with self._lock:
+            if self.outputs.get(name, ()) != size:
+                self.outputs = {**self.outputs, name: size}
+
+    def remove_output(self, name: str) -> None:
+        with self._lock:
+            if name in self.outputs:
+                self.outputs = {k: v for k, v in self.outputs.items() if k != name}
+
+    def update(self, **settings) -> None:
+        """Change several settings so that no frame sees only some of them."""
+        with self._lock:
+            for name, value in settings.items():
+                if name.startswith("_") or not hasattr(self, name):
+                    raise AttributeError(f"unknown setting {name!r}")
+                setattr(self, name, value)
+
+    def apply_config(self, config: StreamConfig) -> None:
+        """Take the output size and colour settings from ``config``."""
+        self.update(
+            target_size=(config.display_width, config.display_height),
+            brightness=config.brightness,
+            contrast=config.contrast,
+            saturation=config.saturation,
+            hue=config.hue,
+            gamma=config.gamma,
+        )
+
+    def settings(self) -> dict:
+        """Return the public settings, e.g. to mirror them in a worker process."""
+        return {k: v for k, v in vars(self).items() if not k.startswith("_")}
+
+    def _settings(self) -> tuple:
+        return (
+            self.flip_h,
+            self.flip_v,
+            self.rotate_90,
+            self.grayscale,
+            self.brightness,
+            self.contrast,
+            self.saturation,
+            self.hue,
+            self.gamma,
+            self.target_size,
+            self.outputs,
+        )
+
+    def plan(self) -> ProcessingPlan:
+        """The current settings as a plan, rebuilt only when any of them changed."""
+        plan = self._plan
+        if plan is not None and self._settings() == self._plan_key:
+            return plan
+        with self._lock:
+            key = self._settings()
+            if self._plan is not None and key == self._plan_key:
+                return self._plan
+            self._plan = self._compile(key, self._plan.version + 1 if self._plan else 1)
+            self._plan_key = key
+            return self._plan
+
+    @staticmethod
+    def _compile(key: tuple, version: int) -> ProcessingPlan:
+        """Build the lookup tables for one set of settings."""
+        import numpy as np
+
+        brightness, saturation, hue, gamma = key[4], key[6], key[7], key[8]
+        levels = np.arange(256, dtype=np.float32)
+        brightness_lut = np.clip(np.trunc(levels * brightness), 0, 255)
+        gamma_lut = None
+        if gamma != 1.0:
+            inv = 1.0 / max(gamma, 0.01)
+            gamma_lut = ((levels / 255.0) ** inv * 255).astype(np.uint8)
+        matrix = colour_matrix(saturation) if saturation != 1.0 else None
+        hue_table = hue_lut(hue) if int(hue * 255) % 256 else None
+        return ProcessingPlan(version, *key, brightness_lut, gamma_lut, matrix, hue_table)
+
+    def _buffer(self, name: str, shape: tuple[int, ...]) -> np.ndarray:
+        # Scratch buffers are per thread so decode workers can share a processor.
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buf = buffers.get(name)
+        if buf is None or buf.shape != shape:
+            import numpy as np
+
+            buf = np.empty(shape, dtype=np.uint8)
+            buffers[name] = buf
+        return buf
+
+    def _tone_lut(self, plan: ProcessingPlan, luma: np.ndarray) -> np.ndarray:
+        """Combine brightness and contrast into one table.
 
-    def process(self, img: Image.Image) -> Image.Image:
-        if self.flip_h:
-            img = ImageOps.mirror(img)
-        if self.flip_v:
-            img = ImageOps.flip(img)
-        if self.rotate_90:
-            img = img.rotate(-90, expand=True)
-        if self.grayscale:
-            img = ImageOps.grayscale(img).convert("RGB")
-        if self.brightness != 1.0:
-            img = ImageEnhance.Brightness(img).enhance(self.brightness)
-        if self.contrast != 1.0:
-            img = ImageEnhance.Contrast(img).enhance(self.contrast)
-        if self.saturation != 1.0:
-            img = ImageEnhance.Color(img).enhance(self.saturation)
-        if self.hue != 0.0:
-            hsv = np.array(img.convert("HSV"), dtype=np.uint8)
-            hsv[..., 0] = (hsv[..., 0].astype(int) + int(self.hue * 255)) % 256
-            img = Image.fromarray(hsv, "HSV").convert("RGB")
-        if self.gamma != 1.0:
-            inv = 1.0 / max(self.gamma, 0.01)
-            table = [int((i / 255.0) ** inv * 255) for i in range(256)]
-            img = img.point(table * len(img.getbands()))
-        if self.target_size:
-            img = img.resize(self.target_size, Image.LANCZOS)
+        Contrast pivots around the mean brightness-adjusted luma like
+        ``ImageEnhance.Contrast``; the mean is taken from a sparse sample so
+        it costs next to nothing per frame.
+        """
+        lut = plan.brightness_lut
+        if plan.contrast != 1.0:
+            import numpy as np
+
+            mean = int(lut[luma[::4, ::4]].mean() + 0.5)
+            lut = np.clip(np.trunc(mean + plan.contrast * (lut - mean)), 0, 255)
+        return lut
+
+    def _resize(
+        self, arr: np.ndarray, size: tuple[int, int], buffer: str = "resize", sharp: bool = True
+    ) -> np.ndarray:
+        w, h = size
+        if arr.shape[1] == w and arr.shape[0] == h:
+            return arr
+        import cv2
+
+        if w * h < arr.shape[0] * arr.shape[1]:
+            # Area averaging is slow at fractional ratios, and bilinear only
+            # starts to alias beyond halving.
+            fine = sharp or w * 2 <= arr.shape[1] or h * 2 <= arr.shape[0]
+            interpolation = cv2.INTER_AREA if fine else cv2.INTER_LINEAR
+        else:
+            interpolation = cv2.INTER_LANCZOS4 if sharp else cv2.INTER_LINEAR
+        out = self._buffer(buffer, (h, w) + arr.shape[2:])
+        return cv2.resize(arr, size, dst=out, interpolation=interpolation)
+
+    @staticmethod
+    def _work_size(plan: ProcessingPlan) -> tuple[int, int] | None:
+        """Smallest size covering the main and every sized output, ``None`` for the full resolution.
+
+        Camera-resolution outputs are processed on their own, so they do not
+        make the others run at the full size.
+        """
+        if plan.target_size is None:
+            return None
+        sizes = [plan.target_size, *(size for size in plan.outputs.values() if size)]
+        return max(w for w, _ in sizes), max(h for _, h in sizes)
+
+    def _orient(self, plan: ProcessingPlan, arr: np.ndarray, tag: str = "") -> np.ndarray:
+        """Apply mirror, flip and the clockwise rotation as one transform."""
+        if not (plan.flip_h or plan.flip_v or plan.rotate_90):
+            return arr
+        import cv2
+
+        h, w = arr.shape[:2]
+        shape = ((w, h) if plan.rotate_90 else (h, w)) + arr.shape[2:]
+        out = self._buffer(tag + "orient", shape)
+        if not plan.rotate_90:
+            code = -1 if plan.flip_h and plan.flip_v else (1 if plan.flip_h else 0)
+            return cv2.flip(arr, code, dst=out)
+        if plan.flip_h and plan.flip_v:
+            return cv2.rotate(arr, cv2.ROTATE_90_COUNTERCLOCKWISE, dst=out)
+        if plan.flip_v:
+            return cv2.transpose(arr, dst=out)
+        if plan.flip_h:
+            tmp = cv2.transpose(arr, dst=self._buffer(tag + "transpose", shape))
+            return cv2.flip(tmp, -1, dst=out)
+        return cv2.rotate(arr, cv2.ROTATE_90_CLOCKWISE, dst=out)
+
+    def _colour(self, plan: ProcessingPlan, arr: np.ndarray, tag: str = "") -> np.ndarray:
+        """Tone curve, saturation matrix, hue shift and gamma.
+
+        The hue is turned in HSV like the saturation and value-preserving
+        ``Image.convert("HSV")`` shift it replaces; the other steps are single
+        table or matrix passes. ``tag`` keeps the scratch buffers of a second
+        size apart.
+        """
+        if plan.neutral_colour:
+            return arr
+        import cv2
+        import numpy as np
+
+        out = self._buffer(tag + "colour", arr.shape)
+        gamma = plan.gamma_lut
+        if plan.grayscale:
+            # A single channel is cheaper than any 3-channel transform.
+            gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY, dst=self._buffer(tag + "gray", arr.shape[:2]))
+            lut = self._tone_lut(plan, gray).astype(np.uint8)
+            cv2.LUT(gray, lut if gamma is None else gamma[lut], dst=gray)
+            return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB, dst=out)
+        if plan.contrast != 1.0:
+            gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY, dst=self._buffer(tag + "gray", arr.shape[:2]))
+            tone = self._tone_lut(plan, gray).astype(np.uint8)
+        else:
+            tone = plan.brightness_lut.astype(np.uint8)
+        matrix = plan.colour_matrix
+        if matrix is None and plan.hue_lut is None:
+            return cv2.LUT(arr, tone if gamma is None else gamma[tone], dst=out)
+        src = arr
+        if plan.brightness != 1.0 or plan.contrast != 1.0:
+            src = cv2.LUT(arr, tone, dst=self._buffer(tag + "tone", arr.shape))
+        if matrix is not None:
+            src = cv2.transform(src, matrix, dst=out)
+        if plan.hue_lut is not None:
+            hsv = cv2.cvtColor(src, cv2.COLOR_RGB2HSV_FULL, dst=self._buffer(tag + "hsv", arr.shape))
+            cv2.LUT(hsv, plan.hue_lut, dst=hsv)
+            cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB_FULL, dst=out)
+        if gamma is not None:
+            cv2.LUT(out, gamma, dst=out)
+        return out
+
+    def decode(self, data: bytes, plan: ProcessingPlan | None = None) -> Image.Image:
+        """Decode a JPEG frame, letting libjpeg downscale when possible.
+
+        When every output is at most half, a quarter or an eighth of the
+        sensor resolution, JPEG draft mode decodes straight at that scale so
+        the full-size image never exists and the resize becomes a no-op.
+        """
+        plan = plan or self.plan()
+        img = Image.open(io.BytesIO(data))
+        size = self._work_size(plan)
+        if size and None not in plan.outputs.values():
+            w, h = size
+            img.draft("RGB", (h, w) if plan.rotate_90 else (w, h))
+        img.load()
         return img
 
+    def process(self, img: Image.Image, plan: ProcessingPlan | None = None) -> Image.Image:
+        plan = plan or self.plan()
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        import numpy as np
+
+        source = arr = np.asarray(img)
+        size = plan.target_size
+        work = self._work_size(plan)
+        shrunk = False
+        # Per-pixel work runs at whichever of the source and output sizes is
+        # smaller, so shrink first and grow last.
+        if work:
+            src_size = (arr.shape[0], arr.shape[1]) if plan.rotate_90 else (arr.shape[1], arr.shape[0])
+            if work[0] * work[1] < src_size[0] * src_size[1]:
+                pre_size = (work[1], work[0]) if plan.rotate_90 else work
+                arr = self._resize(arr, pre_size, "shrink", sharp=work == size)
+                shrunk = True
+        arr = self._orient(plan, arr)
+        arr = self._colour(plan, arr)
+        # ``Image.fromarray`` copies RGB data, so the buffers can be reused.
+        out = Image.fromarray(self._resize(arr, size) if size else arr)
+        out.info["settings_version"] = plan.version
+        if plan.outputs:
+            outputs = {
+                # Extra outputs are never enlarged with the slower Lanczos filter.
+                name: Image.fromarray(self._resize(arr, output, "resize:" + name, sharp=False))
+                for name, output in plan.outputs.items()
+                if output
+            }
+            if None in plan.outputs.values():
+                if shrunk:
+                    # A second pass over the full frame, only for these outputs.
+                    arr = self._colour(plan, self._orient(plan, source, "full:"), "full:")
+                full = Image.fromarray(arr)
+                outputs.update((name, full) for name, output in plan.outputs.items() if output is None)
+            out.info["outputs"] = {name: outputs[name] for name in plan.outputs}
+        return out
+
+
+def output(img: Image.Image, name: str) -> Image.Image:
+    """The named output of a processed frame, or the frame itself without it."""
+    return img.info.get("outputs", {}).get(name, img)
+
+
+def decode_frame(
+    processor: FrameProcessor,
+    data: bytes,
+    metrics: Optional[PipelineMetrics] = None,
+    trace: Optional[FrameTrace] = None,
+) -> Image.Image:
+    """Decode a raw JPEG frame and run it through ``processor``."""
+    # Decoding and processing must agree on the output sizes.
+    plan = processor.plan()
+    img = processor.decode(data, plan)
+    if metrics is not None:
+        # Decoding is lazy; force it so it is timed apart from processing.
+        img.load()
+        metrics.mark(trace, "decoded")
+    img = processor.process(img, plan)
+    if metrics is not None:
+        metrics.mark(trace, "processed")
+    return img
+
+
+_worker_processor: FrameProcessor | None = None
+
+
+def _decode_in_process(settings: dict, data: bytes) -> Image.Image:
+    """Process-pool entry point; keeps one compiled processor per worker."""
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = FrameProcessor()
+    for name, value in settings.items():
+        setattr(_worker_processor, name, value)
+    return decode_frame(_worker_processor, data)
+
+
+def _shift_outputs(outputs: dict, offset: int, height: int) -> dict:
+    """Apply an alignment offset found on the main output to the named outputs."""
+    shifted = {}
+    for name, img in outputs.items():
+        rows = round(offset * img.height / height)
+        shifted[name] = img.crop((0, rows, img.width, img.height + rows)) if rows else img
+    return shifted
+
+
+class _ReorderBuffer:
+    """Release decoded frames in submission order."""
+
+    def __init__(self, deliver: Callable[[Image.Image], None]):
+        self._deliver = deliver
+        self._lock = threading.Lock()
+        self._pending: dict[int, Optional[Image.Image]] = {}
+        self._next = 0
+        self._closed = False
+
+    def close(self) -> None:
+        """Discard every later result; returns once no frame is being delivered."""
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+
+    def put(self, seq: int, img: Optional[Image.Image]) -> None:
+        """Store the result for ``seq``; ``None`` marks a dropped frame."""
+        with self._lock:
+            if self._closed:
+                return
+            self._pending[seq] = img
+            while self._next in self._pending:
+                ready = self._pending.pop(self._next)
+                self._next += 1
+                if ready is not None:
+                    self._deliver(ready)
+
+
 class CameraStreamer:
     def __init__(self, config: StreamConfig, processor: FrameProcessor):
         self.config = config
         self.processor = processor
         self.running = False
         self.sock: Optional[socket.socket] = None
-        self.keepalive_sock: Optional[socket.socket] = None
         self.keepalive_thread: Optional[threading.Thread] = None
         self.receiver_thread: Optional[threading.Thread] = None
         self.dispatch_thread: Optional[threading.Thread] = None
-        self.jpeg_buffer = bytearray()
-        self.last_frame_time = 0.0
-        self.current_packet_count = 0
+        # The config as last applied; the caller may change ``config`` in place.
+        self._applied = replace(config)
+        # Changes that wait for the receive thread, see reconfigure().
+        self._pending: set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._build_assembler()
+        # Rate limiting before decode and jitter smoothing before dispatch.
+        self.pacer = FramePacer(config.target_fps, config.jitter_delay / 1000.0)
         self.last_packet_count = 0
+        # Packet/byte counters, per-stage frame latencies and drop reasons.
+        self.metrics = PipelineMetrics()
+        self.metrics.memory_probe = self.memory_stats
         self.frame_callback: Optional[Callable[[Image.Image], None]] = None
-        self._recv_buffer = bytearray(self.config.frame_buffer_size)
-        self.frame_queue: queue.Queue[Image.Image] = queue.Queue(maxsize=2)
+        # Each receives every complete raw JPEG frame and its monotonic arrival
+        # time on the receive thread; the buffer is only valid during the call.
+        self.jpeg_callbacks: list[Callable[[memoryview, float], None]] = []
+        # The raw frames of the last few seconds, kept compressed for
+        # recordings, clips and snapshots of frames already gone by.
+        self.history: Optional[FrameHistory] = None
+        self._configure_history(config)
+        # Held while a frame goes to the history and the JPEG callbacks.
+        self._jpeg_lock = threading.Lock()
+        # Whether frames are decoded at all; raw consumers such as the HTTP
+        # relay or passthrough recording only need the JPEG callbacks.
+        self.decode = True
+        self.receiver: Optional[DatagramReceiver] = None
+        # Aligns each frame to the previous one in delivery order, off the
+        # GUI thread; the offset is attached as ``img.info["offset"]``.
+        self.aligner: Optional[FrameAligner] = None
+        # Receives a copy of every delivered frame for other consumers.
+        self.frame_bus: Optional[FrameBus] = None
+        # Scores each frame for motion after alignment and attaches the result
+        # as ``img.info["motion"]``, e.g. for a MotionRecorder.
+        self.motion: Optional[MotionDetector] = None
+        # Replaces the UDP socket, e.g. with an in-memory one for replay;
+        # returns the socket and the source IP to filter on like _open_socket.
+        self.socket_factory: Optional[Callable[[], tuple[socket.socket, Optional[str]]]] = None
+        self.frame_queue: queue.Queue[Image.Image] = self._frame_queue(config)
+        # Wakes the receive thread out of its wait for packets, see reconfigure().
+        self._wakeup: Optional[tuple[socket.socket, socket.socket]] = None
+        self._pool: Optional[Executor] = None
+        self._reorder: Optional[_ReorderBuffer] = None
+        self._in_flight: Optional[threading.BoundedSemaphore] = None
+        self._next_seq = 0
+
+    def _build_assembler(self) -> None:
+        config = self.config
+        # Packets per Frame only applies to marker-based reassembly.
+        layout = HeaderLayout.from_config(config)
+        self._sequenced = layout.sequenced
+        if layout.sequenced:
+            self.assembler = SequencedAssembler(layout, config.header_bytes, config.frame_buffer_size)
+        else:
+            self.assembler = FrameAssembler(config.header_bytes, config.frame_buffer_size)
+        self.current_packet_count = 0
+        self._frame_first_packet: Optional[float] = None
+        self._frame_packets = 0
+        self._assembler_dropped = 0
+        self._assembler_lost = 0
+
+    @staticmethod
+    def _frame_queue(config: StreamConfig) -> queue.Queue:
+        # Leave room for jitter_delay worth of frames held back at up to 30 fps.
+        return queue.Queue(maxsize=2 + math.ceil(config.jitter_delay / 1000.0 * 30))
+
+    def _configure_history(self, config: StreamConfig) -> None:
+        if config.history_seconds <= 0:
+            self.history = None
+        elif self.history is None:
+            self.history = FrameHistory(config.history_seconds, config.history_bytes)
+        else:
+            self.history.seconds = config.history_seconds
+            self.history.max_bytes = config.history_bytes
+
+    def reconfigure(self, config: StreamConfig) -> bool:
+        """Apply a changed config to the pipeline, running or not.
+
+        Processing settings take effect from the next frame as a new
+        :class:`ProcessingPlan`. Reassembly and decoder changes are made by
+        the receive thread between two batches of packets, and only network
+        settings reopen the video socket. Returns ``False`` if the change
+        needs a new streamer, i.e. a different ``backend``.
+        """
+        old, new = asdict(self._applied), asdict(config)
+        changed = {name for name, value in new.items() if old.get(name) != value}
+        if "backend" in changed:
+            return False
+        self.config = config
+        self._applied = replace(config)
+        if changed & PROCESSING_FIELDS:
+            self.processor.apply_config(config)
+        self.pacer.target_fps = config.target_fps
+        self.pacer.jitter_delay = config.jitter_delay / 1000.0
+        if "jitter_delay" in changed:
+            old_queue, self.frame_queue = self.frame_queue, self._frame_queue(config)
+            # Frames already waiting keep their order; any beyond the new bound are dropped.
+            while True:
+                try:
+                    self.frame_queue.put_nowait(old_queue.get_nowait())
+                except queue.Empty:
+                    break
+                except queue.Full:
+                    self.metrics.drop("queue_full")
+        if self.aligner:
+            self.aligner.threshold = config.alignment_threshold
+        if "motion_threshold" in changed:
+            if not config.motion_threshold:
+                self.set_motion(None)
+            elif self.motion is None:
+                self.set_motion(MotionDetector(config.motion_threshold))
+            else:
+                self.motion.threshold = config.motion_threshold
+        elif changed & PROCESSING_FIELDS:
+            # The motion thumbnail follows the display size.
+            self._motion_output()
+        self._configure_history(config)
+        deferred = changed & (NETWORK_FIELDS | RECEIVER_FIELDS | ASSEMBLY_FIELDS | DECODE_FIELDS)
+        if deferred:
+            with self._pending_lock:
+                self._pending |= deferred
+            if self.running:
+                self._schedule_pending()
+            else:
+                self._apply_pending()
+        if changed:
+            logging.debug("Reconfigured %s", ", ".join(sorted(changed)))
+        return True
+
+    def set_motion(self, detector: Optional[MotionDetector]) -> None:
+        """Score frames with ``detector`` from now on, or no longer with ``None``."""
+        self.motion = detector
+        self._motion_output()
+
+    def _motion_output(self) -> None:
+        if self.motion and self.processor.target_size:
+            # Scored on a thumbnail made alongside the main output.
+            self.processor.add_output("motion", self.motion.output_size(self.processor.target_size))
+        else:
+            self.processor.remove_output("motion")
+
+    def _schedule_pending(self) -> None:
+        # Wake the receive thread rather than wait for its receive timeout.
+        wakeup = self._wakeup
+        if wakeup is not None:
+            try:
+                wakeup[1].send(b"\0")
+            except OSError:
+                # Full of earlier wakeups, which is just as good.
+                pass
+
+    def _apply_pending(self) -> None:
+        with self._pending_lock:
+            changed, self._pending = self._pending, set()
+        if changed & ASSEMBLY_FIELDS:
+            self._build_assembler()
+        if not self.running:
+            return
+        if changed & DECODE_FIELDS:
+            self._stop_decoders()
+            self._start_decoders()
+        if changed & NETWORK_FIELDS:
+            self._rebind()
+        elif changed & RECEIVER_FIELDS and self.receiver is not None:
+            self.receiver = self._receiver(self.sock, self.receiver.source)
+
+    def _rebind(self) -> None:
+        """Reopen the video socket with the current network settings."""
+        old, self.sock = self.sock, None
+        if old:
+            # Closed first, as the new socket may want the same port.
+            old.close()
+        self.sock, source = self._open_socket()
+        self.receiver = self._receiver(self.sock, source)
+        logging.info("Video socket reopened on port %d", self.sock.getsockname()[1])
+
+    def _receiver(self, sock: socket.socket, source: Optional[str]) -> DatagramReceiver:
+        """A receiver for ``sock`` with the current receive settings."""
+        # Keep what the old buffers grew to, so no datagram is cut off again.
+        size = max(self.config.datagram_size, self.receiver.max_size if self.receiver else 0)
+        return DatagramReceiver(
+            sock,
+            self.config.recv_mode,
+            self.config.recv_batch,
+            size,
+            source=source,
+            wakeup=self._wakeup[0] if self._wakeup else None,
+        )
+
+    def add_jpeg_callback(
+        self,
+        callback: Callable[[memoryview, float], None],
+        replay: Optional[Callable[[list[tuple[bytes, float]]], None]] = None,
+    ) -> None:
+        """Add a raw frame consumer, e.g. :meth:`Recorder.write_jpeg`.
+
+        ``replay`` first gets the frames in the history, such as
+        :meth:`Recorder.write_history`; no frame is missed or repeated
+        between those and the ones passed to ``callback``.
+        """
+        with self._jpeg_lock:
+            if replay is not None and self.history is not None:
+                replay(self.history.frames())
+            self.jpeg_callbacks.append(callback)
+
+    def remove_jpeg_callback(self, callback: Callable[[memoryview, float], None]) -> None:
+        with self._jpeg_lock:
+            if callback in self.jpeg_callbacks:
+                self.jpeg_callbacks.remove(callback)
+
+    def recent_frame(self, seconds_ago: float = 0.0) -> Optional[Image.Image]:
+        """Decode and process the frame from about ``seconds_ago`` seconds back.
+
+        Only that one frame from the history is decoded. Returns ``None``
+        when the history is off or empty.
+        """
+        if self.history is None:
+            return None
+        frame = self.history.nearest(time.monotonic() - seconds_ago)
+        if frame is None:
+            return None
+        data, timestamp = frame
+        img = decode_frame(self.processor, data)
+        img.info["timestamp"] = timestamp
+        return img
+
+    def memory_stats(self) -> dict:
+        """Bytes held by the receive and reassembly buffers."""
+        pool = self.assembler.pool
+        stats = {
+            "frame_buffers": pool.allocated,
+            "frame_buffers_peak": pool.peak,
+            "largest_frame": pool.high_water,
+            "oversized_frames": self.assembler.oversized,
+        }
+        receiver = self.receiver
+        if receiver is not None:
+            stats["datagram_buffers"] = receiver.buffer_bytes
+            stats["truncated_datagrams"] = receiver.truncated
+        history = self.history
+        if history is not None:
+            stats["history_frames"] = len(history)
+            stats["history_bytes"] = history.nbytes
+            stats["history_seconds"] = history.span
+        return stats
 
     def packets_in_frame(self) -> int:
         """Return number of packets used to assemble the last frame."""
@@ -79,17 +752,16 @@ class CameraStreamer:
             return
         self.frame_callback = callback
         logging.debug("Starting streamer")
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.config.frame_buffer_size)
-        self.keepalive_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.keepalive_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.config.frame_buffer_size)
-        try:
-            self.sock.bind(("", self.config.client_video_port))
-        except Exception:
-            self.sock.bind(("", 0))
+        self.sock, source = self._open_socket()
+        if self._wakeup is None:
+            self._wakeup = socket.socketpair()
+            for end in self._wakeup:
+                end.setblocking(False)
+        self.receiver = self._receiver(self.sock, source)
         self.running = True
         while not self.frame_queue.empty():
             self.frame_queue.get_nowait()
+        self._start_decoders()
         self.keepalive_thread = threading.Thread(target=self._send_keepalive, daemon=True)
         self.receiver_thread = threading.Thread(target=self._recv_frames, daemon=True)
         self.dispatch_thread = threading.Thread(target=self._dispatch_frames, daemon=True)
@@ -100,6 +772,28 @@ class CameraStreamer:
         self.current_packet_count = 0
         self.last_packet_count = 0
 
+    def _open_socket(self) -> tuple[socket.socket, Optional[str]]:
+        """Create the video socket and return it with the source IP to filter on.
+
+        The source is ``None`` when the socket is connected to the camera and
+        the kernel already drops datagrams from anyone else.
+        """
+        if self.socket_factory is not None:
+            return self.socket_factory()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.config.recv_buffer_size)
+        try:
+            sock.bind(("", self.config.client_video_port))
+        except Exception:
+            sock.bind(("", 0))
+        if self.config.connect_camera:
+            try:
+                sock.connect((self.config.cam_ip, self.config.cam_video_port))
+                return sock, None
+            except OSError:
+                logging.exception("Could not connect to camera, filtering in userspace")
+        return sock, self.config.cam_ip
+
     def stop(self):
         logging.debug("Stopping streamer")
         self.running = False
@@ -108,87 +802,276 @@ class CameraStreamer:
                 self.sock.close()
             finally:
                 self.sock = None
-        if self.keepalive_sock:
-            try:
-                self.keepalive_sock.close()
-            finally:
-                self.keepalive_sock = None
+        wakeup, self._wakeup = self._wakeup, None
+        if wakeup is not None:
+            for end in wakeup:
+                end.close()
         if self.dispatch_thread and self.dispatch_thread.is_alive():
             self.dispatch_thread.join(timeout=0.1)
-        self.jpeg_buffer.clear()
-        self.last_frame_time = 0.0
+        self._stop_decoders()
+        self.assembler.reset()
+        self.pacer.reset()
         self.current_packet_count = 0
         self.last_packet_count = 0
 
+    def _start_decoders(self) -> None:
+        """Create the decode pool configured by ``decode_workers``."""
+        # Not with the process backend: forking while another thread is
+        # importing cv2 can leave the workers deadlocked on its import lock.
+        if "cv2" not in sys.modules and self.config.decode_backend != "process":
+            threading.Thread(target=preload, name="preload", daemon=True).start()
+        workers = self.config.decode_workers
+        self._next_seq = 0
+        self._reorder = _ReorderBuffer(self._finish)
+        if self.aligner:
+            self.aligner.reset()
+        if self.motion:
+            self.motion.reset()
+        self._motion_output()
+        if workers <= 0:
+            self._pool = None
+            return
+        if self.config.decode_backend == "process":
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Forking copies whatever locks the receive, keepalive and
+            # dispatch threads hold at that moment, so workers are started
+            # from a clean process instead.
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            # Workers start empty; let them import the libraries before frames arrive.
+            for _ in range(workers):
+                self._pool.submit(preload)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+        # Bound the backlog so a slow decoder drops frames instead of queueing them.
+        self._in_flight = threading.BoundedSemaphore(workers * 2)
+
+    def _stop_decoders(self) -> None:
+        reorder, self._reorder = self._reorder, None
+        if reorder is not None:
+            # Frames still decoding are dropped instead of overtaking the next pool's.
+            reorder.close()
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._in_flight = None
+
     def _send_keepalive(self):
-        payload_8070 = b"0f"
-        payload_8080 = b"Bv"
         while self.running:
+            sock = self.sock
             try:
-                if self.sock:
-                    self.sock.sendto(payload_8070, (self.config.cam_ip, self.config.cam_audio_port))
-                    self.sock.sendto(payload_8080, (self.config.cam_ip, self.config.cam_video_port))
+                if sock:
+                    sock.sendto(KEEPALIVE_AUDIO, (self.config.cam_ip, self.config.cam_audio_port))
+                    sock.sendto(KEEPALIVE_VIDEO, (self.config.cam_ip, self.config.cam_video_port))
+            except ConnectionRefusedError:
+                # Connected UDP sockets report ICMP errors while the camera is down.
+                pass
             except Exception:
-                logging.exception("Keepalive failed")
+                # A socket closed by _rebind() has already been replaced.
+                if sock is self.sock:
+                    logging.exception("Keepalive failed")
             time.sleep(self.config.keepalive_interval)
 
     def _recv_frames(self):
-        buffer = memoryview(self._recv_buffer)
         while self.running:
+            if self._pending:
+                try:
+                    self._apply_pending()
+                except Exception:
+                    logging.exception("Applying config changes failed")
             try:
-                nbytes, addr = self.sock.recvfrom_into(buffer)
+                packets = self.receiver.recv()
+            except ConnectionRefusedError:
+                # ICMP port unreachable from the camera, reported on connected sockets.
+                continue
             except Exception:
-                logging.exception("recvfrom failed")
+                if self.running:
+                    logging.exception("recvfrom failed")
                 break
-            if addr[0] != self.config.cam_ip:
-                continue
-            self.jpeg_buffer.extend(buffer[:nbytes])
-            self.current_packet_count += 1
-            if self.current_packet_count < self.config.packets_per_frame:
-                continue
-            self.last_packet_count = self.current_packet_count
-            self.current_packet_count = 0
-            self._extract_frames()
+            for packet in packets:
+                self._handle_packet(packet)
+
+    def _handle_packet(self, packet) -> None:
+        self.metrics.packet(len(packet))
+        if self._frame_first_packet is None:
+            self._frame_first_packet = time.monotonic()
+        self._frame_packets += 1
+        assembler = self.assembler
+        assembler.feed(packet)
+        if assembler.dropped != self._assembler_dropped:
+            self.metrics.drop("incomplete", assembler.dropped - self._assembler_dropped)
+            self._assembler_dropped = assembler.dropped
+        if assembler.lost != self._assembler_lost:
+            self.metrics.lost_packets += assembler.lost - self._assembler_lost
+            self._assembler_lost = assembler.lost
+        self.current_packet_count += 1
+        if self.current_packet_count < self.config.packets_per_frame and not self._sequenced:
+            return
+        self.last_packet_count = self.current_packet_count
+        self.current_packet_count = 0
+        self._extract_frames()
 
     def _extract_frames(self) -> None:
-        """Parse buffered JPEG data into frames and dispatch them."""
-        while True:
-            soi = self.jpeg_buffer.find(b"\xff\xd8")
-            if soi < 0:
-                break
-            eoi = self.jpeg_buffer.find(b"\xff\xd9", soi + 2)
-            if eoi < 0:
-                break
-            jpeg_data = self.jpeg_buffer[soi:eoi + 2]
-            del self.jpeg_buffer[:eoi + 2]
+        """Decode the frames completed by the assembler and dispatch them."""
+        while self.assembler.ready:
+            jpeg_data = self.assembler.ready.popleft()
             now = time.monotonic()
-            if now - self.last_frame_time < 0.05:
+            first_packet = self._frame_first_packet or now
+            trace = self.metrics.frame(len(jpeg_data), self._frame_packets, first_packet, now)
+            self._frame_first_packet = None
+            self._frame_packets = 0
+            with self._jpeg_lock:
+                if self.history is not None:
+                    self.history.add(jpeg_data, now)
+                for callback in self.jpeg_callbacks:
+                    try:
+                        callback(jpeg_data, now)
+                    except Exception:
+                        logging.exception("JPEG callback failed")
+            if not self.decode:
                 continue
-            self.last_frame_time = now
+            if not self.pacer.admit(now):
+                self.metrics.drop("rate_limited")
+                continue
+            self._submit(bytes(jpeg_data), now, trace)
+
+    def _submit(self, jpeg_data: bytes, timestamp: float, trace: Optional[FrameTrace] = None) -> None:
+        """Hand a raw frame to the decode pool, or decode it inline without one.
+
+        The arrival ``timestamp`` and the metrics ``trace`` are attached to
+        the decoded image as ``img.info["timestamp"]`` and ``img.info["trace"]``.
+        """
+        pool, reorder, in_flight = self._pool, self._reorder, self._in_flight
+        if reorder is None:
+            return
+        if pool is None:
             try:
-                img = Image.open(io.BytesIO(jpeg_data))
-                img.load()
-                img = self.processor.process(img)
+                img = decode_frame(self.processor, jpeg_data, self.metrics, trace)
             except (UnidentifiedImageError, OSError):
                 logging.debug("Dropped corrupted frame")
-                continue
+                self.metrics.drop("corrupt")
+                return
+            img.info["timestamp"] = timestamp
+            img.info["trace"] = trace
+            self._finish(img)
+            return
+        if not in_flight.acquire(blocking=False):
+            logging.debug("Decoders busy, dropping frame")
+            self.metrics.drop("decoder_busy")
+            return
+        seq = self._next_seq
+        self._next_seq += 1
+        try:
+            if self.config.decode_backend == "process":
+                future = pool.submit(_decode_in_process, self.processor.settings(), jpeg_data)
+            else:
+                future = pool.submit(decode_frame, self.processor, jpeg_data, self.metrics, trace)
+        except RuntimeError:
+            # The pool was shut down by stop() while this frame was pending.
+            in_flight.release()
+            return
+        future.add_done_callback(partial(self._on_decoded, reorder, in_flight, seq, timestamp, trace))
+
+    def _on_decoded(
+        self,
+        reorder: _ReorderBuffer,
+        in_flight: threading.BoundedSemaphore,
+        seq: int,
+        timestamp: float,
+        trace: Optional[FrameTrace],
+        future: Future,
+    ) -> None:
+        in_flight.release()
+        img = None
+        if not future.cancelled():
             try:
-                self.frame_queue.put_nowait(img)
-            except queue.Full:
-                logging.debug("Frame queue full, dropping frame")
-            if self.config.jitter_delay:
-                time.sleep(self.config.jitter_delay / 1000.0)
+                img = future.result()
+            except (UnidentifiedImageError, OSError):
+                logging.debug("Dropped corrupted frame")
+                self.metrics.drop("corrupt")
+            except Exception:
+                logging.exception("Frame decode failed")
+        if img is not None:
+            if trace is not None and "processed" not in trace.stamps:
+                # Process workers cannot report back; time the whole decode here.
+                self.metrics.mark(trace, "processed")
+            img.info["timestamp"] = timestamp
+            img.info["trace"] = trace
+        reorder.put(seq, img)
+
+    def _finish(self, img: Image.Image) -> None:
+        """Run the in-order stages on a decoded frame, then deliver it."""
+        aligner = self.aligner
+        if aligner:
+            try:
+                img, offset = aligner.align(img)
+                img.info["offset"] = offset
+                if offset and "outputs" in img.info:
+                    img.info["outputs"] = _shift_outputs(img.info["outputs"], offset, img.height)
+            except Exception:
+                logging.exception("Frame alignment failed")
+        motion = self.motion
+        if motion:
+            try:
+                img.info["motion"] = motion.detect(img)
+            except Exception:
+                logging.exception("Motion detection failed")
+        outputs = img.info.get("outputs")
+        if outputs:
+            # Consumers of a named output, e.g. the recorder, need the
+            # timestamp, trace and motion flag of the frame as well.
+            shared = {k: v for k, v in img.info.items() if k != "outputs"}
+            for out in outputs.values():
+                out.info.update(shared)
+        bus = self.frame_bus
+        if bus is not None:
+            try:
+                if not bus.publish(img, img.info.get("timestamp", time.monotonic())):
+                    logging.debug("Frame too large for the frame bus")
+            except Exception:
+                logging.exception("Publishing to the frame bus failed")
+        self._deliver(img)
+
+    def _deliver(self, img: Image.Image) -> None:
+        self.metrics.mark(img.info.get("trace"), "queued")
+        try:
+            self.frame_queue.put_nowait(img)
+        except queue.Full:
+            logging.debug("Frame queue full, dropping frame")
+            self.metrics.drop("queue_full")
 
     def _dispatch_frames(self) -> None:
-        """Send complete frames to the callback from a dedicated thread."""
+        """Send complete frames to the callback from a dedicated thread.
+
+        With a jitter delay, frames are played out here at the pacer's
+        release times rather than as soon as they are decoded.
+        """
         while self.running:
             try:
                 img = self.frame_queue.get(timeout=0.1)
             except queue.Empty:
                 continue
+            if self.pacer.jitter_delay:
+                now = time.monotonic()
+                release = self.pacer.release_time(img.info.get("timestamp", now), now)
+                while self.running and release > now:
+                    time.sleep(min(release - now, 0.1))
+                    now = time.monotonic()
             if self.frame_callback:
                 try:
                     self.frame_callback(img)
                 except Exception:
                     logging.exception("Frame callback failed")
 
+
+def create_streamer(config: StreamConfig, processor: FrameProcessor) -> CameraStreamer:
+    """Return the streamer implementation selected by ``config.backend``."""
+    if config.backend == "asyncio":
+        # Only load asyncio for the backend that needs it.
+        from async_streamer import AsyncCameraStreamer
+
+        return AsyncCameraStreamer(config, processor)
+    return CameraStreamer(config, processor)
@@ -0,0 +1,76 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+from PIL import Image
+
+from alignment import FrameAligner
+
+HEIGHT, WIDTH = 240, 320
+
+
+def texture(seed, blur=8):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 255, (HEIGHT, WIDTH)).astype(np.uint8)
+    return cv2.normalize(cv2.GaussianBlur(noise, (0, 0), blur), None, 60, 190, cv2.NORM_MINMAX)
+
+
+def image(arr):
+    return Image.fromarray(np.dstack([arr] * 3))
+
+
+BASE = texture(0)
+# The bottom of the previous frame shows up five rows lower than expected.
+ROLLED = np.roll(BASE, 85, axis=0)
+# The same with sensor noise, so the match is not exact.
+NOISY = np.clip(ROLLED + np.random.default_rng(2).integers(-4, 5, ROLLED.shape), 0, 255).astype(np.uint8)
+CUT = texture(1, blur=3)
+
+
+def second_offset(aligner, first, second):
+    aligner.align(image(first))
+    return aligner.align(image(second))[1]
+
+
+def test_first_frame_is_left_alone():
+    aligner = FrameAligner()
+    img = image(BASE)
+    assert aligner.align(img) == (img, 0)
+
+
+def test_rolled_frame_is_shifted_back():
+    aligner = FrameAligner()
+    assert second_offset(aligner, BASE, ROLLED) == -5
+    assert aligner.residual <= aligner.threshold
+
+
+def test_aligned_frame_keeps_its_info():
+    aligner = FrameAligner()
+    aligner.align(image(BASE))
+    img = image(ROLLED)
+    img.info["timestamp"] = 1.0
+    aligned, offset = aligner.align(img)
+    assert offset and aligned.size == img.size
+    assert aligned.info["timestamp"] == 1.0
+
+
+def test_scene_cut_is_not_aligned():
+    aligner = FrameAligner()
+    assert second_offset(aligner, BASE, CUT) == 0
+    assert aligner.residual > aligner.threshold
+
+
+def test_threshold_is_inclusive():
+    probe = FrameAligner(threshold=0)
+    assert second_offset(probe, BASE, NOISY) == -5
+    residual = probe.residual
+    assert 0 < residual < 6
+    assert second_offset(FrameAligner(threshold=residual), BASE, NOISY) == -5
+    assert second_offset(FrameAligner(threshold=residual * 0.99), BASE, NOISY) == 0
+
+
+def test_size_change_starts_afresh():
+    aligner = FrameAligner()
+    aligner.align(image(BASE))
+    smaller = image(cv2.resize(ROLLED, (WIDTH // 2, HEIGHT // 2)))
+    assert aligner.align(smaller)[1] == 0
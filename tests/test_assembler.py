@@ -0,0 +1,60 @@
+from assembler import FrameAssembler
+
+FRAME = b"\xff\xd8" + bytes(range(256)) * 4 + b"\xff\xd9"
+
+
+def frames(assembler):
+    return [bytes(view) for view in assembler.ready]
+
+
+def test_whole_frame_in_one_packet():
+    assembler = FrameAssembler()
+    assembler.feed(FRAME)
+    assert frames(assembler) == [FRAME]
+
+
+def test_soi_split_across_packets():
+    assembler = FrameAssembler()
+    for packet in (b"junk\xff", FRAME[1:50], FRAME[50:]):
+        assembler.feed(packet)
+    assert frames(assembler) == [FRAME]
+
+
+def test_eoi_split_across_packets():
+    assembler = FrameAssembler()
+    for packet in (FRAME[:-1], FRAME[-1:]):
+        assembler.feed(packet)
+    assert frames(assembler) == [FRAME]
+
+
+def test_every_split_point():
+    for cut in range(1, len(FRAME)):
+        assembler = FrameAssembler()
+        assembler.feed(b"\x00\xff" + FRAME[:cut])
+        assembler.feed(FRAME[cut:] + FRAME[:3])
+        assert frames(assembler) == [FRAME], cut
+
+
+def test_header_is_stripped():
+    assembler = FrameAssembler(header_bytes=4)
+    for offset in range(0, len(FRAME), 100):
+        assembler.feed(b"HDR!" + FRAME[offset:offset + 100])
+    assert frames(assembler) == [FRAME]
+
+
+def test_packet_opening_with_soi_abandons_partial_frame():
+    assembler = FrameAssembler()
+    assembler.feed(FRAME[:100])
+    assembler.feed(FRAME)
+    assert frames(assembler) == [FRAME]
+    assert assembler.dropped == 1
+
+
+def test_oversized_frame_is_dropped_and_assembly_resyncs():
+    assembler = FrameAssembler(max_frame_size=512, slot_size=256)
+    assembler.feed(b"\xff\xd8" + b"\x00" * 300)
+    assembler.feed(b"\x00" * 300)
+    small = b"\xff\xd8abc\xff\xd9"
+    assembler.feed(small)
+    assert frames(assembler) == [small]
+    assert assembler.oversized == 1
@@ -0,0 +1,83 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from framebus import FrameBus
+
+
+@pytest.fixture
+def bus():
+    bus = FrameBus.create(slots=4, slot_bytes=8 * 8 * 3)
+    yield bus
+    bus.close()
+
+
+def publish(bus, value, timestamp=0.0):
+    slot = bus.acquire(8, 8)
+    slot[:] = value
+    bus.commit(timestamp)
+
+
+def test_slot_is_odd_while_written(bus):
+    sub = bus.subscribe("all")
+    slot = bus.acquire(8, 8)
+    assert int(bus._meta[0]["seq"]) % 2 == 1
+    slot[:] = 7
+    # Not visible before commit.
+    assert sub.poll() is None
+    bus.commit(1.5)
+    assert int(bus._meta[0]["seq"]) == 2
+    frame = sub.poll()
+    assert frame.seq == 0 and frame.timestamp == 1.5
+    assert (frame.array == 7).all()
+    assert not frame.array.flags.writeable
+
+
+def test_frame_is_invalid_once_the_slot_is_reused(bus):
+    sub = bus.subscribe("all")
+    publish(bus, 1)
+    frame = sub.poll()
+    for value in range(2, 5):
+        publish(bus, value)
+    assert frame.valid()
+    publish(bus, 5)
+    assert not frame.valid()
+
+
+def test_all_policy_skips_frames_the_writer_lapped(bus):
+    sub = bus.subscribe("all")
+    for value in range(10):
+        publish(bus, value)
+    seqs = []
+    while (frame := sub.poll()) is not None:
+        seqs.append(frame.seq)
+    # The oldest slot may be rewritten next, so it is skipped too.
+    assert seqs == [7, 8, 9]
+    assert sub.dropped == 7
+
+
+def test_latest_policy_jumps_to_newest(bus):
+    sub = bus.subscribe("latest")
+    for value in range(3):
+        publish(bus, value)
+    frame = sub.poll()
+    assert frame.seq == 2 and (frame.array == 2).all()
+    assert sub.dropped == 2
+    assert sub.poll() is None
+
+
+def test_slot_rewritten_during_read_is_skipped(bus):
+    sub = bus.subscribe("all")
+    publish(bus, 1)
+    publish(bus, 2)
+    # The writer lapped frame 0's slot and is in the middle of writing it.
+    bus._meta[0]["seq"] = 2 * 4 + 1
+    frame = sub.poll()
+    assert frame.seq == 1
+    assert sub.dropped == 1
+
+
+def test_oversized_frame_is_refused(bus):
+    assert bus.acquire(16, 16) is None
+    assert bus.oversized == 1
+    assert bus.write_seq == 0
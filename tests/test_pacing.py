@@ -0,0 +1,65 @@
+import pytest
+
+from pacing import FramePacer
+
+
+def admitted(pacer, fps, seconds):
+    frames = int(fps * seconds)
+    return sum(pacer.admit(i / fps) for i in range(frames))
+
+
+def test_no_target_admits_everything():
+    assert admitted(FramePacer(), 30, 2) == 60
+
+
+def test_target_admits_in_proportion():
+    # Two out of three frames from a 30 fps camera at a 20 fps target.
+    assert admitted(FramePacer(target_fps=20), 30, 3) == pytest.approx(60, abs=1)
+
+
+def test_burst_after_gap_is_limited():
+    pacer = FramePacer(target_fps=10)
+    admitted(pacer, 10, 1)
+    burst = [pacer.admit(5.0 + i * 0.001) for i in range(10)]
+    # One frame for the arrival itself plus at most one of banked credit.
+    assert sum(burst) <= 2
+
+
+def test_without_jitter_delay_frames_are_released_at_once():
+    pacer = FramePacer()
+    assert pacer.release_time(1.0, 1.5) == 1.5
+
+
+def test_release_is_spaced_by_arrival_interval():
+    pacer = FramePacer(jitter_delay=0.2)
+    for i in range(5):
+        pacer.admit(i * 0.05)
+    first = pacer.release_time(0.2, 0.21)
+    # The next frame came right behind the first but is held back.
+    second = pacer.release_time(0.21, 0.215)
+    assert second == pytest.approx(first + 0.05)
+
+
+def test_release_never_later_than_jitter_delay():
+    pacer = FramePacer(jitter_delay=0.1)
+    for i in range(5):
+        pacer.admit(i * 1.0)
+    pacer.release_time(4.0, 4.0)
+    # A spacing of one second would hold this frame past its deadline.
+    assert pacer.release_time(4.01, 4.02) == pytest.approx(4.11)
+
+
+def test_release_never_before_now():
+    pacer = FramePacer(jitter_delay=0.1)
+    for i in range(5):
+        pacer.admit(i * 0.05)
+    pacer.release_time(0.2, 0.2)
+    assert pacer.release_time(0.3, 0.5) == 0.5
+
+
+def test_target_fps_sets_minimum_spacing():
+    pacer = FramePacer(target_fps=10, jitter_delay=0.5)
+    for i in range(5):
+        pacer.admit(i * 0.05)
+    pacer.release_time(0.2, 0.2)
+    assert pacer.release_time(0.21, 0.21) == pytest.approx(0.3)
@@ -0,0 +1,92 @@
+from protocol import HeaderLayout, SequencedAssembler
+
+LAYOUT = HeaderLayout(seq_offset=0, seq_bytes=2, frame_id_offset=2, frame_id_bytes=2)
+HEADER = 4
+
+
+def make_frame(i):
+    return b"\xff\xd8" + bytes([i % 256]) * 300 + b"\xff\xd9"
+
+
+def packets(count, first_seq=0, size=100):
+    """Split ``count`` frames into packets numbered from ``first_seq``."""
+    out = []
+    seq = first_seq
+    for i in range(count):
+        frame = make_frame(i)
+        for pos in range(0, len(frame), size):
+            out.append(LAYOUT.pack(HEADER, seq, i) + frame[pos:pos + size])
+            seq += 1
+    return out
+
+
+def assemble(sequence, **kwargs):
+    assembler = SequencedAssembler(LAYOUT, HEADER, **kwargs)
+    frames = []
+    for packet in sequence:
+        assembler.feed(packet)
+        frames.extend(bytes(view) for view in assembler.ready)
+        assembler.ready.clear()
+    return assembler, frames
+
+
+def test_in_order():
+    assembler, frames = assemble(packets(5))
+    assert frames == [make_frame(i) for i in range(5)]
+    assert (assembler.lost, assembler.dropped, assembler.late) == (0, 0, 0)
+
+
+def test_sequence_wraparound():
+    assembler, frames = assemble(packets(10, first_seq=65536 - 17))
+    assert frames == [make_frame(i) for i in range(10)]
+    assert assembler.lost == 0
+
+
+def test_reordered_packets():
+    sequence = packets(6)
+    for i in range(0, len(sequence) - 1, 3):
+        sequence[i], sequence[i + 1] = sequence[i + 1], sequence[i]
+    assembler, frames = assemble(sequence)
+    assert frames == [make_frame(i) for i in range(6)]
+    assert assembler.late == 0
+
+
+def test_reordered_first_frame_is_kept():
+    sequence = packets(3)
+    sequence[0], sequence[1] = sequence[1], sequence[0]
+    assembler, frames = assemble(sequence)
+    assert frames == [make_frame(i) for i in range(3)]
+    assert assembler.late == 0
+
+
+def test_reordered_across_wraparound():
+    sequence = packets(4, first_seq=65535)
+    sequence[0], sequence[1] = sequence[1], sequence[0]
+    sequence[5], sequence[6] = sequence[6], sequence[5]
+    _, frames = assemble(sequence)
+    assert frames == [make_frame(i) for i in range(4)]
+
+
+def test_lost_packet_drops_its_frame_only():
+    sequence = packets(4)
+    del sequence[5]
+    assembler, frames = assemble(sequence)
+    assert frames == [make_frame(i) for i in (0, 2, 3)]
+    assert assembler.lost == 1
+    assert assembler.dropped == 1
+
+
+def test_packet_after_its_frame_was_given_up_is_late():
+    sequence = packets(4)
+    straggler = sequence.pop(5)
+    sequence.append(straggler)
+    assembler, _ = assemble(sequence)
+    assert assembler.late == 1
+
+
+def test_duplicates_are_ignored():
+    sequence = packets(2)
+    sequence.insert(2, sequence[1])
+    assembler, frames = assemble(sequence)
+    assert frames == [make_frame(0), make_frame(1)]
+    assert assembler.duplicates == 1
@@ -0,0 +1,72 @@
+import socket
+import time
+
+import pytest
+
+from receiver import DatagramReceiver, _recvmmsg
+
+MODES = ["single", "drain"] + (["recvmmsg"] if _recvmmsg else [])
+
+
+@pytest.fixture
+def pair():
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.bind(("127.0.0.1", 0))
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    tx.bind(("127.0.0.1", 0))
+    tx.connect(rx.getsockname())
+    yield rx, tx
+    rx.close()
+    tx.close()
+
+
+def receive_all(datagrams, count, timeout=1.0):
+    packets = []
+    deadline = time.monotonic() + timeout
+    while len(packets) < count and time.monotonic() < deadline:
+        packets.extend(bytes(p) for p in datagrams.recv(0.1))
+    return packets
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_datagrams_in_order(pair, mode):
+    rx, tx = pair
+    receiver = DatagramReceiver(rx, mode, batch=4, max_size=2048)
+    sent = [bytes([i]) * 100 for i in range(10)]
+    for data in sent:
+        tx.send(data)
+    assert receive_all(receiver, 10) == sent
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_buffers_grow_past_oversized_datagram(pair, mode):
+    rx, tx = pair
+    receiver = DatagramReceiver(rx, mode, batch=4, max_size=1024)
+    big = b"x" * 3000
+    tx.send(big)
+    assert receive_all(receiver, 1, timeout=0.3) == []
+    assert receiver.truncated == 1
+    assert receiver.max_size >= 3000
+    tx.send(big)
+    assert receive_all(receiver, 1) == [big]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_other_sources_are_dropped(pair, mode):
+    rx, tx = pair
+    receiver = DatagramReceiver(rx, mode, max_size=2048, source="127.0.0.2")
+    tx.send(b"not from the camera")
+    assert receive_all(receiver, 1, timeout=0.3) == []
+
+
+def test_wakeup_ends_the_wait(pair):
+    rx, _ = pair
+    wake, trigger = socket.socketpair()
+    wake.setblocking(False)
+    receiver = DatagramReceiver(rx, "drain", wakeup=wake)
+    trigger.send(b"\0")
+    started = time.monotonic()
+    assert receiver.recv(5.0) == []
+    assert time.monotonic() - started < 1.0
+    wake.close()
+    trigger.close()
@@ -0,0 +1,68 @@
+import json
+import socket
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from relay import MjpegRelay
+
+FRAME = b"\xff\xd8" + b"jpeg" * 100 + b"\xff\xd9"
+
+
+@pytest.fixture
+def relay():
+    relay = MjpegRelay(port=0)
+    relay.start()
+    yield relay
+    relay.stop()
+
+
+def get(relay, path):
+    return urllib.request.urlopen(f"http://127.0.0.1:{relay.port}{path}", timeout=2)
+
+
+def read_until(sock, marker, data=b""):
+    deadline = time.monotonic() + 2.0
+    while marker not in data and time.monotonic() < deadline:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def test_snapshot(relay):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(relay, "/snapshot.jpg")
+    assert error.value.code == 503
+    relay.publish(memoryview(FRAME), 1.0)
+    with get(relay, "/snapshot.jpg") as response:
+        assert response.headers["Content-Type"] == "image/jpeg"
+        assert response.read() == FRAME
+
+
+def test_unknown_path(relay):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(relay, "/nothing")
+    assert error.value.code == 404
+
+
+def test_stream_delivers_parts(relay):
+    with socket.create_connection(("127.0.0.1", relay.port), timeout=2) as sock:
+        sock.sendall(b"GET /stream.mjpg HTTP/1.1\r\nHost: x\r\n\r\n")
+        head = read_until(sock, b"\r\n\r\n")
+        assert b"multipart/x-mixed-replace; boundary=frame" in head
+        data = head.split(b"\r\n\r\n", 1)[1]
+        for i in range(3):
+            relay.publish(FRAME, float(i))
+            data = read_until(sock, FRAME + b"\r\n", data)
+            part, data = data.split(FRAME + b"\r\n", 1)
+            assert part.startswith(b"--frame\r\n")
+            assert f"X-Timestamp: {i:.6f}".encode() in part
+            assert f"Content-Length: {len(FRAME)}".encode() in part
+        with get(relay, "/stats") as response:
+            stats = json.loads(response.read())
+    assert stats["published"] == 3
+    assert [client["frames"] for client in stats["clients"]] == [3]
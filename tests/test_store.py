@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from store import RECORD, RecordingStore, SegmentIndex
+
+
+def write_segment(store, start, times):
+    """A segment starting at ``start`` whose frames are their own time as text."""
+    path, index = store.open_segment(start)
+    with open(path, "wb") as fh:
+        for t in times:
+            data = f"{t:.2f}".encode()
+            index.append(t, fh.tell(), len(data))
+            fh.write(data)
+    index.close()
+    return path
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RecordingStore(str(tmp_path), segment_seconds=10)
+    write_segment(store, 1000.0, [1000.0 + i for i in range(10)])
+    write_segment(store, 1010.0, [1010.5 + i for i in range(10)])
+    return store
+
+
+def test_frame_at_inside_a_segment(store):
+    assert store.frame_at(1003.2) == (b"1003.00", 1003.0)
+
+
+def test_frame_at_end_of_previous_segment(store):
+    assert store.frame_at(1009.7) == (b"1009.00", 1009.0)
+
+
+def test_frame_at_start_of_next_segment(store):
+    # Before the second segment starts, but its first frame is the closest.
+    assert store.frame_at(1009.9) == (b"1010.50", 1010.5)
+
+
+def test_frame_at_before_first_frame_of_segment(store):
+    # Past the start of the second segment, before its first frame.
+    assert store.frame_at(1010.2) == (b"1010.50", 1010.5)
+
+
+def test_frame_at_segment_start_time(store):
+    assert store.frame_at(1000.0) == (b"1000.00", 1000.0)
+
+
+def test_frame_at_after_a_late_first_frame(tmp_path):
+    store = RecordingStore(str(tmp_path), segment_seconds=10)
+    write_segment(store, 1000.0, [1009.0])
+    write_segment(store, 1010.0, [1015.0])
+    assert store.frame_at(1010.1, tolerance=2) == (b"1009.00", 1009.0)
+
+
+def test_frame_at_outside_the_recording(store):
+    assert store.frame_at(990.0) is None
+    assert store.frame_at(1019.9) == (b"1019.50", 1019.5)
+    assert store.frame_at(1030.0) is None
+    assert store.frame_at(1030.0, tolerance=20) == (b"1019.50", 1019.5)
+
+
+def test_frames_across_segments(store):
+    times = [t for _, t in store.frames(1008.0, 1012.0)]
+    assert times == [1008.0, 1009.0, 1010.5, 1011.5]
+
+
+def test_truncated_record_is_ignored(store):
+    path = store.segments()[1][1] + ".idx"
+    with open(path, "ab") as fh:
+        fh.write(RECORD.pack(1020.5, 0, 1)[:7])
+    assert len(SegmentIndex.load(path)) == 10
+    assert store.frame_at(1020.5) == (b"1019.50", 1019.5)
+
+
+def test_prune_by_age_keeps_the_open_segment(store):
+    store.retention_seconds = 5
+    newest = write_segment(store, 1020.0, [1020.0])
+    removed = store.prune(now=1030.0, keep=(newest,))
+    assert [os.path.basename(p) for p in removed] == ["seg_0000001000000.mkv", "seg_0000001010000.mkv"]
+    assert [start for start, _ in store.segments()] == [1020.0]
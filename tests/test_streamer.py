@@ -0,0 +1,70 @@
+import time
+from dataclasses import replace
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from config import StreamConfig
+from replay import MemorySocket, Replayer, packetize, synthetic_frames
+from streamer import CameraStreamer, FrameProcessor
+
+
+def replay(config, processor, frames=40):
+    """Push a synthetic stream through a streamer and return the delivered frames."""
+    mem = MemorySocket()
+    streamer = CameraStreamer(config, processor)
+    streamer.socket_factory = mem.factory
+    delivered = []
+    streamer.start(delivered.append)
+    try:
+        packets = packetize(synthetic_frames(frames, (320, 240)), header_bytes=config.header_bytes)
+        sent = Replayer(packets, speed=1.0).play(mem.inject)
+        deadline = time.monotonic() + 5.0
+        while streamer.metrics.packets < sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Let the decoders finish the tail of the stream.
+        time.sleep(0.5)
+    finally:
+        streamer.stop()
+        mem.close()
+    return delivered
+
+
+@pytest.mark.parametrize("setting", [{"brightness": 1.2}, {"flip_h": True}])
+def test_process_backend_delivers_adjusted_frames(setting):
+    config = StreamConfig(decode_backend="process", decode_workers=2)
+    processor = FrameProcessor()
+    processor.apply_config(config)
+    for name, value in setting.items():
+        setattr(processor, name, value)
+    delivered = replay(config, processor)
+    # The first frames may be dropped while the workers start.
+    assert len(delivered) >= 20
+
+
+def test_receive_settings_keep_the_socket():
+    config = StreamConfig(decode_workers=0)
+    mem = MemorySocket()
+    streamer = CameraStreamer(config, FrameProcessor())
+    streamer.socket_factory = mem.factory
+    streamer.start(lambda img: None)
+    try:
+        receiver = streamer.receiver
+        assert streamer.reconfigure(replace(config, recv_batch=8, datagram_size=2048))
+        deadline = time.monotonic() + 2.0
+        while streamer.receiver is receiver and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert streamer.sock is mem
+        assert streamer.receiver.batch == 8
+        assert streamer.receiver.max_size >= 2048
+        mem.inject(bytes(config.header_bytes) + b"\xff\xd8")
+        while not streamer.metrics.packets and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert streamer.metrics.packets == 1
+    finally:
+        wakeup = streamer._wakeup
+        streamer.stop()
+        mem.close()
+    assert streamer._wakeup is None
+    assert all(end.fileno() == -1 for end in wakeup)